@@ -14,7 +14,7 @@ from app.schemas.common_response import SuccessResponse
 from app.schemas.common_response import PaginationMeta
 from typing import Optional, List
 import math
-import json
+import orjson
 import asyncio
 from app.core.logger import logger
 from app.services.digital_human_service import DigitalHumanService
@@ -148,14 +148,14 @@ async def train_digital_human(
                 request.message,
                 current_user.id
             ):
-                yield f"data: {chunk}\n\n"
+                yield b"data: " + chunk + b"\n\n"
         except Exception as e:
             logger.error(f"训练流生成失败: {str(e)}")
-            error_msg = json.dumps({
+            error_msg = orjson.dumps({
                 "type": "error",
                 "content": "训练过程出现错误，请重试"
-            }, ensure_ascii=False)
-            yield f"data: {error_msg}\n\n"
+            })
+            yield b"data: " + error_msg + b"\n\n"
 
     return StreamingResponse(
         generate(),
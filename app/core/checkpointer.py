@@ -1,9 +1,10 @@
 from typing import Any, Dict, Optional, Iterator, List, Tuple, AsyncIterator
 from datetime import datetime, timedelta
 import json
+import orjson
 import hashlib
 import asyncio
-from collections import OrderedDict
+from collections import OrderedDict, deque
 from sqlalchemy.orm import Session
 from sqlalchemy import desc, and_
 from langchain_core.messages import BaseMessage
@@ -14,15 +15,31 @@ from app.core.logger import logger
 import threading
 from functools import lru_cache
 
+# 集合在 JSON 中的标记键
+_SET_MARKER = "__set__"
+
 
 class MySQLCheckpointer(BaseCheckpointSaver):
 
-    def __init__(self, db_session_factory, cache_size: int = 100, cache_ttl: int = 300):
+    def __init__(
+        self,
+        db_session_factory,
+        cache_size: int = 100,
+        cache_ttl: int = 300,
+        cache_max_bytes: int = 64 * 1024 * 1024
+    ):
         super().__init__()
         self.db_session_factory = db_session_factory
+        self.cache_size = cache_size
         self.cache_ttl = cache_ttl
+        self.cache_max_bytes = cache_max_bytes
         self._cache = OrderedDict()
         self._cache_timestamps = {}
+        # 每个缓存项序列化后的字节数，按条数和总字节数两个上限做 LRU 淘汰
+        self._cache_sizes = {}
+        self._cache_bytes = 0
+        # thread_id -> 已缓存的最新版本号，读取最新检查点时指向版本缓存项，避免同一对象缓存两份
+        self._latest_versions = {}
         self._lock = threading.RLock()
 
         self._get_checkpoint_cached = lru_cache(maxsize=cache_size)(self._get_checkpoint_info)
@@ -50,15 +67,22 @@ class MySQLCheckpointer(BaseCheckpointSaver):
             return serialize_message(obj)
         elif isinstance(obj, dict):
             return {k: self._deep_serialize_messages(v) for k, v in obj.items()}
-        elif isinstance(obj, list):
+        elif isinstance(obj, (list, deque)):
+            # put_writes 收到的 writes 是 deque
             return [self._deep_serialize_messages(item) for item in obj]
         elif isinstance(obj, tuple):
             return tuple(self._deep_serialize_messages(item) for item in obj)
+        elif isinstance(obj, (set, frozenset)):
+            # JSON 列无法存放集合（如并行汇合边的屏障通道记录的已到达节点），转成带标记的列表，读取时还原
+            return {_SET_MARKER: [self._deep_serialize_messages(item) for item in sorted(obj, key=str)]}
         else:
             return obj
 
     def _deep_deserialize_messages(self, obj: Any) -> Any:
         if isinstance(obj, dict):
+            if len(obj) == 1 and _SET_MARKER in obj:
+                return {self._deep_deserialize_messages(item) for item in obj[_SET_MARKER]}
+
             # 尝试反序列化为消息
             if is_message_dict(obj):
                 msg = deserialize_message(obj)
@@ -75,16 +99,6 @@ class MySQLCheckpointer(BaseCheckpointSaver):
             # 对于其他类型（字符串、数字、布尔值、None等），直接返回原值
             return obj
 
-    def _deserialize_messages(self, serialized: List[Dict]) -> List[BaseMessage]:
-        messages = []
-        for msg_data in serialized:
-            msg = deserialize_message(msg_data)
-            if msg is not None:
-                messages.append(msg)
-            else:
-                logger.warning(f"Failed to deserialize message: {msg_data}")
-        return messages
-
     def _get_cache_key(self, thread_id: str, version: Optional[int] = None) -> str:
         if version is None:
             return f"thread:{thread_id}:latest"
@@ -92,6 +106,8 @@ class MySQLCheckpointer(BaseCheckpointSaver):
 
     def _get_from_cache(self, thread_id: str, version: Optional[int] = None) -> Optional[Checkpoint]:
         with self._lock:
+            if version is None:
+                version = self._latest_versions.get(thread_id)
             cache_key = self._get_cache_key(thread_id, version)
 
             if cache_key in self._cache:
@@ -100,23 +116,58 @@ class MySQLCheckpointer(BaseCheckpointSaver):
                     self._cache.move_to_end(cache_key)
                     return self._cache[cache_key]
                 else:
-                    del self._cache[cache_key]
-                    del self._cache_timestamps[cache_key]
+                    self._evict_cache_key(cache_key)
 
             return None
 
-    def _put_to_cache(self, thread_id: str, checkpoint: Checkpoint, version: Optional[int] = None):
+    @staticmethod
+    def _serialized_size(serialized: Any) -> int:
+        return len(orjson.dumps(serialized, default=str, option=orjson.OPT_NON_STR_KEYS))
+
+    def _evict_cache_key(self, cache_key: str):
+        self._cache.pop(cache_key, None)
+        self._cache_timestamps.pop(cache_key, None)
+        self._cache_bytes -= self._cache_sizes.pop(cache_key, 0)
+        # 最新版本指向的缓存项被淘汰时一并删除指向，之后读取最新检查点回到数据库查询
+        thread_id, _, tag = cache_key[len("thread:"):].rpartition(":")
+        latest_version = self._latest_versions.get(thread_id)
+        if latest_version is not None and tag == f"v{latest_version}":
+            del self._latest_versions[thread_id]
+
+    def _put_to_cache(
+        self,
+        thread_id: str,
+        checkpoint: Checkpoint,
+        version: Optional[int] = None,
+        size: Optional[int] = None,
+        latest: bool = False
+    ):
+        """
+        size 为检查点序列化后的字节数，调用方已有序列化结果时直接传入，避免重复序列化；
+        latest 表示该版本是线程的最新检查点（刚写入或从数据库按最新版本读出），只有这时才移动最新版本指向
+        """
+        if size is None:
+            size = self._serialized_size(self._deep_serialize_messages(checkpoint))
         with self._lock:
             cache_key = self._get_cache_key(thread_id, version)
+            latest = latest or (version is not None and self._latest_versions.get(thread_id) == version)
+            self._evict_cache_key(cache_key)
+
+            if size > self.cache_max_bytes:
+                logger.debug(f"检查点过大，不缓存: thread_id={thread_id}, {size} 字节")
+                return
 
-            if len(self._cache) >= 100:
-                oldest_key = next(iter(self._cache))
-                del self._cache[oldest_key]
-                if oldest_key in self._cache_timestamps:
-                    del self._cache_timestamps[oldest_key]
+            while self._cache and (
+                len(self._cache) >= self.cache_size or self._cache_bytes + size > self.cache_max_bytes
+            ):
+                self._evict_cache_key(next(iter(self._cache)))
 
             self._cache[cache_key] = checkpoint
             self._cache_timestamps[cache_key] = datetime.now()
+            if latest and version is not None:
+                self._latest_versions[thread_id] = version
+            self._cache_sizes[cache_key] = size
+            self._cache_bytes += size
 
     def get(self, config: Dict[str, Any]) -> Optional[Checkpoint]:
         thread_id = config.get("configurable", {}).get("thread_id")
@@ -174,7 +225,8 @@ class MySQLCheckpointer(BaseCheckpointSaver):
                         "channel_versions": {},
                         "versions_seen": {}
                     }
-                self._put_to_cache(thread_id, checkpoint)
+                # 按记录的真实版本号缓存，并让最新版本指向它，后续读取最新检查点直接命中
+                self._put_to_cache(thread_id, checkpoint, latest_checkpoint.version, latest=True)
                 return checkpoint
 
             # 如果没有checkpoint，尝试从 Message 表加载历史消息
@@ -230,6 +282,11 @@ class MySQLCheckpointer(BaseCheckpointSaver):
 
     def put(self, config: Dict[str, Any], checkpoint: Checkpoint, metadata: CheckpointMetadata,
             new_versions: Dict[str, int]) -> Dict[str, Any]:
+        return self._save_checkpoint(config, checkpoint, metadata, write_through=True)
+
+    def _save_checkpoint(self, config: Dict[str, Any], checkpoint: Checkpoint,
+                         metadata: Optional[CheckpointMetadata], write_through: bool) -> Dict[str, Any]:
+        """写入一个检查点版本；write_through 为 False 时不改动缓存（用于 put_writes 记录的中间写入）"""
         thread_id = config.get("configurable", {}).get("thread_id")
         if not thread_id or not checkpoint:
             return config
@@ -301,12 +358,19 @@ class MySQLCheckpointer(BaseCheckpointSaver):
 
                 db.commit()
 
-                with self._lock:
-                    keys_to_delete = [k for k in self._cache.keys() if k.startswith(f"thread:{thread_id}:")]
-                    for key in keys_to_delete:
-                        del self._cache[key]
-                        if key in self._cache_timestamps:
-                            del self._cache_timestamps[key]
+                if write_through:
+                    with self._lock:
+                        keys_to_delete = [k for k in self._cache.keys() if k.startswith(f"thread:{thread_id}:")]
+                        for key in keys_to_delete:
+                            self._evict_cache_key(key)
+                        self._latest_versions.pop(thread_id, None)
+
+                    # 写穿缓存：只按版本号缓存一份，读取最新检查点时经 _latest_versions 指向它；
+                    # 字节数由已有的序列化结果计算一次
+                    self._put_to_cache(
+                        thread_id, checkpoint, new_version,
+                        size=self._serialized_size(serialized_checkpoint), latest=True
+                    )
 
                 logger.info(f"保存检查点成功: thread_id={thread_id}, version={new_version}")
 
@@ -352,10 +416,7 @@ class MySQLCheckpointer(BaseCheckpointSaver):
                 query = query.limit(limit)
 
             for checkpoint_record in query:
-                checkpoint_data = dict(checkpoint_record.checkpoint_data)
-                if "channel_values" in checkpoint_data and "messages" in checkpoint_data["channel_values"]:
-                    serialized_messages = checkpoint_data["channel_values"]["messages"]
-                    checkpoint_data["channel_values"]["messages"] = self._deserialize_messages(serialized_messages)
+                checkpoint_data = self._deep_deserialize_messages(checkpoint_record.checkpoint_data)
 
                 yield CheckpointTuple(
                     config={
@@ -436,7 +497,8 @@ class MySQLCheckpointer(BaseCheckpointSaver):
                 "timestamp": datetime.now().isoformat()
             }
 
-            self.put(config, {"writes": writes}, metadata, {})
+            # 中间写入不是完整检查点，不进入缓存，最新检查点的缓存仍指向上一次 put 的结果
+            self._save_checkpoint(config, {"writes": writes}, metadata, write_through=False)
         finally:
             try:
                 next(db_gen)
@@ -448,12 +510,14 @@ class MySQLCheckpointer(BaseCheckpointSaver):
             if thread_id:
                 keys_to_delete = [k for k in self._cache.keys() if k.startswith(f"thread:{thread_id}:")]
                 for key in keys_to_delete:
-                    del self._cache[key]
-                    if key in self._cache_timestamps:
-                        del self._cache_timestamps[key]
+                    self._evict_cache_key(key)
+                self._latest_versions.pop(thread_id, None)
             else:
                 self._cache.clear()
                 self._cache_timestamps.clear()
+                self._cache_sizes.clear()
+                self._cache_bytes = 0
+                self._latest_versions.clear()
 
     def get_version_history(self, thread_id: str, limit: int = 10) -> List[Dict[str, Any]]:
         db_gen = self.db_session_factory()
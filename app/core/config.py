@@ -52,6 +52,13 @@ class Settings(BaseSettings):
     NEO4J_MAX_CONNECTION_LIFETIME: int = 3600
     NEO4J_MAX_CONNECTION_POOL_SIZE: int = 50
     NEO4J_CONNECTION_ACQUISITION_TIMEOUT: float = 60.0
+    # 超大批量关系写入改用 CALL { ... } IN TRANSACTIONS，由服务端按块提交
+    NEO4J_IN_TRANSACTIONS_THRESHOLD: int = 5000
+    NEO4J_RELATIONSHIP_COMMIT_CHUNK: int = 1000
+    # 只读聚合查询使用并行运行时（仅 Neo4j 企业版 5.13+ 支持，社区版自动回退）
+    NEO4J_PARALLEL_RUNTIME_ENABLED: bool = False
+    # 图数据库写入专用线程数，同时也是并发写入的上限
+    NEO4J_MAX_CONCURRENT_WRITES: int = 8
     
     # 应用配置
     PROJECT_NAME: str = "AI Agents API"
@@ -80,6 +87,36 @@ class Settings(BaseSettings):
     # OpenAI 配置
     OPENAI_API_KEY: Optional[str] = None
     LLM_MODEL: str = "gpt-4o-mini"
+    INTENT_LLM_MODEL: str = "gpt-4.1-nano"
+    SUMMARY_LLM_MODEL: str = "gpt-4o-mini"
+
+    # 意图识别语义缓存（默认关闭）
+    INTENT_CACHE_ENABLED: bool = False
+    INTENT_CACHE_THRESHOLD: float = 0.95
+    INTENT_CACHE_TTL: int = 3600
+
+    # 意图识别微批处理（默认关闭）
+    INTENT_BATCH_ENABLED: bool = False
+    INTENT_BATCH_MAX_SIZE: int = 8
+    INTENT_BATCH_WAIT_TIMEOUT: float = 0.05
+    # 同时在途的批请求数，单个请求变慢时收集线程仍可继续发出后续批次
+    INTENT_BATCH_MAX_CONCURRENCY: int = 4
+
+    # 创建 EmbeddingService 时预先校验 OpenAI 密钥（每个进程每个密钥只校验一次，默认关闭，
+    # 无效密钥会在首次生成向量时报认证错误）
+    EMBEDDING_EAGER_VALIDATE: bool = False
+
+    # 查询向量与单条文档向量微批处理（默认关闭）
+    EMBEDDING_BATCH_ENABLED: bool = False
+    EMBEDDING_BATCH_MAX_SIZE: int = 64
+    EMBEDDING_BATCH_WAIT_TIMEOUT: float = 0.01
+    # 同时在途的批请求数，单个请求变慢时收集线程仍可继续发出后续批次
+    EMBEDDING_BATCH_MAX_CONCURRENCY: int = 4
+
+    # 查询向量进程内 LRU 缓存条目数，0 表示关闭
+    EMBEDDING_QUERY_CACHE_SIZE: int = 10000
+    # 实体、关系、文本块向量的实例内 LRU 缓存条目数
+    EMBEDDING_DOC_CACHE_SIZE: int = 50000
 
     class Config:
         # 不在这里指定 env_file，因为我们已经手动加载了
@@ -0,0 +1,40 @@
+from functools import lru_cache
+import httpx
+from langchain_openai import ChatOpenAI
+from app.core.config import settings
+
+
+def _build_chat_llm(model: str, **kwargs) -> ChatOpenAI:
+    """构建共享 httpx 连接池的 ChatOpenAI，进程内复用 TCP/TLS 连接"""
+    limits = httpx.Limits(max_connections=128, max_keepalive_connections=64)
+    timeout = httpx.Timeout(60.0, connect=10.0)
+    return ChatOpenAI(
+        api_key=settings.OPENAI_API_KEY,
+        model=model,
+        max_retries=2,
+        http_client=httpx.Client(limits=limits, timeout=timeout),
+        http_async_client=httpx.AsyncClient(limits=limits, timeout=timeout),
+        **kwargs
+    )
+
+
+@lru_cache()
+def get_training_llm() -> ChatOpenAI:
+    return _build_chat_llm(settings.LLM_MODEL, temperature=0.3)
+
+
+@lru_cache()
+def get_intent_llm() -> ChatOpenAI:
+    # 意图分类是简单的五选一任务，使用更小更便宜的模型；开启 JSON 模式，保证响应可直接解析
+    return _build_chat_llm(
+        settings.INTENT_LLM_MODEL,
+        temperature=0,
+        max_tokens=50,
+        model_kwargs={"response_format": {"type": "json_object"}}
+    )
+
+
+@lru_cache()
+def get_summary_llm() -> ChatOpenAI:
+    # 训练对话的滚动摘要只需压缩已有内容，使用确定性输出并限制长度
+    return _build_chat_llm(settings.SUMMARY_LLM_MODEL, temperature=0, max_tokens=300)
@@ -1,5 +1,7 @@
 from functools import lru_cache
+from typing import Optional
 from fastapi import Depends
+from langchain_openai import ChatOpenAI
 from sqlalchemy.orm import Session
 from app.dependencies.database import get_db
 from app.repositories.user_repository import UserRepository
@@ -14,7 +16,11 @@ from app.services.digital_human_training_service import DigitalHumanTrainingServ
 from app.services.graph_service import GraphService
 from app.services.conversation_service import ConversationService
 from app.services.hybrid_search_service import HybridSearchService
+from app.services.intent_cache import IntentCache
+from app.services.intent_batcher import IntentBatcher
 from app.dependencies.graph import get_graph_service
+from app.core.config import settings
+from app.core.llm import get_training_llm, get_intent_llm, get_summary_llm
 
 
 def get_user_repository(db: Session = Depends(get_db)) -> UserRepository:
@@ -69,11 +75,38 @@ def get_hybrid_search_service() -> HybridSearchService:
     return HybridSearchService()
 
 
+@lru_cache()
+def get_intent_cache() -> Optional[IntentCache]:
+    if not settings.INTENT_CACHE_ENABLED:
+        return None
+    return IntentCache(
+        threshold=settings.INTENT_CACHE_THRESHOLD,
+        ttl=settings.INTENT_CACHE_TTL
+    )
+
+
+@lru_cache()
+def get_intent_batcher() -> Optional[IntentBatcher]:
+    if not settings.INTENT_BATCH_ENABLED:
+        return None
+    return IntentBatcher(
+        get_intent_llm(),
+        max_batch_size=settings.INTENT_BATCH_MAX_SIZE,
+        batch_wait_timeout=settings.INTENT_BATCH_WAIT_TIMEOUT,
+        max_concurrency=settings.INTENT_BATCH_MAX_CONCURRENCY
+    )
+
+
 def get_digital_human_training_service(
     training_message_repo: TrainingMessageRepository = Depends(get_training_message_repository),
     knowledge_extractor: KnowledgeExtractor = Depends(get_knowledge_extractor),
     graph_service: GraphService = Depends(get_graph_service),
-    hybrid_search_service: HybridSearchService = Depends(get_hybrid_search_service)
+    hybrid_search_service: HybridSearchService = Depends(get_hybrid_search_service),
+    llm: ChatOpenAI = Depends(get_training_llm),
+    intent_llm: ChatOpenAI = Depends(get_intent_llm),
+    summary_llm: ChatOpenAI = Depends(get_summary_llm),
+    intent_cache: Optional[IntentCache] = Depends(get_intent_cache),
+    intent_batcher: Optional[IntentBatcher] = Depends(get_intent_batcher)
 ) -> DigitalHumanTrainingService:
     from app.core.database import get_db
     return DigitalHumanTrainingService(
@@ -81,5 +114,10 @@ def get_digital_human_training_service(
         knowledge_extractor,
         graph_service,
         hybrid_search_service,
-        db_session_factory=get_db
+        db_session_factory=get_db,
+        llm=llm,
+        intent_llm=intent_llm,
+        summary_llm=summary_llm,
+        intent_cache=intent_cache,
+        intent_batcher=intent_batcher
     )
\ No newline at end of file
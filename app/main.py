@@ -14,7 +14,7 @@ from app.core.logger import logger, set_request_id
 
 from app.core.mongodb import init_mongodb, close_mongodb
 
-from app.core.neomodel_config import setup_neomodel
+from app.core.neomodel_config import setup_neomodel, close_neomodel
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -141,6 +141,7 @@ async def shutdown_event():
     logger.info("🔄 正在关闭 MongoDB 连接...")
     await close_mongodb()
     logger.info("✅ MongoDB 连接已关闭")
+    close_neomodel()
 
 
 app.include_router(api_router, prefix="/api/v1")
@@ -3,9 +3,11 @@
 处理跨节点类型的图查询操作
 """
 
-from typing import Dict, List, Any, Optional
+from contextlib import contextmanager
+from typing import Dict, List, Any, Iterator, Optional
 import logging
-from neomodel import db
+from neo4j import Session
+from neomodel import config as neomodel_config, db
 
 logger = logging.getLogger(__name__)
 
@@ -176,4 +178,34 @@ class GraphRepository:
             return db.cypher_query(query, params or {})
         except Exception as e:
             logger.error(f"执行Cypher查询失败: {str(e)}")
-            raise
\ No newline at end of file
+            raise
+    
+    @contextmanager
+    def session(self) -> Iterator[Session]:
+        """
+        打开一个可在多次查询间复用的 Neo4j 会话（自动提交），退出时关闭
+        
+        会话不是线程安全的，只能在打开它的线程中使用；驱动是进程内共享的，工作线程不会各自新建连接池
+        """
+        if db.driver is None:
+            db.set_connection(driver=neomodel_config.DRIVER)
+        with db.driver.session(database=db._database_name) as session:
+            yield session
+    
+    def execute_query_on(self, session: Session, query: str, params: Optional[Dict[str, Any]] = None) -> tuple:
+        """
+        在已打开的会话上执行原生Cypher查询
+        
+        Args:
+            session: 由 session() 打开的会话
+            query: Cypher查询语句
+            params: 查询参数
+        
+        Returns:
+            查询结果和元数据的元组
+        
+        批量写入会在失败时拆分重试，异常直接抛给调用方汇总记录，这里不逐次打日志
+        """
+        result = session.run(query, params or {})
+        keys = result.keys()
+        return [list(record.values()) for record in result], keys
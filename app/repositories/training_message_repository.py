@@ -34,6 +34,20 @@ class TrainingMessageRepository:
         logger.info(f"创建训练消息: {role} - 数字人ID: {digital_human_id}")
         return training_message
     
+    def create_training_messages_bulk(
+        self,
+        rows: List[Dict[str, Any]]
+    ) -> List[DigitalHumanTrainingMessage]:
+        training_messages = [DigitalHumanTrainingMessage(**row) for row in rows]
+        if not training_messages:
+            return training_messages
+        
+        self.db.add_all(training_messages)
+        self.db.flush()
+        
+        logger.info(f"批量创建训练消息: {len(training_messages)} 条")
+        return training_messages
+    
     def get_training_messages(
         self,
         digital_human_id: int,
@@ -3,7 +3,7 @@ from typing import List, Optional, Tuple, Generator, Dict, Any
 from app.services.langgraph_service import LangGraphService
 from app.core.models import Message, DigitalHuman, ConversationCheckpoint
 from app.schemas.conversation import *
-import json
+import orjson
 from datetime import datetime
 from sqlalchemy import desc, and_
 
@@ -243,10 +243,10 @@ class ConversationService:
         conversation = self.get_conversation_by_thread_id(thread_id, user_id)
 
         if not conversation:
-            yield json.dumps({
+            yield orjson.dumps({
                 "type": "error",
                 "content": "对话不存在或无权限访问"
-            })
+            }).decode()
             return
 
         # 保存用户消息
@@ -282,7 +282,7 @@ class ConversationService:
             # 检查 chunk 是否是 JSON 格式的状态消息
             if chunk.startswith("{"):
                 # 解析为 JSON
-                data = json.loads(chunk)
+                data = orjson.loads(chunk)
                 # 记忆搜索结果，直接转发
                 if data.get("type") == "memory":
                     memory_data = data  # 保存完整的记忆搜索数据（用于存储到数据库）
@@ -292,10 +292,10 @@ class ConversationService:
                 # 是实际的 AI 回复内容
                 # 追加到 full_response 并发送给前端
                 full_response += chunk
-                yield json.dumps({
+                yield orjson.dumps({
                     "type": "token",
                     "content": chunk
-                })
+                }).decode()
 
         # 保存 AI 消息
         ai_message = Message(
@@ -311,10 +311,10 @@ class ConversationService:
         self.db.commit()
 
         # 发送完成消息
-        yield json.dumps({
+        yield orjson.dumps({
             "type": "done",
             "content": ""
-        })
+        }).decode()
     
     def _get_digital_human_config(self, digital_human_id: int) -> Dict[str, Any]:
         digital_human = self.db.query(DigitalHuman).filter(
@@ -1,42 +1,241 @@
-from typing import Dict, List, Any, Generator, Optional, AsyncGenerator, TypedDict, Annotated, Tuple
-import json
+from typing import Dict, List, Any, Optional, AsyncGenerator, TypedDict, Annotated, Tuple
+import re
+import operator
+import orjson
+import asyncio
+import functools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import uuid
 from datetime import datetime
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import BaseMessage
+from langchain_core.language_models import BaseChatModel
+from langchain_core.runnables import RunnableConfig
 from app.core.messages import UserMessage, AssistantMessage, SystemMessage, serialize_message
-from langgraph.graph import StateGraph, END
-import operator
+from langgraph.graph import StateGraph, START, END
 
 from app.services.knowledge_extractor import KnowledgeExtractor
 from app.services.graph_service import GraphService
 from app.services.hybrid_search_service import HybridSearchService
+from app.services.intent_cache import IntentCache
+from app.services.intent_batcher import IntentBatcher
 from app.repositories.training_message_repository import TrainingMessageRepository
 from app.core.checkpointer import MySQLCheckpointer
 from app.core.logger import logger
 from app.core.config import settings
+from app.core.llm import get_training_llm, get_intent_llm, get_summary_llm
 from app.core.models import DigitalHumanTrainingMessage
 
 
+def _merge_dict(a: Dict[str, Any], b: Dict[str, Any]) -> Dict[str, Any]:
+    return {**a, **b}
+
+
+def _take_last(a: Any, b: Any) -> Any:
+    return b
+
+
+# 对话历史只保留最近若干条，节点最多回看 10 条，超出部分只会增加检查点体积
+_MESSAGES_MAXLEN = 40
+
+
+def _append_bounded(a: List[BaseMessage], b: List[BaseMessage]) -> List[BaseMessage]:
+    out = deque(a, maxlen=_MESSAGES_MAXLEN)
+    out.extend(b)
+    return list(out)
+
+
+# 问题生成只发送滚动摘要之后的消息原文：至少保留最近 3 条，未摘要的更早消息累计到 6 条时折叠进摘要；
+# 尚未生成摘要时沿用最近 10 条原文
+_SUMMARY_RAW_WINDOW = 3
+_SUMMARY_EVERY = 6
+_QUESTION_HISTORY_LIMIT = 10
+
+
+# 极短的应答类消息走快速路径（意图识别与问题生成合并为一次 LLM 调用），含代码/结构化符号的消息除外；
+# 其余消息走完整流程，使用意图模型、意图缓存和批处理
+_FAST_PATH_MAX_LENGTH = 16
+_CODE_LIKE_RE = re.compile(r"[{}<>=;`]|\b(def|class|import|select|function)\b", re.IGNORECASE)
+# 问候/应答类短消息无需调用 LLM 识别意图
+_GREETING_MAX_LENGTH = 8
+_GREETING_RE = re.compile(
+    r"^(hi|hello|hey|你好|您好|嗨|哈喽|谢谢|thanks?|thank you|ok|okay|好的|好|嗯+|哦+)[呀啊哈~]*[\W_]*$",
+    re.IGNORECASE
+)
+# 消息 role/type 到消息类的映射，兼容 LangChain 的 human/ai 命名
+_ROLE_TO_MSG = {
+    "user": UserMessage,
+    "human": UserMessage,
+    "assistant": AssistantMessage,
+    "ai": AssistantMessage,
+    "system": SystemMessage
+}
+
+# 纯表情/标点消息不含可抽取的知识
+_LOW_SIGNAL_RE = re.compile(r"^[\W_]*$")
+
+# 意图识别响应形状固定，直接用正则取字段，兼容 markdown 代码块包裹；取不到再回退到 JSON 解析
+_INTENT_RE = re.compile(r'"intent"\s*:\s*"([a-z_]+)"')
+_STAGE_RE = re.compile(r'"stage"\s*:\s*"([a-z_]+)"')
+
+# 提示词模板在模块加载时构建一次，每轮只填充对话相关部分
+_FAST_PATH_PROMPT = """
+你是一个正在了解用户的数字人。分析用户消息的意图，并生成下一个引导性问题。
+{history_context}
+{context_prompt}
+
+请判断：
+1. 意图类型（information_sharing/question_asking/clarification/greeting/other）
+2. 当前对话阶段（initial/exploring/deepening/concluding）
+3. 下一个引导性问题：自然、友好，根据用户刚才的回答延伸，不要重复已经问过的内容。
+   如果意图是 information_sharing，或者是 exploring/deepening 阶段的 question_asking，
+   消息中的知识需要先提取，next_question 返回空字符串
+
+返回JSON格式：
+{{
+    "intent": "...",
+    "stage": "...",
+    "next_question": "..."
+}}
+"""
+
+_INTENT_PROMPT = """
+分析以下用户消息的意图和内容类型：
+{history_context}
+当前用户消息: {current_message}
+
+请基于对话历史和当前消息判断：
+1. 意图类型（information_sharing/question_asking/clarification/greeting/other）
+2. 当前对话阶段（initial/exploring/deepening/concluding）
+
+返回JSON格式：
+{{
+    "intent": "...",
+    "stage": "..."
+}}
+"""
+
+_QUESTION_PROMPT = """
+你是一个正在了解用户的数字人。基于当前对话状态，生成下一个引导性问题。
+
+{context_prompt}
+
+要求：
+1. 问题要自然、友好
+2. 根据用户刚才的回答延伸
+3. 逐步深入了解用户
+4. 不要重复已经问过的内容
+5. 基于对话历史保持连贯性
+
+生成一个引导性问题：
+"""
+
+_SUMMARY_PROMPT = """
+你在帮助数字人记住与用户的训练对话。请把已有摘要和新增的对话合并成一段新的摘要。
+
+已有摘要：
+{summary}
+
+新增对话：
+{history}
+
+要求：
+1. 保留用户提到的事实、经历、观点和偏好，以及数字人已经问过的问题
+2. 删除寒暄和重复内容
+3. 不超过 200 字，直接输出摘要正文
+"""
+
+# 问题 token 合并转发的批大小范围
+_QUESTION_DELTA_MIN_BATCH = 1
+_QUESTION_DELTA_MAX_BATCH = 16
+
+# 线程数与 SQLAlchemy 默认连接池上限（pool_size 5 + max_overflow 10）对齐
+_io_executor = ThreadPoolExecutor(max_workers=15, thread_name_prefix="training-io")
+
+
+async def _aexec(fn, *args, **kwargs):
+    """在线程池中执行阻塞的数据库调用，避免占住事件循环"""
+    return await asyncio.get_running_loop().run_in_executor(
+        _io_executor, functools.partial(fn, *args, **kwargs)
+    )
+
+
+def _dumps(obj: Any) -> bytes:
+    """序列化 SSE 事件，直接返回 orjson 的 UTF-8 字节，由接口层拼接 SSE 帧，不再经过 str 往返编码"""
+    return orjson.dumps(obj)
+
+
+_STREAM_END = object()
+
+
+async def _buffered(source: AsyncGenerator[bytes, None], maxsize: int = 64) -> AsyncGenerator[bytes, None]:
+    """在后台任务中消费 source，经有界队列转发，解耦生产者与 SSE 消费者"""
+    queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+
+    async def produce():
+        try:
+            async for item in source:
+                await queue.put(item)
+        except Exception as e:
+            await queue.put(e)
+        else:
+            await queue.put(_STREAM_END)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            item = await queue.get()
+            if item is _STREAM_END:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        if not producer.done():
+            producer.cancel()
+
+
 class TrainingState(TypedDict):
-    messages: Annotated[List[BaseMessage], operator.add]
+    messages: Annotated[List[BaseMessage], _append_bounded]
+    message_count: Annotated[int, operator.add]  # 累计追加的消息条数，不受 messages 上限截断影响
+    conversation_summary: str  # 滚动摘要，覆盖累计第 summarized_count 条之前的消息
+    summarized_count: int
     digital_human_id: int
     user_id: int
     current_message: str
     extracted_knowledge: Dict[str, Any]
+    draft_knowledge: Dict[str, Any]  # 与意图识别并行的预抽取结果（未向量化、未写库）
     knowledge_context: Dict[str, Any]
     memory_search_results: Dict[str, Any]  # 记忆搜索结果
+    query_embedding: Optional[List[float]]  # 本轮消息的查询向量，意图缓存与记忆搜索共用
     next_question: str
     should_extract: bool
     should_explore_deeper: bool
     conversation_stage: str
     total_knowledge_points: int
     categories: Dict[str, Any]
-    current_step: str
-    completed_steps: Annotated[List[str], operator.add]
-    step_results: Dict[str, Any]
-    thinking_process: Annotated[List[str], operator.add]
-    events: Annotated[List[Dict[str, Any]], operator.add]  # 事件队列，用于流式通知
+    current_step: Annotated[str, _take_last]  # 并行节点可能在同一步写入
+    # 步骤与思考过程由事件中继按节点输出即时转发，状态中只保留最近一次写入，避免逐节点拼接列表
+    completed_steps: Annotated[List[str], _take_last]
+    step_results: Annotated[Dict[str, Any], _merge_dict]
+    thinking_process: Annotated[List[str], _take_last]
+
+
+_NODE_START_MESSAGES = {
+    "classify_and_ask": "⚡ 快速识别意图并生成问题...",
+    "intent_recognition": "🔍 开始识别用户意图...",
+    "memory_search": "🔍 搜索相关记忆...",
+    "knowledge_extraction": "🧠 开始提取知识点...",
+    "context_analysis": "🔎 开始分析知识图谱上下文...",
+    "question_generation": "❓ 开始生成引导性问题...",
+    "save_message": "💾 开始保存对话记录..."
+}
+
+# 预构建的 node_start 事件骨架，发送时只需补充时间戳
+_NODE_START_EVENTS = {
+    node: {"type": "node_start", "node": node, "message": message}
+    for node, message in _NODE_START_MESSAGES.items()
+}
 
 
 class DigitalHumanTrainingService:
@@ -48,7 +247,12 @@ class DigitalHumanTrainingService:
         knowledge_extractor: KnowledgeExtractor,
         graph_service: GraphService,
         hybrid_search_service: Optional[HybridSearchService] = None,
-        db_session_factory=None
+        db_session_factory=None,
+        llm: Optional[BaseChatModel] = None,
+        intent_llm: Optional[BaseChatModel] = None,
+        summary_llm: Optional[BaseChatModel] = None,
+        intent_cache: Optional[IntentCache] = None,
+        intent_batcher: Optional[IntentBatcher] = None
     ):
         self.training_message_repo = training_message_repo
         # self.training_session_repo = training_session_repo  # 移除会话概念
@@ -56,98 +260,223 @@ class DigitalHumanTrainingService:
         self.graph_service = graph_service
         self.hybrid_search_service = hybrid_search_service or HybridSearchService()
         
-        self.llm = ChatOpenAI(
-            api_key=settings.OPENAI_API_KEY,
-            model="gpt-4o-mini",
-            temperature=0.3
-        )
+        # 默认使用进程级共享的 LLM 客户端，复用连接池
+        self.llm = llm or get_training_llm()
+        self.intent_llm = intent_llm or get_intent_llm()
+        self.summary_llm = summary_llm or get_summary_llm()
+        self.intent_cache = intent_cache
+        self.intent_batcher = intent_batcher
         
         # 使用 MySQL 检查点保存器，支持版本管理和缓存
         from app.core.database import get_db
-        self.checkpointer = MySQLCheckpointer(
-            db_session_factory or get_db,
-            cache_size=100,  # 缓存100个检查点
-            cache_ttl=300    # 缓存5分钟
-        )
+        self.checkpointer = _get_checkpointer(db_session_factory or get_db)
         
-        self.training_graph = self._build_training_graph()
-    
-    def _build_training_graph(self):
-        workflow = StateGraph(TrainingState)
-
-        workflow.add_node("intent_recognition", self._recognize_intent)
-        workflow.add_node("memory_search", self._search_memory)
-        workflow.add_node("knowledge_extraction", self._extract_knowledge)
-        workflow.add_node("context_analysis", self._analyze_context)
-        workflow.add_node("question_generation", self._generate_question)
-        workflow.add_node("save_message", self._save_message)
-
-        workflow.set_entry_point("intent_recognition")
-
-        workflow.add_edge("intent_recognition", "memory_search")
-
-        workflow.add_conditional_edges(
-            "memory_search",
-            self._route_after_search,
-            {
-                "extract": "knowledge_extraction",
-                "analyze": "context_analysis",
-                "direct": "question_generation"
-            }
-        )
-
-        workflow.add_edge("knowledge_extraction", "context_analysis")
-        workflow.add_edge("context_analysis", "question_generation")
-        workflow.add_edge("question_generation", "save_message")
-        workflow.add_edge("save_message", END)
-
-        return workflow.compile(checkpointer=self.checkpointer)
+        # 拓扑在进程内只编译一次，实例只替换自己的检查点保存器；节点通过 configurable 取回服务实例
+        self.training_graph = _get_training_graph().copy(update={"checkpointer": self.checkpointer})
     
     def _create_event(
         self, 
         event_type: str, 
         node: str, 
         message: str, 
-        result: Optional[Dict[str, Any]] = None
+        result: Optional[Dict[str, Any]] = None,
+        timestamp: Optional[str] = None
     ) -> Dict[str, Any]:
         event = {
             "type": event_type,
             "node": node,
             "message": message,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": timestamp or datetime.now().isoformat()
         }
         if result is not None:
             event["result"] = result
         return event
     
     def save_graph_visualization(self, output_dir: str = "graph_visualizations"):
-        """保存工作流图的可视化"""
-        from pathlib import Path
+        """保存工作流图的可视化（调试用，按需导入绘图工具）"""
+        from app.utils.training_graph_viz import save_graph_visualization
+        return save_graph_visualization(self.training_graph, output_dir)
+    
+    async def _classify_and_ask(self, state: TrainingState) -> Dict[str, Any]:
+        """
+        快速路径：一次 LLM 调用同时完成意图识别和问题生成。
         
-        Path(output_dir).mkdir(exist_ok=True)
-        graph = self.training_graph.get_graph()
+        仅用于极短消息，记忆搜索与本节点并行执行。需要提取知识时提示词要求模型不生成问题，
+        交由知识提取 → 上下文分析 → 问题生成处理，问题生成可以用到记忆搜索结果。
         
-        # 1. 尝试生成 PNG 图片
-        png_path = f"{output_dir}/training_graph.png"
-        try:
-            graph.draw_png(output_file_path=png_path)
-            logger.info(f"✅ 图已保存为 PNG: {png_path}")
-            return png_path
-        except Exception:
-            logger.debug("PNG 生成失败，尝试 Mermaid 格式")
+        Args:
+            state: 当前训练状态，必须包含 current_message
+            
+        Returns:
+            更新后的状态字典，包含：
+            - should_extract: 是否需要进行知识抽取
+            - conversation_stage: 当前对话阶段
+            - next_question: 生成的问题（需要提取知识时不返回）
+            - step_results: 包含意图识别和问题生成结果
+            - events: 节点执行事件列表
+        """
+        now = datetime.now().isoformat()
+        events = []
         
-        # 2. 备选方案：保存 Mermaid
-        try:
-            mermaid_path = f"{output_dir}/training_graph.mmd"
-            Path(mermaid_path).write_text(graph.draw_mermaid())
-            logger.info(f"✅ 图已保存为 Mermaid: {mermaid_path}")
-            logger.info("📊 可在 https://mermaid.live 查看")
-            return mermaid_path
-        except Exception as e:
-            logger.error(f"❌ 无法生成任何可视化: {e}")
+        current_step = "classifying_and_asking"
+        thinking_process = ["正在快速识别意图并生成问题..."]
+        
+        # 问候语不调用 LLM，由问题生成节点（流式输出）单独生成问题
+        result = self._match_greeting(state)
+        if result is None:
+            prompt = _FAST_PATH_PROMPT.format(
+                history_context=self._build_history_context(state),
+                context_prompt=self._build_context_prompt(state)
+            )
+            response = await self.llm.bind(response_format={"type": "json_object"}).ainvoke([SystemMessage(content=prompt)])
+            try:
+                result = orjson.loads(response.content)
+            except orjson.JSONDecodeError as e:
+                logger.error(f"快速路径响应解析失败: {e}")
+                logger.error(f"原始响应: {response.content}")
+                raise ValueError(f"意图识别响应格式错误: {str(e)}")
+        
+        intent = result.get("intent", "other")
+        conversation_stage = result.get("stage", "exploring")
+        next_question = (result.get("next_question") or "").strip()
+        should_extract = self._decide_should_extract(intent, conversation_stage, state['current_message'])
+        
+        step_results = {
+            "intent_recognition": {
+                "intent": intent,
+                "should_extract": should_extract,
+                "stage": conversation_stage,
+                "cache_hit": False,
+                "fast_path": True
+            }
+        }
+        
+        events.append(self._create_event(
+            "node_complete",
+            "classify_and_ask",
+            f"✅ 意图识别完成: {intent}",
+            {
+                "intent": intent,
+                "stage": conversation_stage,
+                "should_extract": should_extract
+            },
+            timestamp=now
+        ))
+        
+        update = {
+            "current_step": current_step,
+            "conversation_stage": conversation_stage,
+            "should_extract": should_extract,
+            "step_results": step_results,
+            "completed_steps": ["classify_and_ask"],
+            "thinking_process": thinking_process,
+            "events": events
+        }
+        
+        if should_extract or not next_question:
+            thinking_process.append(f"识别到意图: {intent}, 转入完整流程")
+            return update
+        
+        step_results["question_generation"] = {
+            "question": next_question,
+            "based_on_stage": conversation_stage
+        }
+        thinking_process.append(f"识别到意图: {intent}, 已生成引导性问题")
+        update["next_question"] = next_question
+        update["messages"] = [{
+            "role": "assistant",
+            "content": next_question,
+            "additional_kwargs": {}
+        }]
+        update["message_count"] = 1
+        return update
+    
+    def _match_greeting(self, state: TrainingState) -> Optional[Dict[str, Any]]:
+        """问候/应答类短消息直接判定为 greeting；首轮为 initial 阶段，之后沿用当前阶段"""
+        message = state['current_message'].strip()
+        if len(message) > _GREETING_MAX_LENGTH or not _GREETING_RE.match(message):
             return None
+        stage = "initial" if len(state.get('messages', [])) <= 1 else state.get('conversation_stage') or "exploring"
+        return {"intent": "greeting", "stage": stage}
+
+    def _is_low_signal(self, state: TrainingState) -> bool:
+        """纯表情/标点，或与上一条用户消息完全相同的消息，跳过意图识别、记忆搜索和知识抽取，直接生成问题"""
+        message = state['current_message'].strip()
+        if _LOW_SIGNAL_RE.match(message):
+            return True
+        # 最后一条是入口追加的当前消息
+        for msg in reversed(state.get('messages', [])[:-1]):
+            if isinstance(msg, dict):
+                if _ROLE_TO_MSG.get(msg.get("role")) is UserMessage:
+                    return msg.get("content", "").strip() == message
+            elif isinstance(msg, BaseMessage) and _ROLE_TO_MSG.get(msg.type) is UserMessage:
+                return msg.content.strip() == message
+        return False
+
+    def _build_history_context(self, state: TrainingState) -> str:
+        messages = state.get('messages', [])
+        # 获取最近几条历史（不包括当前消息）
+        recent_messages = messages[-6:-1]
+        if not recent_messages:
+            return ""
+        parts = ["\n对话历史："]
+        for msg in recent_messages:
+            # 处理消息可能是字典或对象的情况
+            if isinstance(msg, dict):
+                role = "用户" if _ROLE_TO_MSG.get(msg.get("role")) is UserMessage else "助手"
+                content = msg.get("content", "")
+            elif isinstance(msg, BaseMessage):
+                role = "用户" if _ROLE_TO_MSG.get(msg.type) is UserMessage else "助手"
+                content = msg.content
+            else:
+                continue
+            
+            preview = content[:100]
+            parts.append(f"{role}: {preview}..." if len(preview) < len(content) else f"{role}: {preview}")
+        return "\n".join(parts) + "\n"
     
-    def _recognize_intent(self, state: TrainingState) -> Dict[str, Any]:
+    def _decide_should_extract(self, intent: str, conversation_stage: str, message: str) -> bool:
+        """基于意图和对话阶段判断是否需要提取知识"""
+        if intent == "information_sharing":
+            return True
+        if intent == "question_asking":
+            # 问题可能包含知识，也可能不包含
+            # 这里简单处理，如果是探索阶段的问题，可能有知识
+            return conversation_stage in ["exploring", "deepening"]
+        if intent == "other":
+            # 对于 other 类型，长文本（超过100字符）应该提取
+            text_length = len(message)
+            if text_length > 100:
+                logger.debug(f"长文本({text_length}字符)被识别为需要提取知识")
+                return True
+        return False
+    
+    def _build_intent_prompt(self, state: TrainingState) -> str:
+        return _INTENT_PROMPT.format(
+            history_context=self._build_history_context(state),
+            current_message=state['current_message']
+        )
+    
+    async def _classify_intent(self, state: TrainingState, prompt: Optional[str] = None) -> Dict[str, Any]:
+        """调用 LLM 识别意图，返回 {"intent": ..., "stage": ...}"""
+        prompt = prompt or self._build_intent_prompt(state)
+        
+        if self.intent_batcher is not None:
+            response = await asyncio.wrap_future(self.intent_batcher.submit(prompt))
+        else:
+            response = await self.intent_llm.ainvoke([SystemMessage(content=prompt)])
+        intent_match = _INTENT_RE.search(response.content)
+        stage_match = _STAGE_RE.search(response.content)
+        if intent_match and stage_match:
+            return {"intent": intent_match.group(1), "stage": stage_match.group(1)}
+        try:
+            return orjson.loads(response.content)
+        except orjson.JSONDecodeError as e:
+            logger.error(f"意图识别响应解析失败: {e}")
+            logger.error(f"原始响应: {response.content}")
+            raise ValueError(f"意图识别响应格式错误: {str(e)}")
+    
+    async def _recognize_intent(self, state: TrainingState) -> Dict[str, Any]:
         """
         识别用户意图并判断对话阶段。
         
@@ -165,98 +494,59 @@ class DigitalHumanTrainingService:
             - step_results: 包含意图识别结果
             - events: 节点执行事件列表
         """
-        # 节点开始事件
-        events = [self._create_event(
-            "node_start",
-            "intent_recognition",
-            "🔍 开始识别用户意图..."
-        )]
+        now = datetime.now().isoformat()
+        events = []
         
         current_step = "recognizing_intent"
         thinking_process = ["正在识别用户意图..."]
         
-        # 添加思考步骤
-        events.append(self._create_event(
-            "thinking",
-            "intent_recognition",
-            "💭 分析消息内容，识别用户意图..."
-        ))
+        # 细粒度思考事件仅在调试模式下发送
+        if settings.DEBUG:
+            events.append(self._create_event(
+                "thinking",
+                "intent_recognition",
+                "💭 分析消息内容，识别用户意图...",
+                timestamp=now
+            ))
         
-        # 构建对话历史上下文
-        history_context = ""
-        messages = state.get('messages', [])
-        if len(messages) > 1:  # 有历史消息
-            recent_messages = messages[-6:-1]  # 获取最近几条历史（不包括当前消息）
-            if recent_messages:
-                history_context = "\n对话历史：\n"
-                for msg in recent_messages:
-                    # 处理消息可能是字典或对象的情况
-                    if isinstance(msg, dict):
-                        role = "用户" if msg.get("role") == "user" else "助手"
-                        content = msg.get("content", "")
-                    elif isinstance(msg, BaseMessage):
-                        role = "用户" if isinstance(msg, UserMessage) else "助手"
-                        content = msg.content
-                    else:
-                        continue
-                    
-                    history_context += f"{role}: {content[:100]}...\n" if len(content) > 100 else f"{role}: {content}\n"
+        cache_hit = False
+        result = self._match_greeting(state)
+        query_embedding = state.get('query_embedding')
+        prompt = self._build_intent_prompt(state)
+        if result is None and self.intent_cache is not None:
+            # 提示词（含历史）完全相同时直接命中，不必计算嵌入
+            result = self.intent_cache.lookup_prompt(prompt)
+            if result is None:
+                try:
+                    if query_embedding is None:
+                        query_embedding = await self.hybrid_search_service.embedding_service.agenerate_query_embedding(
+                            state['current_message']
+                        )
+                    result = self.intent_cache.lookup(state['digital_human_id'], query_embedding)
+                except Exception as e:
+                    logger.warning(f"意图缓存查询失败: {str(e)}")
+            cache_hit = result is not None
         
-        prompt = f"""
-分析以下用户消息的意图和内容类型：
-{history_context}
-当前用户消息: {state['current_message']}
-
-请基于对话历史和当前消息判断：
-1. 意图类型（information_sharing/question_asking/clarification/greeting/other）
-2. 当前对话阶段（initial/exploring/deepening/concluding）
-
-返回JSON格式：
-{{
-    "intent": "...",
-    "stage": "..."
-}}
-"""
-        
-        response = self.llm.invoke([SystemMessage(content=prompt)])
-        try:
-            result = json.loads(response.content)
-        except json.JSONDecodeError as e:
-            logger.error(f"意图识别响应解析失败: {e}")
-            logger.error(f"原始响应: {response.content}")
-            raise ValueError(f"意图识别响应格式错误: {str(e)}")
+        if result is None:
+            result = await self._classify_intent(state, prompt)
+            if self.intent_cache is not None:
+                self.intent_cache.insert_prompt(prompt, result)
+                if query_embedding is not None:
+                    self.intent_cache.insert(state['digital_human_id'], query_embedding, result)
         
         intent = result.get("intent", "other")
         conversation_stage = result.get("stage", "exploring")
         
-        # 基于意图设置是否需要提取知识
-        should_extract = False
-        if intent == "information_sharing":
-            should_extract = True
-        elif intent == "greeting":
-            should_extract = False
-        elif intent == "question_asking":
-            # 问题可能包含知识，也可能不包含
-            # 这里简单处理，如果是探索阶段的问题，可能有知识
-            should_extract = conversation_stage in ["exploring", "deepening"]
-        elif intent == "other":
-            # 对于 other 类型，基于文本长度和内容密度判断
-            # 长文本（超过100字符）或包含专业术语的文本应该提取
-            text_length = len(state['current_message'])
-            if text_length > 100:
-                should_extract = True
-                logger.debug(f"长文本({text_length}字符)被识别为需要提取知识")
-            else:
-                should_extract = False
-        else:
-            should_extract = False
+        should_extract = self._decide_should_extract(intent, conversation_stage, state['current_message'])
         
         # 意图存储在 step_results 中，不污染顶级 state
-        step_results = state.get('step_results', {}).copy()
-        step_results["intent_recognition"] = {
-            "intent": intent,
-            "should_extract": should_extract,
-            "stage": conversation_stage
+        step_results = {
+            "intent_recognition": {
+                "intent": intent,
+                "should_extract": should_extract,
+                "stage": conversation_stage,
+                "cache_hit": cache_hit
+            }
         }
         
         # 节点完成事件
@@ -268,7 +558,8 @@ class DigitalHumanTrainingService:
                 "intent": intent,
                 "stage": conversation_stage,
                 "should_extract": should_extract
-            }
+            },
+            timestamp=now
         ))
         
         completed_steps = ["intent_recognition"]
@@ -308,11 +599,8 @@ class DigitalHumanTrainingService:
             - memory_search_results: 搜索到的相关记忆
             - events: 节点执行事件列表
         """
-        events = [self._create_event(
-            "node_start",
-            "memory_search",
-            "🔍 搜索相关记忆..."
-        )]
+        now = datetime.now().isoformat()
+        events = []
 
         current_step = "searching_memory"
         thinking_process = ["正在搜索相关记忆..."]
@@ -325,7 +613,8 @@ class DigitalHumanTrainingService:
                 mode="hybrid",
                 entity_limit=5,
                 relationship_limit=3,
-                expand_graph=True
+                expand_graph=True,
+                query_embedding=state.get('query_embedding')
             )
 
             # 记录搜索统计
@@ -337,7 +626,8 @@ class DigitalHumanTrainingService:
                 {
                     "entities_count": stats.get('total_entities', 0),
                     "relationships_count": stats.get('total_relationships', 0)
-                }
+                },
+                timestamp=now
             ))
 
             thinking_process.append(f"找到 {stats.get('total_entities', 0)} 个相关记忆点")
@@ -352,13 +642,15 @@ class DigitalHumanTrainingService:
             events.append(self._create_event(
                 "memory_search_failed",
                 "memory_search",
-                "⚠️ 记忆搜索失败，继续处理"
+                "⚠️ 记忆搜索失败，继续处理",
+                timestamp=now
             ))
 
         events.append(self._create_event(
             "node_complete",
             "memory_search",
-            "✅ 记忆搜索完成"
+            "✅ 记忆搜索完成",
+            timestamp=now
         ))
 
         return {
@@ -368,6 +660,25 @@ class DigitalHumanTrainingService:
             "events": events
         }
 
+    def _route_entry(self, state: TrainingState):
+        message = state['current_message'].strip()
+        if self._is_low_signal(state):
+            return "question_generation"
+        if len(message) < _FAST_PATH_MAX_LENGTH and not _CODE_LIKE_RE.search(message):
+            return ["classify_and_ask", "memory_search"]
+        return ["embed_query", "knowledge_draft", "history_summary"]
+
+    def _route_after_fast_path(self, state: TrainingState) -> str:
+        if state.get('should_extract', False):
+            return "extract"
+        if not state.get('next_question'):
+            return "generate"
+        return "done"
+
+    def _join_intent_and_memory(self, state: TrainingState) -> Dict[str, Any]:
+        """汇合并行的意图识别、记忆搜索和知识预抽取，路由由后续条件边决定"""
+        return {"current_step": "routing"}
+
     def _route_after_search(self, state: TrainingState) -> str:
         """基于搜索结果决定下一步路由"""
         # 如果原本就需要提取知识，继续提取
@@ -383,12 +694,35 @@ class DigitalHumanTrainingService:
         else:
             return "direct"
 
+    async def _embed_query(self, state: TrainingState) -> Dict[str, Any]:
+        """为本轮消息计算一次查询向量，供随后的意图缓存查询和记忆搜索共用；失败时由两者各自回退"""
+        try:
+            query_embedding = await self.hybrid_search_service.embedding_service.agenerate_query_embedding(
+                state['current_message']
+            )
+        except Exception as e:
+            logger.warning(f"生成查询向量失败: {str(e)}")
+            query_embedding = None
+        return {"query_embedding": query_embedding}
+
+    async def _draft_knowledge(self, state: TrainingState) -> Dict[str, Any]:
+        """
+        与意图识别、记忆搜索并行的预抽取：只调用 LLM 抽取实体和关系，不生成向量、不写库。
+        路由决定提取知识时由 _extract_knowledge 直接复用，否则结果被丢弃。
+        """
+        try:
+            return {"draft_knowledge": await self.knowledge_extractor.extract(state['current_message'])}
+        except Exception as e:
+            logger.warning(f"预抽取知识失败，将在路由后重新抽取: {str(e)}")
+            return {}
+
     async def _extract_knowledge(self, state: TrainingState) -> Dict[str, Any]:
         """
         从用户消息中提取知识实体和关系。
         
         使用知识抽取器分析文本，识别实体（人物、组织、技能等）
         及其之间的关系，并将结果存储到图数据库中。
+        仅在 should_extract 为真时由路由进入。
         
         Args:
             state: 当前训练状态，必须包含 current_message 和 digital_human_id
@@ -399,56 +733,40 @@ class DigitalHumanTrainingService:
             - step_results: 包含知识抽取结果统计
             - events: 节点执行事件列表
         """
-        events = [self._create_event(
-            "node_start",
-            "knowledge_extraction",
-            "🧠 开始提取知识点..."
-        )]
+        now = datetime.now().isoformat()
+        events = []
         
         current_step = "extracting_knowledge"
         thinking_process = ["正在提取知识点..."]
         
-        if not state.get('should_extract', False):
-            extracted_knowledge = {"entities": [], "relationships": []}
-            completed_steps = ["knowledge_extraction"]
-            
-            events.append(self._create_event(
-                "node_complete",
-                "knowledge_extraction",
-                "ℹ️ 无需提取知识"
-            ))
-            
-            return {
-                "current_step": current_step,
-                "extracted_knowledge": extracted_knowledge,
-                "completed_steps": completed_steps,
-                "thinking_process": thinking_process,
-                "events": events
-            }
-        
-        # 使用 extract_with_embeddings 生成向量嵌入
+        # 完整流程已并行完成基础抽取时只需生成向量嵌入；复制条目，避免回写 embedding_id 时修改图状态
+        draft = state.get('draft_knowledge')
         extraction_result = await self.knowledge_extractor.extract_with_embeddings(
             state['current_message'],
-            state['digital_human_id']
+            state['digital_human_id'],
+            extracted={
+                "entities": [dict(entity) for entity in draft.get("entities", [])],
+                "relationships": [dict(relationship) for relationship in draft.get("relationships", [])]
+            } if draft else None
         )
         extracted_knowledge = extraction_result
 
         entity_count = len(extraction_result.get("entities", []))
         relationship_count = len(extraction_result.get("relationships", []))
 
-        # 存储实体到图数据库（现在包含embedding_id）
-        for entity in extraction_result.get("entities", []):
-            await self.graph_service.store_digital_human_entity(state['digital_human_id'], entity)
-
-        # 存储关系到图数据库（现在包含embedding_id）
-        for relationship in extraction_result.get("relationships", []):
-            await self.graph_service.store_digital_human_relationship(state['digital_human_id'], relationship)
+        # 实体和关系在同一个图数据库事务中写入
+        await self.graph_service.store_digital_human_knowledge(
+            state['digital_human_id'],
+            extraction_result.get("entities", []),
+            extraction_result.get("relationships", [])
+        )
         
-        step_results = state.get('step_results', {}).copy()
-        step_results["knowledge_extraction"] = {
-            "entities_count": entity_count,
-            "relationships_count": relationship_count,
-            "extracted": extraction_result
+        step_results = {
+            "knowledge_extraction": {
+                "entities_count": entity_count,
+                "relationships_count": relationship_count,
+                "extracted": extraction_result
+            }
         }
         
         events.append(self._create_event(
@@ -458,7 +776,8 @@ class DigitalHumanTrainingService:
             {
                 "entities_count": entity_count,
                 "relationships_count": relationship_count
-            }
+            },
+            timestamp=now
         ))
         
         completed_steps = ["knowledge_extraction"]
@@ -473,7 +792,7 @@ class DigitalHumanTrainingService:
             "events": events
         }
     
-    def _analyze_context(self, state: TrainingState) -> Dict[str, Any]:
+    async def _analyze_context(self, state: TrainingState) -> Dict[str, Any]:
         """
         分析数字人已有的知识上下文。
         
@@ -491,16 +810,17 @@ class DigitalHumanTrainingService:
             - should_explore_deeper: 是否需要深入探索
             - events: 节点执行事件列表
         """
-        events = [self._create_event(
-            "node_start",
-            "context_analysis",
-            "🔎 开始分析知识图谱上下文..."
-        )]
+        now = datetime.now().isoformat()
+        events = []
         
         current_step = "analyzing_context"
         thinking_process = ["正在分析知识图谱上下文..."]
         
-        context = self._get_current_context(state['digital_human_id'])
+        # 本轮未提取知识时，入口预取的上下文仍然有效，无需再次查询图数据库
+        if not state.get('should_extract', False) and state.get('knowledge_context'):
+            context = state['knowledge_context']
+        else:
+            context = await _aexec(self._get_current_context, state['digital_human_id'])
         knowledge_context = context
         total_knowledge_points = context.get("total_knowledge_points", 0)
         categories = context.get("categories", {})
@@ -511,11 +831,12 @@ class DigitalHumanTrainingService:
         elif total_knowledge_points > 10 and len(categories) < 3:
             should_explore_deeper = True
         
-        step_results = state.get('step_results', {}).copy()
-        step_results["context_analysis"] = {
-            "total_points": total_knowledge_points,
-            "categories_count": len(categories),
-            "should_explore_deeper": should_explore_deeper
+        step_results = {
+            "context_analysis": {
+                "total_points": total_knowledge_points,
+                "categories_count": len(categories),
+                "should_explore_deeper": should_explore_deeper
+            }
         }
         
         events.append(self._create_event(
@@ -525,7 +846,8 @@ class DigitalHumanTrainingService:
             {
                 "total_points": total_knowledge_points,
                 "categories_count": len(categories)
-            }
+            },
+            timestamp=now
         ))
         
         completed_steps = ["context_analysis"]
@@ -543,7 +865,53 @@ class DigitalHumanTrainingService:
             "events": events
         }
     
-    def _generate_question(self, state: TrainingState) -> Dict[str, Any]:
+    async def _summarize_history(self, state: TrainingState) -> Dict[str, Any]:
+        """
+        维护滚动对话摘要，与意图识别、记忆搜索并行执行。
+
+        问题生成保留最近 _SUMMARY_RAW_WINDOW 条原文；更早且尚未摘要的消息累计到
+        _SUMMARY_EVERY 条时，与已有摘要一起交给摘要模型合并，其余轮次不调用 LLM。
+        """
+        message_count = state.get('message_count', 0)
+        summarized_count = state.get('summarized_count', 0)
+        fold_until = message_count - _SUMMARY_RAW_WINDOW
+        pending = fold_until - summarized_count
+        if pending < _SUMMARY_EVERY:
+            return {"current_step": "history_summary"}
+
+        # messages 有条数上限，过早的消息可能已被截断，只能折叠仍保留的部分
+        older = state.get('messages', [])[:-_SUMMARY_RAW_WINDOW]
+        lines = []
+        for msg in older[-pending:]:
+            if isinstance(msg, dict):
+                role = "用户" if _ROLE_TO_MSG.get(msg.get("role")) is UserMessage else "助手"
+                content = msg.get("content", "")
+            elif isinstance(msg, BaseMessage):
+                role = "用户" if _ROLE_TO_MSG.get(msg.type) is UserMessage else "助手"
+                content = msg.content
+            else:
+                continue
+            lines.append(f"{role}: {content}")
+
+        prompt = _SUMMARY_PROMPT.format(
+            summary=state.get('conversation_summary') or "（无）",
+            history="\n".join(lines)
+        )
+        try:
+            response = await self.summary_llm.ainvoke([SystemMessage(content=prompt)])
+        except Exception as e:
+            # 摘要失败时保留原状，下一轮继续累计，问题生成仍有最近的原文可用
+            logger.warning(f"⚠️ 对话摘要生成失败: {e}")
+            return {"current_step": "history_summary"}
+
+        logger.info(f"📝 对话摘要已更新: 折叠 {len(lines)} 条消息")
+        return {
+            "current_step": "history_summary",
+            "conversation_summary": response.content.strip(),
+            "summarized_count": fold_until
+        }
+
+    async def _generate_question(self, state: TrainingState) -> Dict[str, Any]:
         """
         基于当前状态生成引导性问题。
         
@@ -559,11 +927,8 @@ class DigitalHumanTrainingService:
             - step_results: 包含问题生成相关信息
             - events: 节点执行事件列表
         """
-        events = [self._create_event(
-            "node_start",
-            "question_generation",
-            "❓ 开始生成引导性问题..."
-        )]
+        now = datetime.now().isoformat()
+        events = []
         
         current_step = "generating_question"
         thinking_process = ["正在生成引导性问题..."]
@@ -574,71 +939,54 @@ class DigitalHumanTrainingService:
         messages = []
         
         # 添加系统提示
-        system_prompt = f"""
-你是一个正在了解用户的数字人。基于当前对话状态，生成下一个引导性问题。
-
-{context_prompt}
-
-要求：
-1. 问题要自然、友好
-2. 根据用户刚才的回答延伸
-3. 逐步深入了解用户
-4. 不要重复已经问过的内容
-5. 基于对话历史保持连贯性
-
-生成一个引导性问题：
-"""
+        system_prompt = _QUESTION_PROMPT.format(context_prompt=context_prompt)
         messages.append(SystemMessage(content=system_prompt))
         
-        # 添加历史消息（保留最近10条）
-        recent_messages = state.get('messages', [])[-10:]
+        # 有摘要时以摘要代替较早的历史，只附上摘要之后的消息原文；否则保留最近10条
+        summary = state.get('conversation_summary')
+        if summary:
+            messages.append(SystemMessage(content=f"对话摘要: {summary}"))
+            unsummarized = state.get('message_count', 0) - state.get('summarized_count', 0)
+            history_limit = min(max(unsummarized, _SUMMARY_RAW_WINDOW), _QUESTION_HISTORY_LIMIT)
+        else:
+            history_limit = _QUESTION_HISTORY_LIMIT
+        recent_messages = state.get('messages', [])[-history_limit:]
         if recent_messages:
-            logger.debug(f"💬 包含 {len(recent_messages)} 条历史消息")
-            
             # 处理消息格式，确保都是 BaseMessage 对象
             for msg in recent_messages:
                 if isinstance(msg, BaseMessage):
                     messages.append(msg)
                 elif isinstance(msg, dict):
                     # 将字典格式转换为 BaseMessage 对象
-                    role = msg.get("role", "")
-                    content = msg.get("content", "")
-                    if role == "user" or role == "human":
-                        messages.append(UserMessage(content=content))
-                    elif role == "assistant" or role == "ai":
-                        messages.append(AssistantMessage(content=content))
-                    elif role == "system":
-                        messages.append(SystemMessage(content=content))
+                    message_cls = _ROLE_TO_MSG.get(msg.get("role", ""))
+                    if message_cls is not None:
+                        messages.append(message_cls(content=msg.get("content", "")))
                     else:
-                        logger.warning(f"⚠️ 未知消息角色: {role}")
+                        logger.warning(f"⚠️ 未知消息角色: {msg.get('role', '')}")
             
-            # 打印消息内容摘要用于调试
-            for idx, msg in enumerate(messages[-3:]):  # 只打印最近3条
-                content_preview = msg.content[:50] + "..." if len(msg.content) > 50 else msg.content
-                logger.debug(f"  消息{idx+1}: [{msg.__class__.__name__}] {content_preview}")
+        # 逐条消息日志只在调试模式下构建，避免每轮格式化整段历史
+        if settings.DEBUG:
+            logger.debug(f"🔍 传递给LLM的完整消息列表（共{len(messages)}条）：")
+            for idx, msg in enumerate(messages):
+                content_preview = msg.content[:100] + "..." if len(msg.content) > 100 else msg.content
+                logger.debug(f"  [{idx}] {msg.__class__.__name__}: {content_preview}")
+        logger.info(f"生成引导性问题: {len(messages)} 条消息, 约 {sum(len(msg.content) for msg in messages)} 字符")
         
-        # 打印完整的消息列表传递给LLM（临时调试）
-        logger.info(f"🔍 传递给LLM的完整消息列表（共{len(messages)}条）：")
-        for idx, msg in enumerate(messages):
-            content_preview = msg.content[:100] + "..." if len(msg.content) > 100 else msg.content
-            logger.info(f"  [{idx}] {msg.__class__.__name__}: {content_preview}")
-        
-        response = self.llm.invoke(messages)
+        response = await self.llm.ainvoke(messages)
         next_question = response.content.strip()
         
-        step_results = state.get('step_results', {}).copy()
-        step_results["question_generation"] = {
-            "question": next_question,
-            "based_on_stage": state.get('conversation_stage', 'exploring')
+        step_results = {
+            "question_generation": {
+                "question": next_question,
+                "based_on_stage": state.get('conversation_stage', 'exploring')
+            }
         }
         
         events.append(self._create_event(
             "node_complete",
             "question_generation",
             "✅ 问题生成完成",
-            {
-                "question": next_question[:50] + "..." if len(next_question) > 50 else next_question
-            }
+            timestamp=now
         ))
         
         completed_steps = ["question_generation"]
@@ -658,7 +1006,8 @@ class DigitalHumanTrainingService:
             "completed_steps": completed_steps,
             "thinking_process": thinking_process,
             "events": events,
-            "messages": messages  # 追加助手消息到历史
+            "messages": messages,  # 追加助手消息到历史
+            "message_count": 1
         }
     
     def _build_context_prompt(self, state: Dict[str, Any]) -> str:
@@ -710,9 +1059,13 @@ class DigitalHumanTrainingService:
         categories = state.get('categories', {})
         if categories:
             cat_summary = []
-            for cat, info in categories.items():
-                if isinstance(info, dict) and info.get("count"):
-                    cat_summary.append(f"{cat}({info['count']}个)")
+            ranked = sorted(
+                ((cat, info["count"]) for cat, info in categories.items()
+                 if isinstance(info, dict) and info.get("count")),
+                key=lambda item: (-item[1], item[0])
+            )
+            for cat, count in ranked[:5]:  # 只显示知识点最多的前5个领域
+                cat_summary.append(f"{cat}({count}个)")
             if cat_summary:
                 prompt_parts.append(f"已了解的领域: {', '.join(cat_summary)}")
 
@@ -721,63 +1074,6 @@ class DigitalHumanTrainingService:
 
         return "\n".join(prompt_parts)
     
-    async def _save_message(self, state: TrainingState) -> Dict[str, Any]:
-        """
-        保存消息到数据库。
-        
-        将用户消息和助手回复持久化到数据库中，
-        用于后续的对话历史查询和分析。
-        
-        Args:
-            state: 当前训练状态，必须包含 digital_human_id, user_id 和 current_message
-            
-        Returns:
-            更新后的状态字典，包含：
-            - messages: 更新后的消息列表（追加新消息）
-            - step_results: 包含消息保存结果
-            - events: 节点执行事件列表
-        """
-        events = [self._create_event(
-            "node_start",
-            "save_message",
-            "💾 开始保存对话记录..."
-        )]
-        
-        current_step = "saving_message"
-        thinking_process = ["正在保存对话记录..."]
-        
-        message_data = {
-            "digital_human_id": state['digital_human_id'],
-            "user_id": state['user_id'],
-            "content": state['current_message'],
-            "extracted_knowledge": state.get('extracted_knowledge', {}),
-            "conversation_stage": state.get('conversation_stage', 'exploring'),
-            "next_question": state.get('next_question', '')
-        }
-        
-        step_results = state.get('step_results', {}).copy()
-        step_results["message_saving"] = {
-            "saved": True,
-            "message_length": len(state['current_message'])
-        }
-        
-        events.append(self._create_event(
-            "node_complete",
-            "save_message",
-            "✅ 对话记录保存完成"
-        ))
-        
-        completed_steps = ["save_message"]
-        thinking_process.append("对话记录已保存")
-        
-        return {
-            "current_step": current_step,
-            "step_results": step_results,
-            "completed_steps": completed_steps,
-            "thinking_process": thinking_process,
-            "events": events
-        }
-    
     def _get_current_context(self, digital_human_id: int) -> Dict[str, Any]:
         try:
             return self.graph_service.get_digital_human_knowledge_context(digital_human_id)
@@ -790,36 +1086,24 @@ class DigitalHumanTrainingService:
         digital_human_id: int,
         user_id: int,
         question: str
-    ) -> AsyncGenerator[str, None]:
-        """保存助手消息并发送事件"""
-        assistant_msg = self.training_message_repo.create_training_message(
-            digital_human_id=digital_human_id,
-            user_id=user_id,
-            role="assistant",
-            content=question
-        )
+    ) -> AsyncGenerator[bytes, None]:
+        """保存助手消息并发送事件，与用户消息在同一事务中提交"""
+        yield _dumps({**_NODE_START_EVENTS["save_message"], "timestamp": datetime.now().isoformat()})
+        assistant_msg = (await _aexec(self.training_message_repo.create_training_messages_bulk, [{
+            "digital_human_id": digital_human_id,
+            "user_id": user_id,
+            "role": "assistant",
+            "content": question
+        }]))[0]
+        yield _dumps(self._create_event("node_complete", "save_message", "✅ 对话记录保存完成"))
         
-        yield json.dumps({
+        yield _dumps({
             "type": "assistant_question",
             "content": question,
             "metadata": {
                 "id": assistant_msg.id
             }
-        }, ensure_ascii=False)
-    
-    def _extract_next_question(self, result) -> Optional[str]:
-        """从结果中提取下一个问题"""
-        if not result:
-            return None
-            
-        # 尝试作为字典访问
-        if hasattr(result, '__getitem__') and 'next_question' in result:
-            return result['next_question']
-        # 尝试作为对象属性访问
-        elif hasattr(result, 'next_question'):
-            return result.next_question
-            
-        return None
+        })
     
     def get_training_history(
         self,
@@ -834,12 +1118,119 @@ class DigitalHumanTrainingService:
             size=size
         )
     
+    async def _relay_graph_events(
+        self,
+        state: TrainingState,
+        config: Dict[str, Any],
+        user_msg: DigitalHumanTrainingMessage,
+        outcome: Dict[str, Any]
+    ) -> AsyncGenerator[bytes, None]:
+        """执行训练图并把节点事件转换为 SSE 消息，生成的问题写入 outcome["next_question"]"""
+        question_tokens = []
+        delta_batch_size = _QUESTION_DELTA_MIN_BATCH
+
+        # 使用 astream_events 获取节点生命周期和 LLM token 事件，传入 config 以启用 checkpointer
+        async for ev in self.training_graph.astream_events(state, config, version="v2"):
+            kind = ev["event"]
+            node_name = ev.get("metadata", {}).get("langgraph_node")
+
+            # 问题生成节点的 LLM token 合并转发：首个 token 立即发出，之后批量逐步翻倍
+            if kind == "on_chat_model_stream":
+                if node_name == "question_generation":
+                    token = ev["data"]["chunk"].content
+                    if token:
+                        question_tokens.append(token)
+                        if len(question_tokens) >= delta_batch_size:
+                            yield _dumps({
+                                "type": "question_delta",
+                                "content": "".join(question_tokens)
+                            })
+                            question_tokens.clear()
+                            delta_batch_size = min(delta_batch_size * 2, _QUESTION_DELTA_MAX_BATCH)
+                continue
+
+            if question_tokens and kind == "on_chain_end" and ev["name"] == "question_generation":
+                yield _dumps({
+                    "type": "question_delta",
+                    "content": "".join(question_tokens)
+                })
+                question_tokens.clear()
+
+            # 只处理图节点本身的开始/结束事件，跳过路由函数和内部写入
+            if node_name not in _NODE_START_EVENTS or ev["name"] != node_name:
+                continue
+
+            if kind == "on_chain_start":
+                yield _dumps({**_NODE_START_EVENTS[node_name], "timestamp": datetime.now().isoformat()})
+                continue
+
+            if kind != "on_chain_end":
+                continue
+
+            # 节点输出即本节点的增量更新
+            node_state = ev["data"].get("output") or {}
+            now = datetime.now().isoformat()
+            logger.debug(f"📊 节点完成: {node_name}")
+
+            events = node_state.get('events', [])
+            completed_steps = node_state.get('completed_steps', [])
+            thinking_process = node_state.get('thinking_process', [])
+            extracted_knowledge = node_state.get('extracted_knowledge', {})
+            next_question = node_state.get('next_question', '')
+            conversation_stage = node_state.get('conversation_stage', '')
+
+            # 发送节点事件
+            for event in events:
+                if settings.DEBUG:
+                    logger.debug(f"📨 发送事件: {event.get('type')} - {event.get('node')}")
+                yield _dumps(event)
+
+            # 节点未自行发送完成事件时补发
+            emitted_completes = {e.get('node') for e in events if e.get('type') == 'node_complete'}
+            for step in completed_steps:
+                if step not in emitted_completes:
+                    yield _dumps(self._create_event(
+                        "node_complete",
+                        step,
+                        f"✅ 完成: {step}",
+                        timestamp=now
+                    ))
+
+            # 发送本节点的思考过程
+            for thought in thinking_process:
+                # thinking 事件没有 node 属性，使用简化格式
+                yield _dumps({
+                    "type": "thinking",
+                    "content": thought
+                })
+
+            # 检查知识提取
+            if extracted_knowledge and extracted_knowledge.get('entities'):
+                user_msg.extracted_knowledge = extracted_knowledge
+                user_msg.extraction_metadata = {
+                    "extraction_time": now,
+                    "stage": conversation_stage
+                }
+                yield _dumps({
+                    "type": "knowledge_extracted",
+                    "content": f"提取到 {len(extracted_knowledge.get('entities', []))} 个知识点",
+                    "metadata": {
+                        "id": user_msg.id,
+                        "entities": extracted_knowledge['entities']
+                    }
+                })
+
+            # 检查下一个问题
+            if next_question:
+                outcome["next_question"] = next_question
+                logger.info(f"✨ 找到下一个问题: {next_question[:50]}...")
+    
     async def process_training_conversation(
         self,
         digital_human_id: int,
         user_message: str,
         user_id: int
-    ) -> Generator[str, None, None]:
+    ) -> AsyncGenerator[bytes, None]:
         user_msg = None
         state = None
         
@@ -848,7 +1239,8 @@ class DigitalHumanTrainingService:
             thread_id = f"training_{digital_human_id}_{user_id}"
             
             # 保存用户消息到训练消息表
-            user_msg = self.training_message_repo.create_training_message(
+            user_msg = await _aexec(
+                self.training_message_repo.create_training_message,
                 digital_human_id=digital_human_id,
                 user_id=user_id,
                 role="user",
@@ -862,54 +1254,32 @@ class DigitalHumanTrainingService:
             if hasattr(msg_id, '_mock_name'):
                 msg_id = 100  # 默认值
                 
-            yield json.dumps({
+            yield _dumps({
                 "type": "user_message",
                 "content": user_message,
                 "metadata": {
                     "id": msg_id
                 }
-            }, ensure_ascii=False)
+            })
             
             # 配置 thread_id 用于 checkpointer
-            config = {"configurable": {"thread_id": thread_id}}
+            config = {"configurable": {"thread_id": thread_id, _TRAINING_SERVICE_KEY: self}}
             
-            # 从 checkpointer 加载历史消息
-            existing_messages = []
-            try:
-                checkpoint = self.checkpointer.get(config["configurable"])
-                if checkpoint and checkpoint.get("channel_values"):
-                    existing_messages = checkpoint["channel_values"].get("messages", [])
-                    logger.debug(f"📚 加载历史消息: {len(existing_messages)} 条")
-                    
-                    # 打印最近几条历史消息用于调试
-                    for idx, msg in enumerate(existing_messages[-3:]):
-                        if isinstance(msg, BaseMessage):
-                            content_preview = msg.content[:50] + "..." if len(msg.content) > 50 else msg.content
-                            logger.debug(f"  历史{idx+1}: [{msg.__class__.__name__}] {content_preview}")
-                        elif isinstance(msg, dict):
-                            content_preview = msg.get("content", "")[:50] + "..." if len(msg.get("content", "")) > 50 else msg.get("content", "")
-                            logger.debug(f"  历史{idx+1}: [dict:{msg.get('role', 'unknown')}] {content_preview}")
-            except Exception as e:
-                logger.warning(f"⚠️ 加载历史消息失败: {str(e)}")
-                existing_messages = []
+            knowledge_context = await _aexec(self._get_current_context, digital_human_id)
             
-            # 添加当前消息到历史（使用字典格式保持一致性）
-            existing_messages.append({
-                "role": "user",
-                "content": user_message,
-                "additional_kwargs": {}
-            })
+            # 历史消息由图的检查点恢复，输入中只带本轮用户消息，由 messages 的 reducer 追加到历史之后
             logger.debug(f"📝 添加当前用户消息: {user_message[:50]}...")
             
-            # 获取当前上下文
-            knowledge_context = self._get_current_context(digital_human_id)
-            
             state = TrainingState(
                 digital_human_id=digital_human_id,
                 user_id=user_id,
                 current_message=user_message,
-                messages=existing_messages,  # 使用从 checkpointer 加载的历史消息
+                messages=[{"role": "user", "content": user_message, "additional_kwargs": {}}],
+                message_count=1,
                 extracted_knowledge={},
+                draft_knowledge={},
+                query_embedding=None,
+                memory_search_results={},
                 knowledge_context=knowledge_context,
                 next_question="",
                 should_extract=False,
@@ -920,158 +1290,125 @@ class DigitalHumanTrainingService:
                 current_step="initializing",
                 completed_steps=[],
                 step_results={},
-                thinking_process=[],
-                events=[]
+                thinking_process=[]
             )
             
-            yield json.dumps({
+            yield _dumps({
                 "type": "thinking",
                 "content": "开始分析对话..."
-            }, ensure_ascii=False)
-            
-            # 保存最终状态
-            final_state = None
-            previous_state = None
+            })
             
-            # 使用流式获取状态更新，传入 config 以启用 checkpointer
-            # 处理流式输出
-            async for chunk in self.training_graph.astream(state, config):
-                # chunk 是 {"节点名": 节点状态} 格式
-                if chunk and isinstance(chunk, dict):
-                    logger.debug(f"📊 状态更新: {list(chunk.keys())}")
-                    
-                    # 处理每个节点的输出
-                    for node_name, node_state in chunk.items():
-                        # 跳过内部节点
-                        if node_name.startswith('__'):
-                            continue
-                            
-                        # 节点状态可能是 dict 或对象
-                        if isinstance(node_state, dict):
-                            # 从 dict 中提取字段
-                            events = node_state.get('events', [])
-                            completed_steps = node_state.get('completed_steps', [])
-                            thinking_process = node_state.get('thinking_process', [])
-                            extracted_knowledge = node_state.get('extracted_knowledge', {})
-                            next_question = node_state.get('next_question', '')
-                            conversation_stage = node_state.get('conversation_stage', '')
-                        else:
-                            # 从对象中提取字段
-                            events = getattr(node_state, 'events', [])
-                            completed_steps = getattr(node_state, 'completed_steps', [])
-                            thinking_process = getattr(node_state, 'thinking_process', [])
-                            extracted_knowledge = getattr(node_state, 'extracted_knowledge', {})
-                            next_question = getattr(node_state, 'next_question', '')
-                            conversation_stage = getattr(node_state, 'conversation_stage', '')
-                            
-                        # 发送节点事件
-                        if events:
-                            for event in events:
-                                # 发送节点内部的事件
-                                logger.debug(f"📨 发送事件: {event.get('type')} - {event.get('node')}")
-                                yield json.dumps(event, ensure_ascii=False)
-                        
-                        # 检测新完成的步骤
-                        if completed_steps:
-                            if previous_state:
-                                prev_completed = previous_state.get('completed_steps', []) if isinstance(previous_state, dict) else getattr(previous_state, 'completed_steps', [])
-                                # 找出新完成的步骤
-                                new_steps = set(completed_steps) - set(prev_completed)
-                                for step in new_steps:
-                                    # 如果事件中没有包含，才发送
-                                    if not any(e.get('type') == 'node_complete' and e.get('node') == step for e in events):
-                                        yield json.dumps(
-                                            self._create_event(
-                                                "node_complete",
-                                                step,
-                                                f"✅ 完成: {step}"
-                                            ),
-                                            ensure_ascii=False
-                                        )
-                            
-                        # 检查思考过程
-                        if thinking_process:
-                            # 发送新的思考过程
-                            if previous_state:
-                                prev_thinking = previous_state.get('thinking_process', []) if isinstance(previous_state, dict) else getattr(previous_state, 'thinking_process', [])
-                                prev_count = len(prev_thinking)
-                                new_thoughts = thinking_process[prev_count:]
-                                for thought in new_thoughts:
-                                    # thinking 事件没有 node 属性，使用简化格式
-                                    yield json.dumps({
-                                        "type": "thinking",
-                                        "content": thought
-                                    }, ensure_ascii=False)
-                            else:
-                                for thought in thinking_process:
-                                    # thinking 事件没有 node 属性，使用简化格式
-                                    yield json.dumps({
-                                        "type": "thinking",
-                                        "content": thought
-                                    }, ensure_ascii=False)
-                        
-                        # 检查知识提取
-                        if extracted_knowledge and extracted_knowledge.get('entities'):
-                            user_msg.extracted_knowledge = extracted_knowledge
-                            user_msg.extraction_metadata = {
-                                "extraction_time": datetime.now().isoformat(),
-                                "stage": conversation_stage
-                            }
-                            yield json.dumps({
-                                "type": "knowledge_extracted",
-                                "content": f"提取到 {len(extracted_knowledge.get('entities', []))} 个知识点",
-                                "metadata": {
-                                    "id": user_msg.id,
-                                    "entities": extracted_knowledge['entities']
-                                }
-                            }, ensure_ascii=False)
-                        
-                        # 检查下一个问题
-                        if next_question:
-                            final_state = node_state
-                            logger.info(f"✨ 找到下一个问题: {next_question[:50]}...")
-                        
-                        # 保存当前状态
-                        previous_state = node_state
-                    
+            # 图在后台任务中执行，经有界队列转发，客户端读取慢时节点仍可继续推进
+            outcome: Dict[str, Any] = {}
+            async for event in _buffered(self._relay_graph_events(state, config, user_msg, outcome)):
+                yield event
+            # 流中最后一个非空问题即本轮结果；不重跑整张图，避免重复调用模型和重复写入知识
+            next_question = outcome.get("next_question")
             
-            # 在流结束后，检查是否有最终状态
-            if final_state:
-                next_q = final_state.get('next_question') if isinstance(final_state, dict) else getattr(final_state, 'next_question', None)
-                if next_q:
-                    logger.info(f"🤖 从最终状态提取问题: {next_q}")
-                    async for msg in self._save_and_send_assistant_message(
-                        digital_human_id, user_id, next_q
-                    ):
-                        yield msg
+            if not next_question:
+                logger.warning("⚠️ 训练图执行完成但未生成下一个问题")
             else:
-                # 如果没有从流中获取到状态，尝试直接运行
-                logger.debug("没有从流事件中获取到最终状态，尝试直接运行...")
-                result = await self.training_graph.ainvoke(state, config)
-                next_question = self._extract_next_question(result)
-                
-                if next_question:
-                    logger.info(f"🤖 从直接运行结果提取问题: {next_question}")
-                    async for msg in self._save_and_send_assistant_message(
-                        digital_human_id, user_id, next_question
-                    ):
-                        yield msg
+                logger.info(f"🤖 发送下一个问题: {next_question}")
+                async for msg in self._save_and_send_assistant_message(
+                    digital_human_id, user_id, next_question
+                ):
+                    yield msg
             
         except Exception as e:
             import traceback
             error_detail = traceback.format_exc()
             logger.error(f"训练对话处理失败: {str(e)}\n详细错误:\n{error_detail}")
-            yield json.dumps({
+            yield _dumps({
                 "type": "error",
                 "content": f"处理失败: {str(e)}"
-            }, ensure_ascii=False)
+            })
         finally:
             # 确保 commit 总是被调用
             try:
-                self.training_message_repo.commit()
+                await _aexec(self.training_message_repo.commit)
             except Exception as commit_error:
                 logger.error(f"提交事务失败: {str(commit_error)}")
     
     
     
     
+
+
+_TRAINING_SERVICE_KEY = "training_service"
+
+
+def _delegate(name: str):
+    """生成转发到 configurable 中服务实例同名方法的节点/路由函数"""
+    if asyncio.iscoroutinefunction(getattr(DigitalHumanTrainingService, name)):
+        async def call(state: TrainingState, config: RunnableConfig):
+            return await getattr(config["configurable"][_TRAINING_SERVICE_KEY], name)(state)
+    else:
+        def call(state: TrainingState, config: RunnableConfig):
+            return getattr(config["configurable"][_TRAINING_SERVICE_KEY], name)(state)
+    call.__name__ = name
+    return call
+
+
+@functools.lru_cache()
+def _get_checkpointer(db_session_factory) -> MySQLCheckpointer:
+    """进程内共享的检查点保存器；服务按请求创建，共享后检查点缓存才能跨轮次命中"""
+    return MySQLCheckpointer(
+        db_session_factory,
+        cache_size=100,  # 缓存100个检查点
+        cache_ttl=300    # 缓存5分钟
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def _get_training_graph():
+    workflow = StateGraph(TrainingState)
+
+    workflow.add_node("classify_and_ask", _delegate("_classify_and_ask"))
+    workflow.add_node("intent_recognition", _delegate("_recognize_intent"))
+    workflow.add_node("memory_search", _delegate("_search_memory"))
+    workflow.add_node("embed_query", _delegate("_embed_query"))
+    workflow.add_node("knowledge_draft", _delegate("_draft_knowledge"))
+    workflow.add_node("knowledge_extraction", _delegate("_extract_knowledge"))
+    workflow.add_node("context_analysis", _delegate("_analyze_context"))
+    workflow.add_node("question_generation", _delegate("_generate_question"))
+    workflow.add_node("history_summary", _delegate("_summarize_history"))
+
+    workflow.add_node("routing", _delegate("_join_intent_and_memory"))
+
+    # 完整流程中意图识别（LLM）、记忆搜索（向量+图）与知识预抽取（LLM）互不依赖，并行执行后再汇合路由；
+    # 前两者都需要消息的查询向量，由 embed_query 先算一次，预抽取不必等待；滚动摘要也在这一步并行更新。
+    # 快速路径中记忆搜索与 classify_and_ask 在同一步并行，后续的知识提取和问题生成可以读到搜索结果；
+    # 汇合边还在等待意图识别，因此不会触发 routing
+    workflow.add_conditional_edges(
+        START,
+        _delegate("_route_entry"),
+        ["classify_and_ask", "memory_search", "embed_query", "knowledge_draft", "history_summary", "question_generation"]
+    )
+    workflow.add_edge("embed_query", "intent_recognition")
+    workflow.add_edge("embed_query", "memory_search")
+    workflow.add_conditional_edges(
+        "classify_and_ask",
+        _delegate("_route_after_fast_path"),
+        {
+            "extract": "knowledge_extraction",
+            "generate": "question_generation",
+            "done": END
+        }
+    )
+    workflow.add_edge(["intent_recognition", "memory_search", "knowledge_draft", "history_summary"], "routing")
+
+    workflow.add_conditional_edges(
+        "routing",
+        _delegate("_route_after_search"),
+        {
+            "extract": "knowledge_extraction",
+            "analyze": "context_analysis",
+            "direct": "question_generation"
+        }
+    )
+
+    workflow.add_edge("knowledge_extraction", "context_analysis")
+    workflow.add_edge("context_analysis", "question_generation")
+    workflow.add_edge("question_generation", END)
+
+    return workflow.compile()
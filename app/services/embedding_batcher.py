@@ -0,0 +1,34 @@
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from app.services.micro_batcher import MicroBatcher
+
+
+class EmbeddingBatcher(MicroBatcher):
+    """
+    查询向量微批处理器：并发到达的查询文本通过一次 embed_documents 调用统一请求。
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        max_batch_size: int = 64,
+        batch_wait_timeout: float = 0.01,
+        max_concurrency: int = 4
+    ):
+        super().__init__(
+            self._embed_batch,
+            max_batch_size=max_batch_size,
+            batch_wait_timeout=batch_wait_timeout,
+            max_concurrency=max_concurrency,
+            name="embedding-batcher"
+        )
+        self.embeddings = embeddings
+
+    def embed(self, text: str, timeout: Optional[float] = None) -> List[float]:
+        """提交一条查询文本并阻塞等待向量"""
+        return self.call(text, timeout)
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
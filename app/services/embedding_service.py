@@ -1,17 +1,104 @@
 import os
-from typing import List, Dict, Any, Optional
+import asyncio
+from typing import List, Dict, Any, Optional, Tuple
 import json
 import uuid
 import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+import numpy as np
 from langchain_openai import OpenAIEmbeddings
 import openai
 from app.repositories.chroma_repository import ChromaRepository
+from app.services.embedding_batcher import EmbeddingBatcher
+from app.core.config import settings
 from app.core.logger import logger
 
 
+@lru_cache()
+def _get_openai_embeddings(openai_api_key: str) -> OpenAIEmbeddings:
+    """进程内共享的 OpenAI Embeddings 客户端；EmbeddingService 按请求创建，共享后 HTTP 连接池可跨请求复用"""
+    # 使用 text-embedding-3-small 模型的默认维度 (1536)
+    return OpenAIEmbeddings(
+        openai_api_key=openai_api_key,
+        model="text-embedding-3-small",  # 默认维度 1536，更好的效果
+        timeout=30
+    )
+
+
+@lru_cache()
+def _get_query_batcher(openai_api_key: str) -> Optional[EmbeddingBatcher]:
+    """进程内共享的向量微批处理器（查询与单条文档共用）；EmbeddingService 按请求创建，批处理器需跨实例共享"""
+    if not settings.EMBEDDING_BATCH_ENABLED:
+        return None
+    return EmbeddingBatcher(
+        _get_openai_embeddings(openai_api_key),
+        max_batch_size=settings.EMBEDDING_BATCH_MAX_SIZE,
+        batch_wait_timeout=settings.EMBEDDING_BATCH_WAIT_TIMEOUT,
+        max_concurrency=settings.EMBEDDING_BATCH_MAX_CONCURRENCY
+    )
+
+
+# 进程内共享的查询向量 LRU 缓存：按文本哈希索引，向量以 float32 ndarray 存储以节省内存
+_query_embedding_cache: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+_query_embedding_cache_lock = threading.Lock()
+
+
+def _embedding_cache_key(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def _get_cached_vector(key: bytes) -> Optional[np.ndarray]:
+    with _query_embedding_cache_lock:
+        vector = _query_embedding_cache.get(key)
+        if vector is not None:
+            _query_embedding_cache.move_to_end(key)
+        return vector
+
+
+def _get_cached_embedding(key: bytes) -> Optional[List[float]]:
+    vector = _get_cached_vector(key)
+    return None if vector is None else vector.tolist()
+
+
+def _put_cached_embedding(key: bytes, embedding):
+    max_size = settings.EMBEDDING_QUERY_CACHE_SIZE
+    if max_size <= 0:
+        return
+    with _query_embedding_cache_lock:
+        _query_embedding_cache[key] = np.asarray(embedding, dtype=np.float32)
+        _query_embedding_cache.move_to_end(key)
+        while len(_query_embedding_cache) > max_size:
+            _query_embedding_cache.popitem(last=False)
+
+
+# 大批量文本拆分为多个子批并发请求，并发数受限以免触发速率限制
+_EMBED_CHUNK_SIZE = 128
+_EMBED_MAX_CONCURRENCY = 10
+
+
+def quantize_embeddings(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """按行对称量化为 int8，返回 (int8 矩阵, 每行 float32 缩放系数)，内存约为 float32 的 1/4"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    scale = np.abs(matrix).max(axis=1) / 127.0
+    # 全零向量缩放系数为 0，按 1 处理避免除零
+    safe_scale = np.where(scale > 0, scale, 1.0).astype(np.float32)
+    quantized = np.round(matrix / safe_scale[:, None]).astype(np.int8)
+    return quantized, scale.astype(np.float32)
+
+
+def dequantize_embeddings(quantized: np.ndarray, scale: np.ndarray) -> np.ndarray:
+    """还原 quantize_embeddings 的结果为 float32 矩阵"""
+    return quantized.astype(np.float32) * scale[:, None]
+
+
 class EmbeddingService:
     """增强的文本嵌入向量服务，支持实体、关系和文本块的语义表示"""
     
+    # 本进程内已校验过的 OpenAI 密钥（哈希），服务按请求创建，避免每次都请求模型列表
+    _validated_keys: set = set()
+    
     def __init__(self):
         """初始化 Embedding 服务，复用现有的 OpenAI 配置"""
         try:
@@ -20,21 +107,23 @@ class EmbeddingService:
                 raise ValueError("OPENAI_API_KEY environment variable is required")
             
             # 验证 OpenAI API 密钥
-            self._validate_openai_api_key()
-            
-            # 初始化 OpenAI Embeddings 客户端
-            # 使用 text-embedding-3-small 模型的默认维度 (1536)
-            self.embeddings = OpenAIEmbeddings(
-                openai_api_key=self.openai_api_key,
-                model="text-embedding-3-small",  # 默认维度 1536，更好的效果
-                timeout=30
-            )
+            if settings.EMBEDDING_EAGER_VALIDATE:
+                key_hash = hashlib.blake2b(self.openai_api_key.encode(), digest_size=16).hexdigest()
+                if key_hash not in EmbeddingService._validated_keys:
+                    self._validate_openai_api_key()
+                    EmbeddingService._validated_keys.add(key_hash)
+            
+            # 初始化 OpenAI Embeddings 客户端（进程内共享）
+            self.embeddings = _get_openai_embeddings(self.openai_api_key)
+            
+            self.query_batcher = _get_query_batcher(self.openai_api_key)
             
             # 初始化 ChromaDB 仓储
             self.chroma_repo = ChromaRepository()
             
-            # 初始化缓存
-            self.cache = {}
+            # 初始化缓存：按 LRU 淘汰，只保存 embedding_id 和 float32 向量，文本由调用方提供
+            self.cache: "OrderedDict[bytes, Tuple[str, np.ndarray]]" = OrderedDict()
+            self.cache_max = settings.EMBEDDING_DOC_CACHE_SIZE
             
             # 初始化 ChromaDB 集合
             self._init_collections()
@@ -72,17 +161,41 @@ class EmbeddingService:
         Returns:
             List[List[float]]: 嵌入向量列表
         """
+        if not texts:
+            return []
+        return self.generate_embeddings_np(texts).tolist()
+    
+    def generate_embeddings_np(self, texts: List[str]) -> np.ndarray:
+        """
+        生成文本嵌入向量矩阵
+        
+        Args:
+            texts: 文本列表
+            
+        Returns:
+            np.ndarray: 形状为 (len(texts), 维度) 的 float32 连续矩阵
+        """
         try:
             if not texts:
-                return []
+                return np.empty((0, 0), dtype=np.float32)
             
-            logger.debug(f"正在为 {len(texts)} 个文档生成嵌入向量")
+            # 命中缓存的文本直接复用，只为未命中的文本请求向量
+            keys = [_embedding_cache_key(text) for text in texts]
+            rows = [_get_cached_vector(key) for key in keys]
+            missing = [i for i, row in enumerate(rows) if row is None]
             
-            # 使用 Langchain 的 OpenAIEmbeddings 生成向量
-            embeddings = self.embeddings.embed_documents(texts)
+            if missing:
+                logger.debug(f"正在为 {len(missing)} 个文档生成嵌入向量（缓存命中 {len(texts) - len(missing)} 个）")
+                
+                # 使用 Langchain 的 OpenAIEmbeddings 生成向量
+                generated = self.embeddings.embed_documents([texts[i] for i in missing])
+                for i, embedding in zip(missing, generated):
+                    rows[i] = np.asarray(embedding, dtype=np.float32)
+                    _put_cached_embedding(keys[i], rows[i])
             
-            logger.info(f"成功生成 {len(embeddings)} 个嵌入向量")
-            return embeddings
+            matrix = np.stack(rows)
+            logger.info(f"成功生成 {len(matrix)} 个嵌入向量")
+            return matrix
             
         except openai.AuthenticationError:
             logger.error("OpenAI API 认证失败")
@@ -97,6 +210,19 @@ class EmbeddingService:
             logger.error(f"生成嵌入向量失败: {e}")
             raise ValueError(f"Failed to generate embeddings: {str(e)}")
     
+    def generate_embeddings_int8(self, texts: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        生成 int8 量化的文本嵌入向量，用于近似检索等对精度不敏感的场景
+        
+        Args:
+            texts: 文本列表
+            
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (int8 矩阵, 每行 float32 缩放系数)，
+            近似内积为 (q1 @ q2.T) * scale1[:, None] * scale2[None, :]
+        """
+        return quantize_embeddings(self.generate_embeddings_np(texts))
+    
     def generate_query_embedding(self, query_text: str) -> List[float]:
         """
         为查询文本生成嵌入向量
@@ -107,12 +233,21 @@ class EmbeddingService:
         Returns:
             List[float]: 查询向量
         """
+        key = _embedding_cache_key(query_text)
+        cached = _get_cached_embedding(key)
+        if cached is not None:
+            return cached
+        
         try:
             logger.debug(f"正在为查询文本生成嵌入向量: {query_text[:50]}...")
             
-            # 使用 Langchain 的 OpenAIEmbeddings 生成查询向量
-            embedding = self.embeddings.embed_query(query_text)
+            # 开启微批处理时与并发到达的查询合并为一次请求
+            if self.query_batcher is not None:
+                embedding = self.query_batcher.embed(query_text)
+            else:
+                embedding = self.embeddings.embed_query(query_text)
             
+            _put_cached_embedding(key, embedding)
             logger.debug("查询嵌入向量生成成功")
             return embedding
             
@@ -120,6 +255,22 @@ class EmbeddingService:
             logger.error(f"生成查询嵌入向量失败: {e}")
             raise ValueError(f"Failed to generate query embedding: {str(e)}")
     
+    async def agenerate_query_embedding(self, query_text: str) -> List[float]:
+        """generate_query_embedding 的异步版本，命中缓存时不切换线程，开启微批处理时直接等待批处理结果"""
+        key = _embedding_cache_key(query_text)
+        cached = _get_cached_embedding(key)
+        if cached is not None:
+            return cached
+        if self.query_batcher is None:
+            return await asyncio.to_thread(self.generate_query_embedding, query_text)
+        try:
+            embedding = await asyncio.wrap_future(self.query_batcher.submit(query_text))
+            _put_cached_embedding(key, embedding)
+            return embedding
+        except Exception as e:
+            logger.error(f"生成查询嵌入向量失败: {e}")
+            raise ValueError(f"Failed to generate query embedding: {str(e)}")
+    
     def _init_collections(self):
         """初始化 ChromaDB 集合"""
         self.chroma_repo.get_or_create_collection(
@@ -145,28 +296,20 @@ class EmbeddingService:
         
         # 缓存键包含数字人ID
         cache_key = self._get_cache_key(f"{digital_human_id}:{text}")
-        if cache_key in self.cache:
+        cached = self._cache_get(cache_key, text)
+        if cached is not None:
             logger.debug(f"Using cached embedding for entity: {entity.get('name')} (DH: {digital_human_id})")
-            return self.cache[cache_key]
+            return cached
         
         try:
-            embedding = self.embeddings.embed_documents([text])[0]
+            embedding = await self._aembed_one(text)
             
             doc_id = str(uuid.uuid4())
             
-            metadata = {
-                "digital_human_id": str(digital_human_id),  # 添加数字人ID
-                "entity_name": entity.get("name", ""),
-                "entity_types": json.dumps(entity.get("types", [])),
-                "description": entity.get("description", ""),
-                "neo4j_id": entity.get("id", ""),
-                "confidence": str(entity.get("confidence", 0.5))
-            }
-            
-            if entity.get("properties"):
-                metadata["properties"] = json.dumps(entity["properties"])
+            metadata = self._entity_metadata(entity, digital_human_id)
             
-            self.chroma_repo.add_documents(
+            await asyncio.to_thread(
+                self.chroma_repo.add_documents,
                 collection_name="entity_embeddings",
                 documents=[text],
                 metadatas=[metadata],
@@ -180,7 +323,7 @@ class EmbeddingService:
                 "text": text
             }
             
-            self.cache[cache_key] = result
+            self._cache_put(cache_key, result)
             
             logger.info(f"Created embedding for entity: {entity.get('name')} (DH: {digital_human_id})")
             return result
@@ -194,29 +337,20 @@ class EmbeddingService:
         text = self._build_relationship_text(relationship)
         
         cache_key = self._get_cache_key(f"{digital_human_id}:{text}")
-        if cache_key in self.cache:
+        cached = self._cache_get(cache_key, text)
+        if cached is not None:
             logger.debug(f"Using cached embedding for relationship (DH: {digital_human_id})")
-            return self.cache[cache_key]
+            return cached
         
         try:
-            embedding = self.embeddings.embed_documents([text])[0]
+            embedding = await self._aembed_one(text)
             
             doc_id = str(uuid.uuid4())
             
-            metadata = {
-                "digital_human_id": str(digital_human_id),  # 添加数字人ID
-                "source": relationship.get("source", ""),
-                "target": relationship.get("target", ""),
-                "relation_types": json.dumps(relationship.get("types", [])),
-                "description": relationship.get("description", ""),
-                "confidence": str(relationship.get("confidence", 0.5)),
-                "strength": str(relationship.get("strength", 0.5))
-            }
-            
-            if relationship.get("properties"):
-                metadata["properties"] = json.dumps(relationship["properties"])
+            metadata = self._relationship_metadata(relationship, digital_human_id)
             
-            self.chroma_repo.add_documents(
+            await asyncio.to_thread(
+                self.chroma_repo.add_documents,
                 collection_name="relationship_embeddings",
                 documents=[text],
                 metadatas=[metadata],
@@ -230,7 +364,7 @@ class EmbeddingService:
                 "text": text
             }
             
-            self.cache[cache_key] = result
+            self._cache_put(cache_key, result)
             
             logger.info(f"Created embedding for relationship: {relationship.get('source')} -> {relationship.get('target')}")
             return result
@@ -242,12 +376,13 @@ class EmbeddingService:
     async def embed_text_chunk(self, chunk: str, digital_human_id: int, metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """生成文本块的 embedding 并存储到 ChromaDB"""
         cache_key = self._get_cache_key(f"{digital_human_id}:{chunk}")
-        if cache_key in self.cache:
+        cached = self._cache_get(cache_key, chunk)
+        if cached is not None:
             logger.debug(f"Using cached embedding for text chunk (DH: {digital_human_id})")
-            return self.cache[cache_key]
+            return cached
         
         try:
-            embedding = self.embeddings.embed_documents([chunk])[0]
+            embedding = await self._aembed_one(chunk)
             
             doc_id = str(uuid.uuid4())
             
@@ -255,7 +390,8 @@ class EmbeddingService:
             chunk_metadata["digital_human_id"] = str(digital_human_id)
             chunk_metadata["chunk_length"] = str(len(chunk))
             
-            self.chroma_repo.add_documents(
+            await asyncio.to_thread(
+                self.chroma_repo.add_documents,
                 collection_name="text_chunk_embeddings",
                 documents=[chunk],
                 metadatas=[chunk_metadata],
@@ -269,7 +405,7 @@ class EmbeddingService:
                 "text": chunk
             }
             
-            self.cache[cache_key] = result
+            self._cache_put(cache_key, result)
             
             logger.info(f"Created embedding for text chunk (length: {len(chunk)}, DH: {digital_human_id})")
             return result
@@ -278,6 +414,102 @@ class EmbeddingService:
             logger.error(f"Failed to embed text chunk: {str(e)}")
             raise
     
+    async def _aembed_one(self, text: str) -> List[float]:
+        """为单条文档生成向量；开启微批处理时与并发到达的单条请求合并为一次 embed_documents 调用"""
+        if self.query_batcher is None:
+            return (await asyncio.to_thread(self.embeddings.embed_documents, [text]))[0]
+        return await asyncio.wrap_future(self.query_batcher.submit(text))
+    
+    async def _aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """在线程中生成文档向量；相同文本只请求一次，超过两个子批时拆分并发请求，结果顺序与输入一致"""
+        unique_texts = list(dict.fromkeys(texts))
+        
+        if len(unique_texts) <= 2 * _EMBED_CHUNK_SIZE:
+            vectors = await asyncio.to_thread(self.embeddings.embed_documents, unique_texts)
+        else:
+            semaphore = asyncio.Semaphore(_EMBED_MAX_CONCURRENCY)
+            
+            async def embed_chunk(chunk: List[str]) -> List[List[float]]:
+                async with semaphore:
+                    return await asyncio.to_thread(self.embeddings.embed_documents, chunk)
+            
+            chunks = await asyncio.gather(*(
+                embed_chunk(unique_texts[i:i + _EMBED_CHUNK_SIZE])
+                for i in range(0, len(unique_texts), _EMBED_CHUNK_SIZE)
+            ))
+            vectors = [vector for chunk in chunks for vector in chunk]
+        
+        if len(unique_texts) == len(texts):
+            return vectors
+        by_text = dict(zip(unique_texts, vectors))
+        return [by_text[text] for text in texts]
+    
+    async def embed_knowledge(
+        self,
+        entities: List[Dict[str, Any]],
+        relationships: List[Dict[str, Any]],
+        digital_human_id: int
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        为一次抽取出的全部实体和关系生成 embedding 并存储到 ChromaDB
+        
+        未命中缓存的实体和关系文本合并为一次 embeddings 请求，两个集合各写入一次
+        
+        Returns:
+            (实体结果列表, 关系结果列表)，顺序与输入一致
+        """
+        items = [
+            ("entity_embeddings", self._build_entity_text(entity), self._entity_metadata(entity, digital_human_id))
+            for entity in entities
+        ] + [
+            ("relationship_embeddings", self._build_relationship_text(rel), self._relationship_metadata(rel, digital_human_id))
+            for rel in relationships
+        ]
+        
+        results: List[Optional[Dict[str, Any]]] = []
+        pending: List[int] = []
+        for i, (_, text, _) in enumerate(items):
+            cached = self._cache_get(self._get_cache_key(f"{digital_human_id}:{text}"), text)
+            results.append(cached)
+            if cached is None:
+                pending.append(i)
+        
+        if pending:
+            try:
+                vectors = await self._aembed_documents([items[i][1] for i in pending])
+                
+                collections: Dict[str, Dict[str, list]] = {}
+                for i, vector in zip(pending, vectors):
+                    collection_name, text, metadata = items[i]
+                    doc_id = str(uuid.uuid4())
+                    batch = collections.setdefault(
+                        collection_name, {"documents": [], "metadatas": [], "ids": [], "embeddings": []}
+                    )
+                    batch["documents"].append(text)
+                    batch["metadatas"].append(metadata)
+                    batch["ids"].append(doc_id)
+                    batch["embeddings"].append(vector)
+                    results[i] = {"embedding_id": doc_id, "vector": vector, "text": text}
+                
+                await asyncio.gather(*(
+                    asyncio.to_thread(self.chroma_repo.add_documents, collection_name=collection_name, **batch)
+                    for collection_name, batch in collections.items()
+                ))
+                
+                for i in pending:
+                    self._cache_put(self._get_cache_key(f"{digital_human_id}:{items[i][1]}"), results[i])
+                
+                logger.info(
+                    f"Created {len(pending)} embeddings in one request "
+                    f"({len(entities)} entities, {len(relationships)} relationships, DH: {digital_human_id})"
+                )
+            
+            except Exception as e:
+                logger.error(f"Failed to embed knowledge: {str(e)}")
+                raise
+        
+        return results[:len(entities)], results[len(entities):]
+    
     async def batch_embed_entities(self, entities: List[Dict[str, Any]], digital_human_id: int) -> List[Dict[str, Any]]:
         """批量生成实体的 embeddings"""
         results = []
@@ -287,9 +519,9 @@ class EmbeddingService:
         uncached_texts = []
         
         for i, text in enumerate(texts):
-            cache_key = self._get_cache_key(f"{digital_human_id}:{text}")
-            if cache_key in self.cache:
-                results.append(self.cache[cache_key])
+            cached = self._cache_get(self._get_cache_key(f"{digital_human_id}:{text}"), text)
+            if cached is not None:
+                results.append(cached)
             else:
                 uncached_indices.append(i)
                 uncached_texts.append(text)
@@ -297,7 +529,7 @@ class EmbeddingService:
         
         if uncached_texts:
             try:
-                embeddings = self.embeddings.embed_documents(uncached_texts)
+                embeddings = await self._aembed_documents(uncached_texts)
                 
                 doc_ids = []
                 metadatas = []
@@ -307,19 +539,7 @@ class EmbeddingService:
                     doc_id = str(uuid.uuid4())
                     doc_ids.append(doc_id)
 
-                    metadata = {
-                        "digital_human_id": str(digital_human_id),
-                        "entity_name": entity.get("name", ""),
-                        "entity_types": json.dumps(entity.get("types", [])),
-                        "description": entity.get("description", ""),
-                        "neo4j_id": entity.get("id", ""),
-                        "confidence": str(entity.get("confidence", 0.5))
-                    }
-
-                    if entity.get("properties"):
-                        metadata["properties"] = json.dumps(entity["properties"])
-
-                    metadatas.append(metadata)
+                    metadatas.append(self._entity_metadata(entity, digital_human_id))
 
                     # embeddings 是列表的列表，第一个维度是文档，第二个维度是向量
                     embedding_vector = embeddings[idx] if len(embeddings) > idx else embeddings[0] if embeddings else []
@@ -330,11 +550,11 @@ class EmbeddingService:
                         "text": uncached_texts[idx]
                     }
 
-                    cache_key = self._get_cache_key(f"{digital_human_id}:{uncached_texts[idx]}")
-                    self.cache[cache_key] = result
+                    self._cache_put(self._get_cache_key(f"{digital_human_id}:{uncached_texts[idx]}"), result)
                     results[embedding_idx] = result
                 
-                self.chroma_repo.add_documents(
+                await asyncio.to_thread(
+                    self.chroma_repo.add_documents,
                     collection_name="entity_embeddings",
                     documents=uncached_texts,
                     metadatas=metadatas,
@@ -356,17 +576,20 @@ class EmbeddingService:
         collection: str,
         digital_human_id: int,
         k: int = 10,
-        where: Optional[Dict[str, Any]] = None
+        where: Optional[Dict[str, Any]] = None,
+        query_embedding: Optional[List[float]] = None
     ) -> List[Dict[str, Any]]:
-        """语义搜索"""
+        """语义搜索，调用方已算好查询向量时通过 query_embedding 传入，不再重复请求"""
         try:
-            query_embedding = self.embeddings.embed_query(query)
+            if query_embedding is None:
+                query_embedding = await self.agenerate_query_embedding(query)
             
             if where is None:
                 where = {}
             where["digital_human_id"] = str(digital_human_id)
             
-            results = self.chroma_repo.query_with_embedding(
+            results = await asyncio.to_thread(
+                self.chroma_repo.query_with_embedding,
                 collection_name=collection,
                 query_embedding=query_embedding,
                 n_results=k,
@@ -390,6 +613,37 @@ class EmbeddingService:
             logger.error(f"Semantic search failed: {str(e)}")
             raise
     
+    def _entity_metadata(self, entity: Dict[str, Any], digital_human_id: int) -> Dict[str, Any]:
+        """构建实体在 ChromaDB 中的元数据"""
+        metadata = {
+            "digital_human_id": str(digital_human_id),  # 添加数字人ID
+            "entity_name": entity.get("name", ""),
+            "entity_types": json.dumps(entity.get("types", [])),
+            "description": entity.get("description", ""),
+            "neo4j_id": entity.get("id", ""),
+            "confidence": str(entity.get("confidence", 0.5))
+        }
+        
+        if entity.get("properties"):
+            metadata["properties"] = json.dumps(entity["properties"])
+        return metadata
+    
+    def _relationship_metadata(self, relationship: Dict[str, Any], digital_human_id: int) -> Dict[str, Any]:
+        """构建关系在 ChromaDB 中的元数据"""
+        metadata = {
+            "digital_human_id": str(digital_human_id),  # 添加数字人ID
+            "source": relationship.get("source", ""),
+            "target": relationship.get("target", ""),
+            "relation_types": json.dumps(relationship.get("types", [])),
+            "description": relationship.get("description", ""),
+            "confidence": str(relationship.get("confidence", 0.5)),
+            "strength": str(relationship.get("strength", 0.5))
+        }
+        
+        if relationship.get("properties"):
+            metadata["properties"] = json.dumps(relationship["properties"])
+        return metadata
+    
     def _build_entity_text(self, entity: Dict[str, Any]) -> str:
         """构建实体的文本表示"""
         components = []
@@ -440,9 +694,24 @@ class EmbeddingService:
         
         return " | ".join(components)
     
-    def _get_cache_key(self, text: str) -> str:
-        """生成缓存键"""
-        return hashlib.md5(text.encode()).hexdigest()
+    def _get_cache_key(self, text: str) -> bytes:
+        """生成缓存键（16 字节 BLAKE2b 摘要）"""
+        return _embedding_cache_key(text)
+    
+    def _cache_get(self, cache_key: bytes, text: str) -> Optional[Dict[str, Any]]:
+        """命中时按 LRU 顺序刷新并还原为 {embedding_id, vector, text} 结果"""
+        entry = self.cache.get(cache_key)
+        if entry is None:
+            return None
+        self.cache.move_to_end(cache_key)
+        embedding_id, vector = entry
+        return {"embedding_id": embedding_id, "vector": vector.tolist(), "text": text}
+    
+    def _cache_put(self, cache_key: bytes, result: Dict[str, Any]):
+        self.cache[cache_key] = (result["embedding_id"], np.asarray(result["vector"], dtype=np.float32))
+        self.cache.move_to_end(cache_key)
+        while len(self.cache) > self.cache_max:
+            self.cache.popitem(last=False)
     
     def clear_cache(self):
         """清空缓存"""
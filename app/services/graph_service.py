@@ -1,6 +1,11 @@
-from typing import Dict, List, Any, Optional, Union
+from typing import Dict, List, Any, Optional, Union, Tuple
 import logging
-import json
+import orjson
+import time
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from neo4j.exceptions import ClientError
 
 from app.repositories.neomodel import (
     GraphRepository,
@@ -9,9 +14,273 @@ from app.repositories.neomodel import (
 from app.models.graph.dynamic_entity import DynamicEntity
 from app.services.knowledge_extractor import KnowledgeExtractor
 from app.services.entity_evolution import EntityEvolutionService
+from app.core.neomodel_config import transaction
+from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# 图数据库写入使用独立线程池：写入与抽取、向量化等占用默认线程池的任务互不挤占，并限制同时压向 Neo4j 的写入数
+# 写入线程与其他线程共用启动时创建的 Neo4j 驱动（见 init_neomodel），占用的是同一个受 NEO4J_MAX_CONNECTION_POOL_SIZE 约束的连接池
+_graph_write_executor = ThreadPoolExecutor(
+    max_workers=settings.NEO4J_MAX_CONCURRENT_WRITES,
+    thread_name_prefix="graph-write"
+)
+
+# 知识上下文短期缓存（进程内，按数字人隔离），写入实体时失效
+_KNOWLEDGE_CONTEXT_TTL = 5.0
+_KNOWLEDGE_CONTEXT_K = 10
+_knowledge_context_cache: Dict[int, Tuple[float, int, Dict[str, Any]]] = {}
+
+
+def _knowledge_context(results: List[List[Any]]) -> Dict[str, Any]:
+    """把 _KNOWLEDGE_CONTEXT_QUERY 按分类聚合的结果行组装成知识上下文"""
+    context = {
+        "total_knowledge_points": 0,
+        "categories": {},
+        "recent_entities": []
+    }
+    for entity_type, count, examples, recent in results or []:
+        context["total_knowledge_points"] += count
+        context["categories"][entity_type] = {
+            "count": count,
+            "examples": examples
+        }
+        if not context["recent_entities"]:
+            context["recent_entities"] = recent
+    return context
+
+
+def _loads_json(value: Any, default: Any) -> Any:
+    """解析以 JSON 字符串存储的属性，已是原生 map/list 时直接返回"""
+    if isinstance(value, str):
+        return orjson.loads(value)
+    return value or default
+
+
+def _dumps_properties(value: Any) -> str:
+    return orjson.dumps(value).decode() if value else "{}"
+
+
+def _entity_rows(entities: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [{
+        "name": entity.get("name"),
+        "type": entity.get("type", "unknown"),
+        "types": orjson.dumps(entity.get("types", [])).decode(),
+        "confidence": entity.get("confidence", 0.5),
+        "properties": _dumps_properties(entity.get("properties")),
+        "embedding_id": entity.get("embedding_id", "")
+    } for entity in entities]
+
+
+# 关系上由写入链路维护的字段，扩展属性展开存储时不能覆盖
+_RELATIONSHIP_RESERVED_KEYS = frozenset({
+    "relation_type", "confidence", "embedding_id", "updated_at", "properties", "json_keys"
+})
+
+
+def _sanitize_props(props: Optional[Dict[str, Any]]) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    把关系的扩展属性整理成 Neo4j 可直接存储的原生属性：键转为字符串，
+    标量和同类型标量列表原样保留，其余值（嵌套结构、混合列表）编码为 JSON 字符串，None 丢弃。
+    同时返回被编码的键，写入 r.json_keys，读取时只解码这些键，普通字符串属性不会被误解析
+    """
+    if not props:
+        return {}, []
+    sanitized = {}
+    json_keys = []
+    for key, value in props.items():
+        key = str(key)
+        if value is None or key in _RELATIONSHIP_RESERVED_KEYS:
+            continue
+        if isinstance(value, (str, bool, int, float)):
+            sanitized[key] = value
+        elif (isinstance(value, (list, tuple)) and value
+              and isinstance(value[0], (str, bool, int, float))
+              and all(type(item) is type(value[0]) for item in value)):
+            sanitized[key] = list(value)
+        else:
+            sanitized[key] = orjson.dumps(value).decode()
+            json_keys.append(key)
+    return sanitized, json_keys
+
+
+def _relationship_properties(stored: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """从 properties(r) 还原扩展属性，兼容旧数据中以 JSON 字符串存放的 r.properties"""
+    if not stored:
+        return {}
+    properties = _loads_json(stored.get("properties"), {})
+    json_keys = set(stored.get("json_keys") or ())
+    properties.update({
+        key: orjson.loads(value) if key in json_keys else value
+        for key, value in stored.items() if key not in _RELATIONSHIP_RESERVED_KEYS
+    })
+    return properties
+
+
+def _dedupe_relationships(relationships: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    按 (source, target) 去重，保留置信度最高的一条，避免重复行在 Neo4j 端反复加锁 MERGE
+
+    写入时按 (k1)-[r:RELATES_TO]->(k2) MERGE，relation_type 只是关系属性，同一对端点只有一条关系；
+    若按类型区分，同批次中后写入的行会直接覆盖先写入的行，而不是保留置信度最高的一条
+    """
+    seen: Dict[Tuple[Any, Any], Dict[str, Any]] = {}
+    for relationship in relationships:
+        key = (relationship.get("source"), relationship.get("target"))
+        previous = seen.get(key)
+        if previous is None or relationship.get("confidence", 0.5) > previous.get("confidence", 0.5):
+            seen[key] = relationship
+    if len(seen) < len(relationships):
+        logger.info(f"关系去重: {len(relationships)} -> {len(seen)} ({1 - len(seen) / len(relationships):.0%} 重复)")
+    return list(seen.values())
+
+
+def _relationship_rows(relationships: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    rows = []
+    for relationship in _dedupe_relationships(relationships):
+        properties, json_keys = _sanitize_props(relationship.get("properties"))
+        rows.append({
+            "source": relationship.get("source"),
+            "target": relationship.get("target"),
+            "relation_type": relationship.get("relation_type"),
+            "confidence": relationship.get("confidence", 0.5),
+            "properties": properties,
+            "json_keys": json_keys,
+            "embedding_id": relationship.get("embedding_id", "")
+        })
+    return rows
+
+
+# 批量写入时每条 UNWIND 查询携带的最大行数
+_BULK_WRITE_CHUNK_SIZE = 500
+# 大批量关系写入的并行分组数
+_RELATIONSHIP_WRITE_BINS = 4
+# 保留最近写入失败的关系行数，供排查使用
+_FAILED_RELATIONSHIPS_KEPT = 1000
+
+
+def _partition_relationships_by_endpoint(
+    rows: List[Dict[str, Any]],
+    n_bins: int
+) -> Tuple[List[List[Dict[str, Any]]], List[Dict[str, Any]]]:
+    """
+    把关系分到端点互不重叠的若干组，不同组可以并发写入而不争用同一节点。
+    两个端点已分属不同组的关系放入 conflicts，需在并行写入完成后单独写入。
+    """
+    bins: List[List[Dict[str, Any]]] = [[] for _ in range(n_bins)]
+    node_bin: Dict[Any, int] = {}
+    conflicts = []
+    for row in rows:
+        owners = {node_bin[node] for node in (row["source"], row["target"]) if node in node_bin}
+        if len(owners) > 1:
+            conflicts.append(row)
+            continue
+        index = owners.pop() if owners else min(range(n_bins), key=lambda i: len(bins[i]))
+        bins[index].append(row)
+        node_bin[row["source"]] = node_bin[row["target"]] = index
+    return bins, conflicts
+
+# 数字人训练链路上的固定查询，参数化后查询文本不变，可命中 Neo4j 的执行计划缓存
+_STORE_ENTITIES_BULK_QUERY = """
+MERGE (dh:DigitalHuman {id: $dh_id})
+WITH dh
+UNWIND $rows AS row
+MERGE (k:Knowledge {
+    name: row.name,
+    digital_human_id: $dh_id
+})
+SET k.type = row.type,
+    k.types = row.types,
+    k.confidence = row.confidence,
+    k.properties = row.properties,
+    k.embedding_id = row.embedding_id,
+    k.updated_at = datetime()
+MERGE (dh)-[r:HAS_KNOWLEDGE]->(k)
+SET r.updated_at = datetime()
+RETURN row.name AS name, elementId(k) AS id
+"""
+
+_STORE_RELATIONSHIPS_BULK_QUERY = """
+UNWIND $rows AS row
+MATCH (k1:Knowledge {
+    name: row.source,
+    digital_human_id: $dh_id
+})
+MATCH (k2:Knowledge {
+    name: row.target,
+    digital_human_id: $dh_id
+})
+MERGE (k1)-[r:RELATES_TO]->(k2)
+SET r += row.properties
+SET r.relation_type = row.relation_type,
+    r.json_keys = [key IN coalesce(r.json_keys, []) WHERE NOT key IN keys(row.properties)] + row.json_keys,
+    r.confidence = row.confidence,
+    r.embedding_id = row.embedding_id,
+    r.updated_at = datetime()
+"""
+
+# 端点已在同一事务中写入并拿到 elementId 时，直接按 ID 定位，省去按名称的索引查找
+_STORE_RELATIONSHIPS_BY_ID_QUERY = """
+UNWIND $rows AS row
+MATCH (k1:Knowledge) WHERE elementId(k1) = row.source_id
+MATCH (k2:Knowledge) WHERE elementId(k2) = row.target_id
+MERGE (k1)-[r:RELATES_TO]->(k2)
+SET r += row.properties
+SET r.relation_type = row.relation_type,
+    r.json_keys = [key IN coalesce(r.json_keys, []) WHERE NOT key IN keys(row.properties)] + row.json_keys,
+    r.confidence = row.confidence,
+    r.embedding_id = row.embedding_id,
+    r.updated_at = datetime()
+"""
+
+# 超大批量时由服务端分批提交，事务状态只与块大小相关；需要在自动提交会话中执行，不能放进显式事务
+_STORE_RELATIONSHIPS_IN_TRANSACTIONS_QUERY = """
+UNWIND $rows AS row
+CALL {
+    WITH row
+    MATCH (k1:Knowledge {
+        name: row.source,
+        digital_human_id: $dh_id
+    })
+    MATCH (k2:Knowledge {
+        name: row.target,
+        digital_human_id: $dh_id
+    })
+    MERGE (k1)-[r:RELATES_TO]->(k2)
+    SET r += row.properties
+    SET r.relation_type = row.relation_type,
+        r.json_keys = [key IN coalesce(r.json_keys, []) WHERE NOT key IN keys(row.properties)] + row.json_keys,
+        r.confidence = row.confidence,
+        r.embedding_id = row.embedding_id,
+        r.updated_at = datetime()
+} IN TRANSACTIONS OF %d ROWS
+"""
+
+_KNOWLEDGE_CONTEXT_QUERY = """
+MATCH (:DigitalHuman {id: $dh_id})-[:HAS_KNOWLEDGE]->(k:Knowledge)
+WITH k ORDER BY k.updated_at DESC, k.name
+WITH collect({name: k.name, type: coalesce(k.type, 'unknown')}) AS items
+UNWIND items AS item
+WITH items, item.type AS type, count(*) AS count, collect(item.name)[..3] AS examples
+RETURN type, count, examples, items[..$k] AS recent
+ORDER BY count DESC, type
+"""
+
+_SEARCH_MEMORIES_QUERY = """
+MATCH (dh:DigitalHuman {id: $dh_id})-[:HAS_KNOWLEDGE]->(k:Knowledge)
+WHERE (toLower(k.name) CONTAINS toLower($query)
+       OR toLower(k.properties) CONTAINS toLower($query))
+  AND ($node_types IS NULL OR k.type IN $node_types)
+RETURN k.name as id,
+       k.name as label,
+       k.type as type,
+       k.confidence as confidence,
+       k.properties as properties,
+       k.updated_at as updated_at
+ORDER BY k.confidence DESC, k.updated_at DESC
+LIMIT $limit
+"""
+
 
 class GraphService:
     
@@ -20,6 +289,8 @@ class GraphService:
         self.extracted_knowledge_repo = ExtractedKnowledgeRepository()
         self.knowledge_extractor = KnowledgeExtractor()
         self.entity_evolution = EntityEvolutionService()
+        self._parallel_runtime_supported = True
+        self._failed_relationships: deque = deque(maxlen=_FAILED_RELATIONSHIPS_KEPT)
     
     async def create_entity(
         self, 
@@ -308,121 +579,225 @@ class GraphService:
         entity: Dict[str, Any]
     ) -> bool:
         """存储数字人的知识实体到图数据库（包含embedding_id）"""
+        return await self.store_digital_human_entities_bulk(digital_human_id, [entity])
+    
+    async def store_digital_human_relationship(
+        self,
+        digital_human_id: int,
+        relationship: Dict[str, Any]
+    ) -> bool:
+        """存储数字人的知识关系到图数据库（包含embedding_id）"""
+        return await self.store_digital_human_relationships_bulk(digital_human_id, [relationship])
+    
+    async def store_digital_human_entities_bulk(
+        self,
+        digital_human_id: int,
+        entities: List[Dict[str, Any]]
+    ) -> bool:
+        """批量存储数字人的知识实体，按块执行 UNWIND 查询写入"""
+        if not entities:
+            return True
         try:
-            import json
-            query = """
-            MERGE (dh:DigitalHuman {id: $dh_id})
-            MERGE (k:Knowledge {
-                name: $name,
-                digital_human_id: $dh_id
-            })
-            SET k.type = $type,
-                k.types = $types,
-                k.confidence = $confidence,
-                k.properties = $properties,
-                k.embedding_id = $embedding_id,
-                k.updated_at = datetime()
-            MERGE (dh)-[r:HAS_KNOWLEDGE]->(k)
-            SET r.updated_at = datetime()
-            """
+            rows = _entity_rows(entities)
 
-            self.graph_repo.execute_cypher(query, {
-                "dh_id": digital_human_id,
-                "name": entity.get("name"),
-                "type": entity.get("type", "unknown"),
-                "types": json.dumps(entity.get("types", [])),
-                "confidence": entity.get("confidence", 0.5),
-                "properties": json.dumps(entity.get("properties", {})),
-                "embedding_id": entity.get("embedding_id", "")
-            })
-            
-            logger.info(f"存储数字人实体成功: {entity.get('name')} (数字人ID: {digital_human_id})")
+            await self._write_rows_chunked(_STORE_ENTITIES_BULK_QUERY, digital_human_id, rows)
+
+            _knowledge_context_cache.pop(digital_human_id, None)
+            logger.info(f"批量存储数字人实体成功: {len(rows)} 个 (数字人ID: {digital_human_id})")
             return True
-            
+
         except Exception as e:
-            logger.error(f"存储数字人实体失败: {str(e)}")
+            logger.error(f"批量存储数字人实体失败: {str(e)}")
             return False
-    
-    async def store_digital_human_relationship(
+
+    async def store_digital_human_relationships_bulk(
         self,
         digital_human_id: int,
-        relationship: Dict[str, Any]
+        relationships: List[Dict[str, Any]]
     ) -> bool:
-        """存储数字人的知识关系到图数据库（包含embedding_id）"""
+        """批量存储数字人的知识关系，按块执行 UNWIND 查询写入"""
+        if not relationships:
+            return True
         try:
-            import json
-            query = """
-            MATCH (k1:Knowledge {
-                name: $source,
-                digital_human_id: $dh_id
-            })
-            MATCH (k2:Knowledge {
-                name: $target,
-                digital_human_id: $dh_id
-            })
-            MERGE (k1)-[r:RELATES_TO]->(k2)
-            SET r.relation_type = $relation_type,
-                r.confidence = $confidence,
-                r.properties = $properties,
-                r.embedding_id = $embedding_id,
-                r.updated_at = datetime()
-            """
+            rows = _relationship_rows(relationships)
 
-            self.graph_repo.execute_cypher(query, {
-                "dh_id": digital_human_id,
-                "source": relationship.get("source"),
-                "target": relationship.get("target"),
-                "relation_type": relationship.get("relation_type"),
-                "confidence": relationship.get("confidence", 0.5),
-                "properties": json.dumps(relationship.get("properties", {})),
-                "embedding_id": relationship.get("embedding_id", "")
-            })
-            
-            logger.info(f"存储数字人关系成功: {relationship.get('source')} -> {relationship.get('target')}")
+            if len(rows) > settings.NEO4J_IN_TRANSACTIONS_THRESHOLD:
+                await self._write_rows_in_transactions(digital_human_id, rows)
+                logger.info(f"批量存储数字人关系成功（服务端分批提交）: {len(rows)} 个 (数字人ID: {digital_human_id})")
+                return True
+
+            # 写入失败的块二分重试定位坏行，失败行汇总后只记录一次
+            failures: List[Tuple[Dict[str, Any], Exception]] = []
+
+            # 超过一块时按端点互不重叠分组并行写入，避免并发事务争用同一节点的锁；冲突过多则顺序写入
+            rows_left = rows
+            if len(rows) > _BULK_WRITE_CHUNK_SIZE:
+                bins, conflicts = _partition_relationships_by_endpoint(rows, _RELATIONSHIP_WRITE_BINS)
+                if len(conflicts) <= len(rows) * 0.1:
+                    await asyncio.gather(*(
+                        self._write_rows_chunked(_STORE_RELATIONSHIPS_BULK_QUERY, digital_human_id, rows_bin, failures)
+                        for rows_bin in bins if rows_bin
+                    ))
+                    rows_left = conflicts
+            await self._write_rows_chunked(_STORE_RELATIONSHIPS_BULK_QUERY, digital_human_id, rows_left, failures)
+
+            if failures:
+                self._failed_relationships.extend(row for row, _ in failures)
+                logger.error(
+                    f"批量存储数字人关系部分失败: {len(failures)}/{len(rows)} 个 (数字人ID: {digital_human_id}), "
+                    f"示例: {[row for row, _ in failures[:3]]}, 首个错误: {failures[0][1]}"
+                )
+                return False
+
+            logger.info(f"批量存储数字人关系成功: {len(rows)} 个 (数字人ID: {digital_human_id})")
             return True
-            
+
         except Exception as e:
-            logger.error(f"存储数字人关系失败: {str(e)}")
+            logger.error(f"批量存储数字人关系失败: {str(e)}")
             return False
     
-    def get_digital_human_knowledge_context(self, digital_human_id: int) -> Dict[str, Any]:
-        """获取数字人的知识上下文（同步方法）"""
+    async def store_digital_human_knowledge(
+        self,
+        digital_human_id: int,
+        entities: List[Dict[str, Any]],
+        relationships: List[Dict[str, Any]]
+    ) -> bool:
+        """在同一个事务中写入一轮抽取出的实体和关系，只提交一次；关系依赖实体节点，先写实体
+
+        关系数量超过 NEO4J_IN_TRANSACTIONS_THRESHOLD 时，实体提交后关系改由服务端分批提交，
+        避免单个事务占用过多 Neo4j 内存。
+        训练流程写入后紧接着读取知识上下文，因此提交后在同一次线程池调用中刷新上下文缓存
+        """
+        if not entities and not relationships:
+            return True
+        entity_rows = _entity_rows(entities)
+        relationship_rows = _relationship_rows(relationships)
+        split_relationships = len(relationship_rows) > settings.NEO4J_IN_TRANSACTIONS_THRESHOLD
+
+        def run_chunked(query: str, rows: List[Dict[str, Any]]) -> List[Any]:
+            results = []
+            for start in range(0, len(rows), _BULK_WRITE_CHUNK_SIZE):
+                chunk_results, _ = self.graph_repo.execute_cypher(query, {
+                    "dh_id": digital_human_id,
+                    "rows": rows[start:start + _BULK_WRITE_CHUNK_SIZE]
+                })
+                results.extend(chunk_results or [])
+            return results
+
+        def write_in_transaction():
+            with transaction():
+                node_ids = dict(run_chunked(_STORE_ENTITIES_BULK_QUERY, entity_rows))
+                if split_relationships:
+                    return
+                by_id, by_name = [], []
+                for row in relationship_rows:
+                    source_id, target_id = node_ids.get(row["source"]), node_ids.get(row["target"])
+                    if source_id and target_id:
+                        row["source_id"], row["target_id"] = source_id, target_id
+                        by_id.append(row)
+                    else:
+                        by_name.append(row)
+                run_chunked(_STORE_RELATIONSHIPS_BY_ID_QUERY, by_id)
+                run_chunked(_STORE_RELATIONSHIPS_BULK_QUERY, by_name)
+
+        def write():
+            write_in_transaction()
+            _knowledge_context_cache.pop(digital_human_id, None)
+            try:
+                results, _ = self._read_cypher(
+                    _KNOWLEDGE_CONTEXT_QUERY, {"dh_id": digital_human_id, "k": _KNOWLEDGE_CONTEXT_K}
+                )
+            except Exception as e:
+                logger.warning(f"刷新数字人知识上下文失败: {str(e)}")
+                return
+            _knowledge_context_cache[digital_human_id] = (
+                time.monotonic() + _KNOWLEDGE_CONTEXT_TTL, _KNOWLEDGE_CONTEXT_K, _knowledge_context(results)
+            )
+
         try:
-            query = """
-            MATCH (dh:DigitalHuman {id: $dh_id})-[:HAS_KNOWLEDGE]->(k:Knowledge)
-            RETURN k.name as name, k.type as type, k.properties as properties
-            ORDER BY k.updated_at DESC
-            LIMIT 100
-            """
-            
-            results, _ = self.graph_repo.execute_cypher(query, {"dh_id": digital_human_id})
-            
-            context = {
-                "total_knowledge_points": 0,
-                "categories": {},
-                "recent_entities": []
-            }
-            
-            for row in results:
-                context["total_knowledge_points"] += 1
-                
-                entity_type = row.get("type", "unknown")
-                if entity_type not in context["categories"]:
-                    context["categories"][entity_type] = {
-                        "count": 0,
-                        "examples": []
-                    }
-                
-                context["categories"][entity_type]["count"] += 1
-                if len(context["categories"][entity_type]["examples"]) < 3:
-                    context["categories"][entity_type]["examples"].append(row.get("name"))
-                
-                if len(context["recent_entities"]) < 10:
-                    context["recent_entities"].append({
-                        "name": row.get("name"),
-                        "type": entity_type
-                    })
+            await asyncio.get_running_loop().run_in_executor(_graph_write_executor, write)
+            if split_relationships:
+                await self._write_rows_in_transactions(digital_human_id, relationship_rows)
+            logger.info(
+                f"存储数字人知识成功: {len(entities)} 个实体, {len(relationships)} 个关系 (数字人ID: {digital_human_id})"
+            )
+            return True
+
+        except Exception as e:
+            logger.error(f"存储数字人知识失败: {str(e)}")
+            return False
+    
+    async def _write_rows_chunked(
+        self,
+        query: str,
+        digital_human_id: int,
+        rows: List[Dict[str, Any]],
+        failures: Optional[List[Tuple[Dict[str, Any], Exception]]] = None
+    ):
+        """
+        各块在同一个会话中依次提交，省去每块单独借出连接、创建会话的开销。
+        传入 failures 时块失败不抛出，而是对半拆分重试，把最终失败的单行及其异常收集到 failures 中
+        """
+        if not rows:
+            return
+
+        def write_rows(session, chunk: List[Dict[str, Any]]):
+            try:
+                self.graph_repo.execute_query_on(session, query, {"dh_id": digital_human_id, "rows": chunk})
+            except Exception as e:
+                if failures is None:
+                    raise
+                if len(chunk) == 1:
+                    failures.append((chunk[0], e))
+                    return
+                middle = len(chunk) // 2
+                write_rows(session, chunk[:middle])
+                write_rows(session, chunk[middle:])
+
+        def write():
+            with self.graph_repo.session() as session:
+                for start in range(0, len(rows), _BULK_WRITE_CHUNK_SIZE):
+                    write_rows(session, rows[start:start + _BULK_WRITE_CHUNK_SIZE])
+
+        await asyncio.get_running_loop().run_in_executor(_graph_write_executor, write)
+    
+    async def _write_rows_in_transactions(self, digital_human_id: int, rows: List[Dict[str, Any]]):
+        """整批关系交给一条 CALL { ... } IN TRANSACTIONS 查询，在自动提交会话中执行"""
+        query = _STORE_RELATIONSHIPS_IN_TRANSACTIONS_QUERY % settings.NEO4J_RELATIONSHIP_COMMIT_CHUNK
+        await asyncio.get_running_loop().run_in_executor(_graph_write_executor, self.graph_repo.execute_cypher, query, {
+            "dh_id": digital_human_id,
+            "rows": rows
+        })
+
+    def _read_cypher(self, query: str, params: Dict[str, Any]) -> tuple:
+        """
+        执行只读查询。开启 NEO4J_PARALLEL_RUNTIME_ENABLED 时使用并行运行时；
+        并行运行时只支持只读查询，且仅企业版可用，服务端不支持时回退到默认运行时并记住结果
+        """
+        if settings.NEO4J_PARALLEL_RUNTIME_ENABLED and self._parallel_runtime_supported:
+            try:
+                return self.graph_repo.execute_cypher("CYPHER runtime=parallel " + query, params)
+            except ClientError as e:
+                if "runtime" not in str(e.message or e).lower():
+                    raise
+                self._parallel_runtime_supported = False
+                logger.warning(f"Neo4j 不支持并行运行时，回退到默认运行时: {e.message or e}")
+        return self.graph_repo.execute_cypher(query, params)
+
+    def get_digital_human_knowledge_context(self, digital_human_id: int, k: int = _KNOWLEDGE_CONTEXT_K) -> Dict[str, Any]:
+        """获取数字人的知识上下文（同步方法）
+
+        分类统计在 Neo4j 端聚合完成，只返回每个分类的计数、前3个示例和最近的 k 个实体，
+        结果按固定顺序排列，保证生成的提示词稳定。结果短期缓存，写入实体时失效。
+        """
+        cached = _knowledge_context_cache.get(digital_human_id)
+        if cached and cached[1] == k and time.monotonic() < cached[0]:
+            return cached[2]
+        try:
+            results, _ = self._read_cypher(_KNOWLEDGE_CONTEXT_QUERY, {"dh_id": digital_human_id, "k": k})
+            context = _knowledge_context(results)
             
+            _knowledge_context_cache[digital_human_id] = (time.monotonic() + _KNOWLEDGE_CONTEXT_TTL, k, context)
             return context
             
         except Exception as e:
@@ -500,7 +875,7 @@ class GraphService:
                     "type": node_type,
                     "size": size,
                     "confidence": confidence,
-                    "properties": json.loads(properties) if isinstance(properties, str) else properties or {},
+                    "properties": _loads_json(properties, {}),
                     "updated_at": str(updated_at) if updated_at else None
                 })
                 node_names.add(node_id)
@@ -515,7 +890,7 @@ class GraphService:
                        k2.name as target,
                        r.relation_type as type,
                        r.confidence as confidence,
-                       r.properties as properties
+                       properties(r) as properties
                 LIMIT $limit
                 """
                 
@@ -532,14 +907,14 @@ class GraphService:
                     target = row[1] if len(row) > 1 else None
                     rel_type = row[2] if len(row) > 2 else "RELATES_TO"
                     rel_confidence = row[3] if len(row) > 3 else 0.5
-                    rel_properties = row[4] if len(row) > 4 else "{}"
+                    rel_properties = row[4] if len(row) > 4 else {}
                     
                     edges.append({
                         "source": source,
                         "target": target,
                         "type": rel_type,
                         "confidence": rel_confidence,
-                        "properties": json.loads(rel_properties) if isinstance(rel_properties, str) else rel_properties or {}
+                        "properties": _relationship_properties(rel_properties)
                     })
             
             # 获取总体统计信息
@@ -593,28 +968,10 @@ class GraphService:
     ) -> Dict[str, Any]:
         """搜索数字人的记忆节点"""
         try:
-            type_filter = ""
-            if node_types:
-                type_filter = f"AND k.type IN {node_types}"
-            
-            search_query = f"""
-            MATCH (dh:DigitalHuman {{id: $dh_id}})-[:HAS_KNOWLEDGE]->(k:Knowledge)
-            WHERE toLower(k.name) CONTAINS toLower($query) 
-                  OR toLower(k.properties) CONTAINS toLower($query)
-                  {type_filter}
-            RETURN k.name as id,
-                   k.name as label,
-                   k.type as type,
-                   k.confidence as confidence,
-                   k.properties as properties,
-                   k.updated_at as updated_at
-            ORDER BY k.confidence DESC, k.updated_at DESC
-            LIMIT $limit
-            """
-            
-            results, _ = self.graph_repo.execute_cypher(search_query, {
+            results, _ = self._read_cypher(_SEARCH_MEMORIES_QUERY, {
                 "dh_id": digital_human_id,
                 "query": query,
+                "node_types": node_types or None,
                 "limit": limit
             })
             
@@ -627,7 +984,7 @@ class GraphService:
                 properties = row[4] if len(row) > 4 else "{}"
                 updated_at = row[5] if len(row) > 5 else None
                 
-                parsed_props = json.loads(properties) if isinstance(properties, str) else properties or {}
+                parsed_props = _loads_json(properties, {})
                 
                 nodes.append({
                     "id": node_id,
@@ -689,8 +1046,8 @@ class GraphService:
                 "label": row[1] if len(row) > 1 else "",
                 "type": row[2] if len(row) > 2 else "unknown",
                 "confidence": row[3] if len(row) > 3 else 0.5,
-                "properties": json.loads(row[4]) if isinstance(row[4], str) else row[4] or {},
-                "types": json.loads(row[5]) if isinstance(row[5], str) else row[5] or [],
+                "properties": _loads_json(row[4], {}),
+                "types": _loads_json(row[5], []),
                 "updated_at": str(row[6]) if len(row) > 6 and row[6] else None
             }
             
@@ -708,7 +1065,7 @@ class GraphService:
                        k2.type as target_type,
                        k2.properties as target_props,
                        r[0].confidence as rel_confidence,
-                       r[0].properties as rel_props
+                       properties(r[0]) as rel_props
                 LIMIT 100
                 """
                 
@@ -723,9 +1080,9 @@ class GraphService:
                     source = row[1] if len(row) > 1 else None
                     target = row[2] if len(row) > 2 else None
                     target_type = row[3] if len(row) > 3 else "unknown"
-                    target_props = json.loads(row[4]) if isinstance(row[4], str) else row[4] or {}
+                    target_props = _loads_json(row[4], {})
                     rel_confidence = row[5] if len(row) > 5 else 0.5
-                    rel_props = json.loads(row[6]) if isinstance(row[6], str) else row[6] or {}
+                    rel_props = _relationship_properties(row[6])
                     
                     relations.append({
                         "type": rel_type,
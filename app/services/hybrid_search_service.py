@@ -20,13 +20,16 @@ class HybridSearchService:
         mode: str = "hybrid",
         entity_limit: int = 20,
         relationship_limit: int = 10,
-        expand_graph: bool = True
+        expand_graph: bool = True,
+        query_embedding: Optional[List[float]] = None
     ) -> Dict[str, Any]:
         """
         搜索模式：
         - semantic: 仅语义搜索
         - graph: 仅图搜索
         - hybrid: 混合搜索（默认）
+
+        查询向量只计算一次，实体与关系的语义搜索共用；调用方已有时通过 query_embedding 传入
         """
         
         results = {
@@ -39,12 +42,16 @@ class HybridSearchService:
         
         try:
             if mode in ["semantic", "hybrid"]:
+                if query_embedding is None:
+                    query_embedding = await self.embedding_service.agenerate_query_embedding(query)
+                
                 # 语义搜索实体
                 semantic_entities = await self.embedding_service.semantic_search(
                     query=query,
                     collection="entity_embeddings",
                     digital_human_id=digital_human_id,
-                    k=entity_limit
+                    k=entity_limit,
+                    query_embedding=query_embedding
                 )
                 
                 # 处理语义搜索结果
@@ -64,7 +71,8 @@ class HybridSearchService:
                     query=query,
                     collection="relationship_embeddings",
                     digital_human_id=digital_human_id,
-                    k=relationship_limit
+                    k=relationship_limit,
+                    query_embedding=query_embedding
                 )
                 
                 for rel in semantic_relations:
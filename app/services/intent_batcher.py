@@ -0,0 +1,36 @@
+from typing import Any, List, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import SystemMessage
+
+from app.services.micro_batcher import MicroBatcher
+
+
+class IntentBatcher(MicroBatcher):
+    """
+    意图识别微批处理器：并发到达的意图识别提示词通过一次 llm.batch 调用统一发出。
+    """
+
+    def __init__(
+        self,
+        llm: BaseChatModel,
+        max_batch_size: int = 8,
+        batch_wait_timeout: float = 0.05,
+        max_concurrency: int = 4
+    ):
+        super().__init__(
+            self._classify_batch,
+            max_batch_size=max_batch_size,
+            batch_wait_timeout=batch_wait_timeout,
+            max_concurrency=max_concurrency,
+            name="intent-batcher"
+        )
+        self.llm = llm
+
+    def classify(self, prompt: str, timeout: Optional[float] = None) -> Any:
+        """提交一次意图识别并阻塞等待模型响应"""
+        return self.call(prompt, timeout)
+
+    def _classify_batch(self, prompts: List[str]) -> List[Any]:
+        # 逐项返回异常，单个提示词失败不影响同批其他调用方
+        return self.llm.batch([[SystemMessage(content=prompt)] for prompt in prompts], return_exceptions=True)
@@ -0,0 +1,86 @@
+import hashlib
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+class IntentCache:
+    """
+    意图识别语义缓存。
+
+    按数字人隔离，以用户消息的嵌入向量为键；与已缓存消息的余弦相似度达到阈值即视为命中，
+    直接复用之前识别出的意图和对话阶段，省去一次 LLM 调用。
+    另有按完整提示词（含对话历史）哈希的精确缓存（TTL + LRU），命中时连嵌入计算也可省去。
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.95,
+        ttl: int = 3600,
+        max_entries: int = 256,
+        max_prompts: int = 2048
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_prompts = max_prompts
+        self._entries: Dict[int, Deque[Tuple[float, np.ndarray, Dict[str, Any]]]] = {}
+        self._prompts: "OrderedDict[bytes, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    def lookup(self, digital_human_id: int, embedding: List[float]) -> Optional[Dict[str, Any]]:
+        entries = self._entries.get(digital_human_id)
+        if not entries:
+            return None
+
+        # 所有条目 TTL 相同，队首总是最早过期的
+        now = time.monotonic()
+        while entries and entries[0][0] <= now:
+            entries.popleft()
+        if not entries:
+            return None
+
+        scores = np.stack([vec for _, vec, _ in entries]) @ self._normalize(embedding)
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+        return dict(entries[best][2])
+
+    def insert(self, digital_human_id: int, embedding: List[float], result: Dict[str, Any]):
+        entries = self._entries.get(digital_human_id)
+        if entries is None:
+            entries = self._entries[digital_human_id] = deque(maxlen=self.max_entries)
+        entries.append((time.monotonic() + self.ttl, self._normalize(embedding), dict(result)))
+
+    def lookup_prompt(self, prompt: str) -> Optional[Dict[str, Any]]:
+        key = self._prompt_key(prompt)
+        entry = self._prompts.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._prompts[key]
+            return None
+        self._prompts.move_to_end(key)
+        return dict(entry[1])
+
+    def insert_prompt(self, prompt: str, result: Dict[str, Any]):
+        key = self._prompt_key(prompt)
+        self._prompts[key] = (time.monotonic() + self.ttl, dict(result))
+        self._prompts.move_to_end(key)
+        while len(self._prompts) > self.max_prompts:
+            self._prompts.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+        self._prompts.clear()
+
+    @staticmethod
+    def _prompt_key(prompt: str) -> bytes:
+        return hashlib.blake2b(prompt.encode(), digest_size=16).digest()
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
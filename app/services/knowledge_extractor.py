@@ -57,33 +57,30 @@ class KnowledgeExtractor:
         
         return {"entities": [], "relationships": []}
     
-    async def extract_with_embeddings(self, text: str, digital_human_id: int) -> Dict[str, Any]:
-        """抽取知识并生成 embeddings"""
+    async def extract_with_embeddings(
+        self,
+        text: str,
+        digital_human_id: int,
+        extracted: Optional[Dict[str, List]] = None
+    ) -> Dict[str, Any]:
+        """抽取知识并生成 embeddings；传入已完成的基础抽取结果 extracted 时跳过 LLM 抽取"""
         
         # 1. 基础抽取
-        result = await self.extract(text)
+        result = await self.extract(text) if extracted is None else extracted
         
-        # 2. 为每个实体生成 embedding
-        for entity in result['entities']:
-            try:
-                embedding_result = await self.embedding_service.embed_entity(entity, digital_human_id)
-                entity['embedding_id'] = embedding_result['embedding_id']
-                logger.debug(f"Generated embedding for entity: {entity['name']} (DH: {digital_human_id})")
-            except Exception as e:
-                logger.error(f"Failed to generate embedding for entity {entity['name']}: {str(e)}")
-                entity['embedding_id'] = None
-        
-        # 3. 为每个关系生成 embedding
-        for relationship in result['relationships']:
-            try:
-                embedding_result = await self.embedding_service.embed_relationship(relationship, digital_human_id)
-                relationship['embedding_id'] = embedding_result['embedding_id']
-                logger.debug(f"Generated embedding for relationship: {relationship['source']} -> {relationship['target']} (DH: {digital_human_id})")
-            except Exception as e:
-                logger.error(f"Failed to generate embedding for relationship: {str(e)}")
-                relationship['embedding_id'] = None
+        # 2. 全部实体和关系的 embedding 合并为一次请求生成，失败时 embedding_id 置为 None
+        try:
+            entity_embeddings, relationship_embeddings = await self.embedding_service.embed_knowledge(
+                result['entities'], result['relationships'], digital_human_id
+            )
+        except Exception as e:
+            logger.error(f"Failed to generate embeddings (DH: {digital_human_id}): {str(e)}")
+            entity_embeddings = [None] * len(result['entities'])
+            relationship_embeddings = [None] * len(result['relationships'])
+        for item, embedding in zip(result['entities'] + result['relationships'], entity_embeddings + relationship_embeddings):
+            item['embedding_id'] = embedding['embedding_id'] if embedding else None
         
-        # 4. 可选：为原始文本生成 embedding
+        # 3. 可选：为原始文本生成 embedding
         if self.config.log_intermediate_results:
             try:
                 text_embedding = await self.embedding_service.embed_text_chunk(
@@ -8,7 +8,7 @@ from langgraph.graph import StateGraph, END
 from app.core.checkpointer import MySQLCheckpointer
 from app.core.database import get_db
 from pydantic import BaseModel
-import json
+import orjson
 import uuid
 import openai
 from app.core.models import DigitalHuman
@@ -443,7 +443,7 @@ class LangGraphService:
                             "description": r.get("description", "")
                         })
 
-                yield json.dumps({
+                yield orjson.dumps({
                     "type": "memory",
                     "content": f"找到 {len(entities)} 个实体和 {len(relationships)} 个关系",
                     "metadata": {
@@ -453,7 +453,7 @@ class LangGraphService:
                         "entities": simplified_entities,
                         "relationships": simplified_relationships
                     }
-                }, ensure_ascii=False)
+                }).decode()
 
             # 2. 流式生成响应
             for chunk in self._generate_ai_response_stream(state):
@@ -487,36 +487,36 @@ class LangGraphService:
             )
             
         except openai.AuthenticationError:
-            yield json.dumps({
+            yield orjson.dumps({
                 "type": "error",
                 "content": "Invalid OpenAI API key. Please check your API configuration."
-            })
+            }).decode()
         except openai.RateLimitError:
-            yield json.dumps({
+            yield orjson.dumps({
                 "type": "error", 
                 "content": "OpenAI API rate limit exceeded. Please try again later."
-            })
+            }).decode()
         except openai.APIError as e:
             if "invalid_api_key" in str(e).lower():
-                yield json.dumps({
+                yield orjson.dumps({
                     "type": "error",
                     "content": "Invalid OpenAI API key"
-                })
+                }).decode()
             else:
-                yield json.dumps({
+                yield orjson.dumps({
                     "type": "error",
                     "content": f"OpenAI API error: {str(e)}"
-                })
+                }).decode()
         except ConnectionError:
-            yield json.dumps({
+            yield orjson.dumps({
                 "type": "error",
                 "content": "Network connection failed. Please check your internet connection."
-            })
+            }).decode()
         except Exception as e:
-            yield json.dumps({
+            yield orjson.dumps({
                 "type": "error",
                 "content": f"Chat error: {str(e)}"
-            })
+            }).decode()
     
     def get_conversation_history(self, thread_id: str) -> List[Dict[str, Any]]:
         """获取对话历史"""
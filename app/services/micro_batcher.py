@@ -0,0 +1,87 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+
+class MicroBatcher:
+    """
+    通用微批处理器。
+
+    进程内共享：在短时间窗口内收集并发到达的请求，合并相同请求后通过一次 batch_fn 调用统一发出，
+    再把结果分发回各自的调用方。同步调用方可直接阻塞等待 call，异步调用方通过
+    asyncio.wrap_future(submit(...)) 等待；因此使用后台线程 + Future，而不是绑定某个事件循环的 asyncio 队列。
+
+    batch_fn 接收去重后的请求列表，按顺序返回结果；某一项的结果是异常时只投递给该项的调用方，
+    batch_fn 本身抛出异常时投递给整批调用方。
+    收集好的批次交给小线程池发出，最多 max_concurrency 个请求同时在途，某个请求变慢或挂起时收集线程仍在继续组批。
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Hashable]], Sequence[Any]],
+        max_batch_size: int,
+        batch_wait_timeout: float,
+        max_concurrency: int = 4,
+        name: str = "micro-batcher"
+    ):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.batch_wait_timeout = batch_wait_timeout
+        self.name = name
+        self._queue: "queue.Queue[Tuple[Hashable, Future]]" = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix=f"{name}-dispatch")
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def call(self, item: Hashable, timeout: Optional[float] = None) -> Any:
+        """提交一个请求并阻塞等待结果"""
+        return self.submit(item).result(timeout)
+
+    def submit(self, item: Hashable) -> Future:
+        future: Future = Future()
+        self._ensure_worker()
+        self._queue.put((item, future))
+        return future
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_wait_timeout
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._executor.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch: List[Tuple[Hashable, Future]]):
+        # 相同请求（如无历史的问候语、重复的查询文本）只发出一次
+        waiters: Dict[Hashable, List[Future]] = {}
+        for item, future in batch:
+            waiters.setdefault(item, []).append(future)
+
+        items = list(waiters)
+        try:
+            results = self.batch_fn(items)
+        except Exception as e:
+            results = [e] * len(items)
+
+        for item, result in zip(items, results):
+            for future in waiters[item]:
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
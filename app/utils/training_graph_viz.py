@@ -0,0 +1,30 @@
+from pathlib import Path
+from typing import Optional
+
+from app.core.logger import logger
+
+
+def save_graph_visualization(compiled_graph, output_dir: str = "graph_visualizations") -> Optional[str]:
+    """保存工作流图的可视化，优先 PNG，失败时退回 Mermaid"""
+    Path(output_dir).mkdir(exist_ok=True)
+    graph = compiled_graph.get_graph()
+
+    # 1. 尝试生成 PNG 图片
+    png_path = f"{output_dir}/training_graph.png"
+    try:
+        graph.draw_png(output_file_path=png_path)
+        logger.info(f"✅ 图已保存为 PNG: {png_path}")
+        return png_path
+    except Exception:
+        logger.debug("PNG 生成失败，尝试 Mermaid 格式")
+
+    # 2. 备选方案：保存 Mermaid
+    try:
+        mermaid_path = f"{output_dir}/training_graph.mmd"
+        Path(mermaid_path).write_text(graph.draw_mermaid())
+        logger.info(f"✅ 图已保存为 Mermaid: {mermaid_path}")
+        logger.info("📊 可在 https://mermaid.live 查看")
+        return mermaid_path
+    except Exception as e:
+        logger.error(f"❌ 无法生成任何可视化: {e}")
+        return None
@@ -60,16 +60,12 @@ class TestEmbeddingGraphIntegration:
         stored_entities = []
         stored_relationships = []
 
-        async def store_entity(dh_id, entity):
-            stored_entities.append(entity)
+        async def store_knowledge(dh_id, entities, rels):
+            stored_entities.extend(entities)
+            stored_relationships.extend(rels)
             return True
 
-        async def store_relationship(dh_id, rel):
-            stored_relationships.append(rel)
-            return True
-
-        mock_graph_service.store_digital_human_entity = AsyncMock(side_effect=store_entity)
-        mock_graph_service.store_digital_human_relationship = AsyncMock(side_effect=store_relationship)
+        mock_graph_service.store_digital_human_knowledge = AsyncMock(side_effect=store_knowledge)
         mock_graph_service.get_digital_human_knowledge_context = Mock(return_value={
             "total_knowledge_points": 2,
             "categories": {}
@@ -151,7 +147,8 @@ class TestEmbeddingGraphIntegration:
             mode="hybrid",
             entity_limit=5,
             relationship_limit=3,
-            expand_graph=True
+            expand_graph=True,
+            query_embedding=None
         )
 
     @pytest.mark.asyncio
@@ -161,11 +158,11 @@ class TestEmbeddingGraphIntegration:
         # Mock embedding服务
         mock_embedding_service = AsyncMock()
         generated_embed_id = "consistent-embed-123"
-        mock_embedding_service.embed_entity = AsyncMock(return_value={
+        mock_embedding_service.embed_knowledge = AsyncMock(return_value=([{
             "embedding_id": generated_embed_id,
             "vector": [0.1, 0.2, 0.3],
             "text": "Entity: Test"
-        })
+        }], []))
 
         # Mock 知识提取器使用真实的embedding服务
         knowledge_extractor = KnowledgeExtractor()
@@ -184,9 +181,9 @@ class TestEmbeddingGraphIntegration:
         assert result["entities"][0]["embedding_id"] == generated_embed_id
 
         # 验证embedding服务被正确调用
-        mock_embedding_service.embed_entity.assert_called_once()
-        call_args = mock_embedding_service.embed_entity.call_args
-        assert call_args[0][1] == 456  # digital_human_id
+        mock_embedding_service.embed_knowledge.assert_called_once()
+        call_args = mock_embedding_service.embed_knowledge.call_args
+        assert call_args[0][2] == 456  # digital_human_id
 
     @pytest.mark.asyncio
     async def test_search_with_embedding_enrichment(self):
@@ -5,6 +5,7 @@ from app.services.langgraph_service import LangGraphService
 from app.services.conversation_service import ConversationService
 from app.core.messages import UserMessage, AssistantMessage
 from app.core.models import Message, DigitalHuman
+from app.core.checkpointer import MySQLCheckpointer
 from app.schemas.conversation import ConversationCreate, MessageResponse
 import json
 
@@ -270,4 +271,112 @@ class TestCheckpointerIntegration:
                         first_result = json.loads(results[0])
                         assert first_result["type"] == "memory"
                         assert "3 个相关记忆" in first_result["content"]
-                        assert first_result["metadata"]["has_memory"] is True
\ No newline at end of file
+                        assert first_result["metadata"]["has_memory"] is True
+
+class TestMySQLCheckpointerCache:
+
+    def _checkpoint(self, content: str):
+        return {"v": 1, "channel_values": {"messages": [{"role": "user", "content": content}]}}
+
+    def test_cache_evicts_least_recent_over_byte_budget(self):
+        checkpointer = MySQLCheckpointer(Mock(), cache_max_bytes=400)
+        checkpointer._put_to_cache("a", self._checkpoint("x" * 100))
+        checkpointer._put_to_cache("b", self._checkpoint("y" * 100))
+        checkpointer._get_from_cache("a")
+        checkpointer._put_to_cache("c", self._checkpoint("z" * 100))
+
+        assert checkpointer._get_from_cache("b") is None
+        assert checkpointer._get_from_cache("a") is not None
+        assert checkpointer._get_from_cache("c") is not None
+        assert checkpointer._cache_bytes <= 400
+
+    def test_cache_respects_entry_limit_and_skips_oversized(self):
+        checkpointer = MySQLCheckpointer(Mock(), cache_size=2, cache_max_bytes=1000)
+        for thread_id in ("a", "b", "c"):
+            checkpointer._put_to_cache(thread_id, self._checkpoint(thread_id))
+        checkpointer._put_to_cache("big", self._checkpoint("x" * 2000))
+
+        assert list(checkpointer._cache) == ["thread:b:latest", "thread:c:latest"]
+
+        checkpointer.clear_cache("b")
+        assert checkpointer._cache_bytes == checkpointer._cache_sizes["thread:c:latest"]
+
+    def test_put_writes_through_to_cache(self):
+        db = Mock()
+        db.query.return_value.filter.return_value.order_by.return_value.first.return_value = None
+
+        def session_factory():
+            yield db
+
+        checkpointer = MySQLCheckpointer(session_factory)
+        checkpoint = self._checkpoint("hello")
+        checkpointer.put({"configurable": {"thread_id": "training_1_1"}}, checkpoint, {}, {})
+        db.query.reset_mock()
+
+        assert checkpointer.get({"configurable": {"thread_id": "training_1_1"}}) is checkpoint
+        assert checkpointer.get({"configurable": {"thread_id": "training_1_1", "version": 1}}) is checkpoint
+        db.query.assert_not_called()
+        # 最新版本只是指向版本缓存项，同一检查点只缓存、计量一次
+        assert list(checkpointer._cache) == ["thread:training_1_1:v1"]
+        assert checkpointer._cache_bytes == checkpointer._cache_sizes["thread:training_1_1:v1"]
+
+    def test_put_writes_does_not_replace_cached_checkpoint(self):
+        db = Mock()
+        db.query.return_value.filter.return_value.order_by.return_value.first.return_value = None
+
+        def session_factory():
+            yield db
+
+        checkpointer = MySQLCheckpointer(session_factory)
+        checkpoint = self._checkpoint("hello")
+        checkpointer.put({"configurable": {"thread_id": "training_1_1"}}, checkpoint, {}, {})
+        checkpointer.put_writes({"configurable": {"thread_id": "training_1_1"}}, [("messages", [])], "task-1")
+
+        assert db.add.call_count == 2
+        assert checkpointer.get({"configurable": {"thread_id": "training_1_1"}}) is checkpoint
+        assert list(checkpointer._cache) == ["thread:training_1_1:v1"]
+
+    def _versioned_db(self, latest_version: int):
+        """按版本查询返回对应记录，按最新版本查询返回 latest_version 的记录"""
+        def record(version):
+            return Mock(version=version, checkpoint_data=self._checkpoint(f"v{version}"))
+
+        db = Mock()
+        by_version = Mock()
+        by_version.first.side_effect = lambda: record(3)
+        by_version.order_by.return_value.first.side_effect = lambda: record(latest_version)
+        db.query.return_value.filter.return_value = by_version
+
+        def session_factory():
+            yield db
+
+        return db, session_factory
+
+    def test_reading_old_version_does_not_become_latest(self):
+        db, session_factory = self._versioned_db(latest_version=10)
+        checkpointer = MySQLCheckpointer(session_factory)
+
+        old = checkpointer.get({"configurable": {"thread_id": "t", "version": 3}})
+        latest = checkpointer.get({"configurable": {"thread_id": "t"}})
+
+        assert old["channel_values"]["messages"][0].content == "v3"
+        assert latest["channel_values"]["messages"][0].content == "v10"
+        # 最新检查点按真实版本号缓存，再次读取不查库
+        db.query.reset_mock()
+        assert checkpointer.get({"configurable": {"thread_id": "t"}}) is latest
+        db.query.assert_not_called()
+        assert "thread:t:v10" in checkpointer._cache
+
+    def test_evicting_latest_entry_drops_alias(self):
+        db, session_factory = self._versioned_db(latest_version=1)
+        checkpointer = MySQLCheckpointer(session_factory, cache_size=1)
+        checkpointer._put_to_cache("t", self._checkpoint("hello"), 1, latest=True)
+        checkpointer._put_to_cache("other", self._checkpoint("hi"), 1, latest=True)
+
+        assert "t" not in checkpointer._latest_versions
+
+        # 回源后重新缓存并建立指向，之后不再每次查库
+        checkpointer.get({"configurable": {"thread_id": "t"}})
+        db.query.reset_mock()
+        checkpointer.get({"configurable": {"thread_id": "t"}})
+        db.query.assert_not_called()
@@ -7,8 +7,13 @@ from datetime import datetime
 
 from app.services.digital_human_training_service import (
     DigitalHumanTrainingService,
-    TrainingState
+    TrainingState,
+    _merge_dict,
+    _append_bounded,
+    _MESSAGES_MAXLEN,
+    _buffered
 )
+from app.services.intent_cache import IntentCache
 from app.core.models import DigitalHumanTrainingMessage
 from langchain.schema import HumanMessage, SystemMessage
 
@@ -35,6 +40,9 @@ class TestDigitalHumanTrainingService:
         
         repo.create_training_message = Mock(side_effect=create_training_message_side_effect)
         repo.add_training_message = Mock(side_effect=create_training_message_side_effect)  # Add for compatibility
+        repo.create_training_messages_bulk = Mock(
+            side_effect=lambda rows: [create_training_message_side_effect(**row) for row in rows]
+        )
         repo.commit = Mock()
         repo.rollback = Mock()
         return repo
@@ -131,6 +139,7 @@ class TestDigitalHumanTrainingService:
         service = Mock()
         service.store_digital_human_entity = AsyncMock(return_value=True)
         service.store_digital_human_relationship = AsyncMock(return_value=True)
+        service.store_digital_human_knowledge = AsyncMock(return_value=True)
         service.get_digital_human_knowledge_context = Mock(return_value={
             "total_knowledge_points": 5,
             "categories": {
@@ -225,7 +234,8 @@ class TestDigitalHumanTrainingService:
             mode="hybrid",
             entity_limit=5,
             relationship_limit=3,
-            expand_graph=True
+            expand_graph=True,
+            query_embedding=None
         )
 
         # 验证返回结果
@@ -238,10 +248,222 @@ class TestDigitalHumanTrainingService:
         # 验证事件
         assert "events" in result
         events = result["events"]
-        assert any(e["type"] == "node_start" for e in events)
         assert any(e["type"] == "memory_found" for e in events)
         assert any(e["type"] == "node_complete" for e in events)
 
+    @pytest.mark.asyncio
+    async def test_route_entry(self, training_service):
+        assert training_service._route_entry({"current_message": "你好啊"}) == ["classify_and_ask", "memory_search"]
+        assert training_service._route_entry({"current_message": "我在阿里巴巴做后端开发，主要负责交易链路"}) == [
+            "embed_query", "knowledge_draft", "history_summary"
+        ]
+        assert training_service._route_entry({"current_message": "def foo(): return 1"}) == [
+            "embed_query", "knowledge_draft", "history_summary"
+        ]
+        assert training_service._route_entry({"current_message": "我" * 120}) == [
+            "embed_query", "knowledge_draft", "history_summary"
+        ]
+
+    @pytest.mark.asyncio
+    async def test_route_entry_skips_low_signal_messages(self, training_service):
+        assert training_service._route_entry({"current_message": "😂😂！"}) == "question_generation"
+
+        messages = [
+            {"role": "user", "content": "我在杭州工作"},
+            {"role": "assistant", "content": "在杭州做什么工作呢？"},
+            {"role": "user", "content": "我在杭州工作"}
+        ]
+        assert training_service._route_entry(
+            {"current_message": "我在杭州工作", "messages": messages}
+        ) == "question_generation"
+        assert training_service._route_entry(
+            {"current_message": "北京", "messages": messages[:2] + [{"role": "user", "content": "北京"}]}
+        ) == ["classify_and_ask", "memory_search"]
+
+    @pytest.mark.asyncio
+    async def test_summarize_history_folds_older_messages(self, training_service):
+        messages = [
+            {"role": "user" if i % 2 == 0 else "assistant", "content": f"消息{i}"}
+            for i in range(9)
+        ]
+        response = Mock()
+        response.content = "用户在杭州做后端开发"
+        training_service.summary_llm = Mock()
+        training_service.summary_llm.ainvoke = AsyncMock(return_value=response)
+
+        # 窗口外只有 5 条未摘要消息，不调用摘要模型
+        result = await training_service._summarize_history({"messages": messages[:8], "message_count": 8})
+        assert "conversation_summary" not in result
+        training_service.summary_llm.ainvoke.assert_not_called()
+
+        result = await training_service._summarize_history({
+            "messages": messages,
+            "message_count": 9,
+            "conversation_summary": "",
+            "summarized_count": 0
+        })
+        assert result["conversation_summary"] == "用户在杭州做后端开发"
+        assert result["summarized_count"] == 6
+        prompt = training_service.summary_llm.ainvoke.call_args[0][0][0].content
+        assert "消息5" in prompt and "消息6" not in prompt
+
+    @pytest.mark.asyncio
+    async def test_question_generation_sends_summary_and_recent_messages(self, training_service):
+        messages = [
+            {"role": "user" if i % 2 == 0 else "assistant", "content": f"消息{i}"}
+            for i in range(11)
+        ]
+        response = Mock()
+        response.content = "你在杭州待了多久？"
+        training_service.llm = Mock()
+        training_service.llm.ainvoke = AsyncMock(return_value=response)
+
+        await training_service._generate_question({
+            "current_message": "消息10",
+            "messages": messages,
+            "message_count": 11,
+            "conversation_summary": "用户在杭州做后端开发",
+            "summarized_count": 6
+        })
+
+        sent = training_service.llm.ainvoke.call_args[0][0]
+        assert sent[1].content == "对话摘要: 用户在杭州做后端开发"
+        # 摘要之后的 5 条消息原文
+        assert [m.content for m in sent[2:]] == [f"消息{i}" for i in range(6, 11)]
+
+    @pytest.fixture
+    def checkpointed_service(
+        self, mock_training_message_repo, mock_knowledge_extractor, mock_graph_service, mock_hybrid_search_service
+    ):
+        """用假模型驱动真实编译的训练图；检查点写入的记录收集在 records 中"""
+        from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+        from langchain_core.messages import AIMessage
+
+        records = []
+
+        def db_session_factory():
+            session = Mock()
+            query = Mock()
+            query.filter = Mock(return_value=query)
+            query.order_by = Mock(return_value=query)
+            query.first = Mock(return_value=None)
+            session.query = Mock(return_value=query)
+            session.add = Mock(side_effect=records.append)
+            yield session
+
+        def fake_llm(*contents):
+            return GenericFakeChatModel(messages=iter([AIMessage(content=content) for content in contents]))
+
+        mock_hybrid_search_service.embedding_service.agenerate_query_embedding = AsyncMock(return_value=[0.1, 0.2])
+        llm = Mock()
+        llm.ainvoke = AsyncMock(return_value=AIMessage(content="你在阿里巴巴主要做什么项目？"))
+        service = DigitalHumanTrainingService(
+            training_message_repo=mock_training_message_repo,
+            knowledge_extractor=mock_knowledge_extractor,
+            graph_service=mock_graph_service,
+            hybrid_search_service=mock_hybrid_search_service,
+            db_session_factory=db_session_factory,
+            llm=llm,
+            intent_llm=fake_llm('{"intent": "information_sharing", "stage": "exploring"}'),
+            summary_llm=fake_llm("摘要")
+        )
+        return service, records
+
+    @pytest.mark.asyncio
+    async def test_checkpoint_of_full_path_turn_is_json_serializable(self, checkpointed_service):
+        service, records = checkpointed_service
+
+        async for _ in service.process_training_conversation(
+            digital_human_id=1,
+            user_message="我是一名软件工程师，在阿里巴巴工作了五年，主要负责后端开发",
+            user_id=1
+        ):
+            pass
+
+        # 完整流程经过并行汇合边，其屏障通道的状态是集合；写入 JSON 列前必须能被标准 json 编码
+        barrier_records = [
+            record for record in records
+            if any(key.startswith("join:") for key in (record.channel_values or {}))
+        ]
+        assert barrier_records
+        for record in records:
+            json.dumps(record.checkpoint_data)
+            json.dumps(record.channel_values)
+
+        restored = service.checkpointer._deep_deserialize_messages(barrier_records[0].channel_values)
+        assert all(isinstance(value, set) for key, value in restored.items() if key.startswith("join:"))
+
+    @pytest.mark.asyncio
+    async def test_turn_input_resets_previous_memory_results(self, checkpointed_service):
+        service, _ = checkpointed_service
+        inputs = []
+
+        async def relay(state, config, user_msg, outcome):
+            inputs.append(state)
+            yield b"{}"
+
+        # 上一轮的记忆搜索结果随检查点保留；低信号消息不搜索记忆，输入必须清空它，否则问题生成会把旧结果当作相关记忆
+        with patch.object(service, "_relay_graph_events", side_effect=relay):
+            async for _ in service.process_training_conversation(digital_human_id=1, user_message="😂😂！", user_id=1):
+                pass
+
+        assert inputs[0]["memory_search_results"] == {}
+
+    @pytest.mark.asyncio
+    async def test_training_graph_compiled_once(self, training_service):
+        other = DigitalHumanTrainingService(
+            training_message_repo=training_service.training_message_repo,
+            knowledge_extractor=training_service.knowledge_extractor,
+            graph_service=training_service.graph_service,
+            hybrid_search_service=training_service.hybrid_search_service,
+            db_session_factory=Mock()
+        )
+
+        assert other.training_graph.nodes is training_service.training_graph.nodes
+        assert other.training_graph.checkpointer is other.checkpointer
+        assert training_service.training_graph.checkpointer is training_service.checkpointer
+
+    @pytest.mark.asyncio
+    async def test_classify_and_ask_fast_path(self, training_service):
+        response = Mock()
+        response.content = json.dumps({
+            "intent": "greeting",
+            "stage": "initial",
+            "next_question": "你好！最近在忙些什么呢？"
+        }, ensure_ascii=False)
+        training_service.llm = Mock()
+        training_service.llm.bind.return_value.ainvoke = AsyncMock(return_value=response)
+        state = TrainingState(digital_human_id=1, user_id=1, current_message="最近挺忙的", messages=[])
+
+        result = await training_service._classify_and_ask(state)
+
+        assert result["should_extract"] is False
+        assert result["next_question"] == "你好！最近在忙些什么呢？"
+        assert result["messages"][0]["role"] == "assistant"
+        assert training_service._route_after_fast_path({**state, **result}) == "done"
+
+        response.content = json.dumps({"intent": "information_sharing", "stage": "exploring", "next_question": "..."})
+        result = await training_service._classify_and_ask(state)
+
+        assert "next_question" not in result
+        assert training_service._route_after_fast_path({**state, **result}) == "extract"
+
+    @pytest.mark.asyncio
+    async def test_greeting_skips_intent_llm(self, training_service):
+        training_service.llm = Mock()
+        training_service.intent_llm = Mock()
+        state = TrainingState(digital_human_id=1, user_id=1, current_message="你好！", messages=[])
+
+        fast = await training_service._classify_and_ask(state)
+        full = await training_service._recognize_intent(state)
+
+        training_service.llm.bind.assert_not_called()
+        training_service.intent_llm.ainvoke.assert_not_called()
+        assert fast["should_extract"] is False and "next_question" not in fast
+        assert training_service._route_after_fast_path({**state, **fast}) == "generate"
+        assert full["step_results"]["intent_recognition"]["intent"] == "greeting"
+        assert full["conversation_stage"] == "initial"
+
     @pytest.mark.asyncio
     async def test_route_after_search(self, training_service):
         """测试搜索后的路由逻辑"""
@@ -305,7 +527,7 @@ class TestDigitalHumanTrainingService:
         }
         print(f"输入消息: {state['current_message']}")
         
-        result_state = training_service._recognize_intent(state)
+        result_state = await training_service._recognize_intent(state)
         
         print(f"当前步骤: {result_state.get('current_step')}")
         print(f"已完成步骤: {result_state.get('completed_steps')}")
@@ -326,6 +548,69 @@ class TestDigitalHumanTrainingService:
         assert len(result_state.get('thinking_process', [])) >= 2
         print(f"✅ 真实 AI 判断: intent = {intent}, should_extract = {result_state.get('should_extract')}")
     
+    @pytest.mark.asyncio
+    async def test_intent_recognition_cache_hit(self, training_service):
+        training_service.hybrid_search_service.embedding_service = Mock()
+        training_service.hybrid_search_service.embedding_service.agenerate_query_embedding = AsyncMock(
+            return_value=[1.0, 0.0]
+        )
+        training_service.intent_cache = IntentCache()
+        training_service.intent_cache.insert(1, [1.0, 0.0], {"intent": "greeting", "stage": "initial"})
+        training_service.intent_llm = Mock()
+
+        result_state = await training_service._recognize_intent(
+            TrainingState(digital_human_id=1, user_id=1, current_message="最近挺忙的", messages=[])
+        )
+
+        training_service.intent_llm.ainvoke.assert_not_called()
+        intent_result = result_state["step_results"]["intent_recognition"]
+        assert intent_result["intent"] == "greeting"
+        assert intent_result["cache_hit"] is True
+
+    @pytest.mark.asyncio
+    async def test_intent_recognition_reuses_turn_query_embedding(self, training_service):
+        training_service.hybrid_search_service.embedding_service = Mock()
+        training_service.intent_cache = IntentCache()
+        training_service.intent_cache.insert(1, [1.0, 0.0], {"intent": "greeting", "stage": "initial"})
+        training_service.intent_llm = Mock()
+
+        result_state = await training_service._recognize_intent(TrainingState(
+            digital_human_id=1, user_id=1, current_message="最近挺忙的", messages=[], query_embedding=[1.0, 0.0]
+        ))
+
+        training_service.hybrid_search_service.embedding_service.agenerate_query_embedding.assert_not_called()
+        assert result_state["step_results"]["intent_recognition"]["cache_hit"] is True
+
+    @pytest.mark.asyncio
+    async def test_intent_recognition_without_cache_ignores_turn_embedding(self, training_service):
+        training_service.intent_cache = None
+        training_service.intent_llm = Mock()
+        training_service.intent_llm.ainvoke = AsyncMock(return_value=Mock(
+            content='{"intent": "information_sharing", "stage": "exploring"}'
+        ))
+
+        result_state = await training_service._recognize_intent(TrainingState(
+            digital_human_id=1, user_id=1, current_message="最近挺忙的", messages=[], query_embedding=[1.0, 0.0]
+        ))
+
+        assert result_state["step_results"]["intent_recognition"]["intent"] == "information_sharing"
+
+    @pytest.mark.asyncio
+    async def test_intent_recognition_exact_prompt_hit_skips_embedding(self, training_service):
+        training_service.hybrid_search_service.embedding_service = Mock()
+        training_service.intent_cache = IntentCache()
+        state = TrainingState(digital_human_id=1, user_id=1, current_message="最近挺忙的", messages=[])
+        training_service.intent_cache.insert_prompt(
+            training_service._build_intent_prompt(state), {"intent": "greeting", "stage": "initial"}
+        )
+        training_service.intent_llm = Mock()
+
+        result_state = await training_service._recognize_intent(state)
+
+        training_service.hybrid_search_service.embedding_service.agenerate_query_embedding.assert_not_called()
+        training_service.intent_llm.ainvoke.assert_not_called()
+        assert result_state["step_results"]["intent_recognition"]["cache_hit"] is True
+
     @pytest.mark.asyncio
     async def test_intent_recognition_json_error(self, training_service):
         state = TrainingState(
@@ -336,15 +621,28 @@ class TestDigitalHumanTrainingService:
         
         bad_response = Mock()
         bad_response.content = "这不是一个有效的JSON"
-        original_llm = training_service.llm
-        training_service.llm = Mock()
-        training_service.llm.invoke = Mock(return_value=bad_response)
+        original_llm = training_service.intent_llm
+        training_service.intent_llm = Mock()
+        training_service.intent_llm.ainvoke = AsyncMock(return_value=bad_response)
         
         with pytest.raises(ValueError, match="意图识别响应格式错误"):
-            training_service._recognize_intent(state)
+            await training_service._recognize_intent(state)
         
-        training_service.llm = original_llm
+        training_service.intent_llm = original_llm
     
+    @pytest.mark.asyncio
+    async def test_classify_intent_accepts_fenced_json(self, training_service):
+        response = Mock()
+        response.content = '```json\n{"intent": "question_asking", "stage": "exploring"}\n```'
+        original_llm = training_service.intent_llm
+        training_service.intent_llm = Mock()
+        training_service.intent_llm.ainvoke = AsyncMock(return_value=response)
+        state = TrainingState(digital_human_id=1, user_id=1, current_message="你做什么工作？", messages=[])
+
+        assert await training_service._classify_intent(state) == {"intent": "question_asking", "stage": "exploring"}
+
+        training_service.intent_llm = original_llm
+
     @pytest.mark.asyncio
     async def test_embedding_generation_in_extraction(self, training_service, mock_knowledge_extractor, mock_graph_service):
         """测试知识提取时生成embedding_id"""
@@ -362,27 +660,42 @@ class TestDigitalHumanTrainingService:
         # 验证调用了 extract_with_embeddings 而不是 extract
         mock_knowledge_extractor.extract_with_embeddings.assert_called_once_with(
             "我是Python工程师，在测试公司工作",
-            1
+            1,
+            extracted=None
         )
 
         # 验证存储实体时包含了 embedding_id
-        entity_calls = mock_graph_service.store_digital_human_entity.call_args_list
-        assert len(entity_calls) == 2
+        mock_graph_service.store_digital_human_knowledge.assert_awaited_once()
+        _, stored_entities, stored_relationships = mock_graph_service.store_digital_human_knowledge.call_args[0]
+        assert len(stored_entities) == 2
 
         # 检查第一个实体包含 embedding_id
-        first_entity = entity_calls[0][0][1]  # 获取第二个参数（entity）
+        first_entity = stored_entities[0]
         assert "embedding_id" in first_entity
         assert first_entity["embedding_id"] == "entity-embed-123"
 
         # 验证存储关系时包含了 embedding_id
-        rel_calls = mock_graph_service.store_digital_human_relationship.call_args_list
-        assert len(rel_calls) == 1
+        assert len(stored_relationships) == 1
 
         # 检查关系包含 embedding_id
-        first_rel = rel_calls[0][0][1]  # 获取第二个参数（relationship）
+        first_rel = stored_relationships[0]
         assert "embedding_id" in first_rel
         assert first_rel["embedding_id"] == "rel-embed-789"
 
+    @pytest.mark.asyncio
+    async def test_extraction_reuses_parallel_draft(self, training_service, mock_knowledge_extractor):
+        """完整流程中预抽取的结果在路由后直接用于生成向量，不再调用 LLM"""
+        state = {"digital_human_id": 1, "current_message": "我是Python工程师，在测试公司工作"}
+
+        draft = await training_service._draft_knowledge(state)
+        await training_service._extract_knowledge({**state, **draft})
+
+        extracted = mock_knowledge_extractor.extract_with_embeddings.call_args.kwargs["extracted"]
+        assert extracted == draft["draft_knowledge"]
+        # 传入的是副本，回写 embedding_id 不会修改图状态中的预抽取结果
+        assert extracted["entities"][0] is not draft["draft_knowledge"]["entities"][0]
+        mock_knowledge_extractor.extract.assert_awaited_once()
+
     @pytest.mark.asyncio
     async def test_knowledge_extraction_node(self, training_service):
         state = TrainingState(
@@ -408,7 +721,7 @@ class TestDigitalHumanTrainingService:
             conversation_stage="exploring"
         )
         
-        result_state = training_service._generate_question(state)
+        result_state = await training_service._generate_question(state)
         
         assert result_state.get('current_step') == "generating_question"
         assert "question_generation" in result_state.get('completed_steps', [])
@@ -463,6 +776,62 @@ class TestDigitalHumanTrainingService:
         assert "id" in user_msg_event
         print("=====================================\n")
     
+    def test_step_results_reducer_merges_node_deltas(self):
+        merged = _merge_dict({}, {"intent_recognition": {"intent": "greeting"}})
+        merged = _merge_dict(merged, {"context_analysis": {"total_points": 3}})
+
+        assert merged == {
+            "intent_recognition": {"intent": "greeting"},
+            "context_analysis": {"total_points": 3}
+        }
+
+    def test_messages_reducer_keeps_recent_history(self):
+        history = [{"role": "user", "content": str(i)} for i in range(_MESSAGES_MAXLEN)]
+
+        merged = _append_bounded(history, [{"role": "assistant", "content": "new"}])
+
+        assert len(merged) == _MESSAGES_MAXLEN
+        assert merged[0]["content"] == "1"
+        assert merged[-1]["content"] == "new"
+
+    @pytest.mark.asyncio
+    async def test_buffered_relay_preserves_order_and_errors(self):
+        async def source():
+            for i in range(5):
+                yield str(i)
+            raise RuntimeError("图执行失败")
+
+        received = []
+        with pytest.raises(RuntimeError, match="图执行失败"):
+            async for item in _buffered(source(), maxsize=2):
+                received.append(item)
+
+        assert received == ["0", "1", "2", "3", "4"]
+
+    @pytest.mark.asyncio
+    async def test_analyze_context_reuses_prefetched_context(self, training_service, mock_graph_service):
+        prefetched = {"total_knowledge_points": 3, "categories": {"skill": {"count": 3}}, "recent_entities": []}
+        state = TrainingState(digital_human_id=1, should_extract=False, knowledge_context=prefetched)
+
+        result = await training_service._analyze_context(state)
+        assert result["total_knowledge_points"] == 3
+        mock_graph_service.get_digital_human_knowledge_context.assert_not_called()
+
+        state["should_extract"] = True
+        await training_service._analyze_context(state)
+        mock_graph_service.get_digital_human_knowledge_context.assert_called_once_with(1)
+
+    def test_context_prompt_ranks_top_categories(self, training_service):
+        categories = {name: {"count": count} for name, count in [
+            ("hobby", 1), ("skill", 4), ("project", 2), ("profession", 4),
+            ("location", 3), ("education", 2), ("family", 1)
+        ]}
+
+        prompt = training_service._build_context_prompt({"categories": categories})
+
+        assert "已了解的领域: profession(4个), skill(4个), location(3个), education(2个), project(2个)" in prompt
+        assert "hobby" not in prompt
+
     @pytest.mark.asyncio
     async def test_workflow_routing_logic(self, training_service):
         state1 = TrainingState(
@@ -504,6 +873,22 @@ class TestDigitalHumanTrainingService:
             assert len(events) > 0
             assert any(e["type"] == "error" for e in events)
     
+    @pytest.mark.asyncio
+    async def test_no_question_from_stream_does_not_rerun_graph(self, training_service):
+        async def no_question(*args, **kwargs):
+            yield json.dumps({"type": "thinking", "content": "..."})
+
+        with patch.object(training_service, '_relay_graph_events', side_effect=no_question), \
+                patch.object(training_service.training_graph, 'ainvoke', new_callable=AsyncMock) as ainvoke:
+            events = [json.loads(event) async for event in training_service.process_training_conversation(
+                digital_human_id=1,
+                user_message="测试无问题",
+                user_id=1
+            )]
+
+        ainvoke.assert_not_called()
+        assert not any(e["type"] == "assistant_question" for e in events)
+
     @pytest.mark.asyncio
     async def test_error_handling(self, training_service):
         training_service.training_message_repo.create_training_message.side_effect = Exception("数据库连接失败")
@@ -679,12 +1064,21 @@ class TestDigitalHumanTrainingService:
             "events": []
         }
         
-        result_state = training_service._recognize_intent(state)
-        intent = result_state.get('step_results', {}).get('intent_recognition', {}).get('intent', '未知')
-        print(f"AI 识别结果: intent={intent}, should_extract={result_state.get('should_extract')}")
-        
-        result_state = await training_service._extract_knowledge(result_state)
-        print(f"抽取结果: {result_state.get('extracted_knowledge')}")
+        result_state = await training_service._recognize_intent(state)
+        assert result_state['step_results']['intent_recognition']['intent'] == "greeting"
+        assert result_state['should_extract'] is False
+
+        # 不需要提取的轮次，无论是否搜到记忆、已有多少知识点，路由都不会进入 knowledge_extraction
+        for memory_hits, knowledge_points in ((0, 0), (2, 0), (0, 10)):
+            routed = training_service._route_after_search({
+                **state,
+                **result_state,
+                "memory_search_results": {"statistics": {"total_entities": memory_hits}},
+                "total_knowledge_points": knowledge_points
+            })
+            assert routed != "extract"
+        assert training_service._route_after_fast_path({**result_state, "next_question": ""}) == "generate"
+        assert training_service._route_after_fast_path({**result_state, "next_question": "你好呀？"}) == "done"
     
     @pytest.mark.asyncio
     async def test_graph_storage_operations(self, training_service):
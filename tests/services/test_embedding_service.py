@@ -1,6 +1,14 @@
+import asyncio
+import numpy as np
 import pytest
 from unittest.mock import Mock, patch, MagicMock
-from app.services.embedding_service import EmbeddingService
+from app.services.embedding_service import (
+    EmbeddingService,
+    _get_openai_embeddings,
+    _query_embedding_cache,
+    dequantize_embeddings,
+)
+from app.services.embedding_batcher import EmbeddingBatcher
 import json
 
 
@@ -31,6 +39,8 @@ class TestEmbeddingService:
     @pytest.fixture
     def embedding_service(self, mock_chroma_repo, mock_embeddings):
         """创建 EmbeddingService 实例"""
+        _query_embedding_cache.clear()
+        _get_openai_embeddings.cache_clear()
         with patch('app.services.embedding_service.ChromaRepository', return_value=mock_chroma_repo):
             with patch('app.services.embedding_service.OpenAIEmbeddings', return_value=mock_embeddings):
                 service = EmbeddingService()
@@ -141,6 +151,81 @@ class TestEmbeddingService:
         # 验证 ChromaDB 只调用了一次（第二次使用缓存）
         assert mock_chroma_repo.add_documents.call_count == 1
 
+    @pytest.mark.asyncio
+    async def test_embed_knowledge_uses_one_request(self, embedding_service, mock_chroma_repo, mock_embeddings):
+        """测试实体和关系合并为一次 embeddings 请求（带缓存）"""
+        mock_embeddings.embed_documents = Mock(side_effect=lambda texts: [[float(i)] for i in range(len(texts))])
+        entities = [{"name": "Entity1"}, {"name": "Entity2"}]
+        relationships = [{"source": "Entity1", "target": "Entity2", "relation_type": "KNOWS"}]
+
+        entity_results, relationship_results = await embedding_service.embed_knowledge(entities, relationships, 1)
+
+        mock_embeddings.embed_documents.assert_called_once()
+        assert len(mock_embeddings.embed_documents.call_args.args[0]) == 3
+        assert [r["vector"] for r in entity_results + relationship_results] == [[0.0], [1.0], [2.0]]
+        collections = {call.kwargs["collection_name"]: call.kwargs["ids"] for call in mock_chroma_repo.add_documents.call_args_list}
+        assert collections["entity_embeddings"] == [r["embedding_id"] for r in entity_results]
+        assert collections["relationship_embeddings"] == [relationship_results[0]["embedding_id"]]
+
+        # 再次调用全部命中缓存
+        await embedding_service.embed_knowledge(entities, relationships, 1)
+        mock_embeddings.embed_documents.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_entity_cache_is_bounded_lru(self, embedding_service, mock_chroma_repo):
+        """实体向量缓存超出上限时淘汰最久未使用的条目，命中时还原完整结果"""
+        embedding_service.cache_max = 2
+        first = await embedding_service.embed_entity({"name": "A"}, 1)
+        await embedding_service.embed_entity({"name": "B"}, 1)
+        cached = await embedding_service.embed_entity({"name": "A"}, 1)
+        assert (cached["embedding_id"], cached["text"]) == (first["embedding_id"], first["text"])
+        assert cached["vector"] == pytest.approx(first["vector"])
+        await embedding_service.embed_entity({"name": "C"}, 1)
+
+        assert len(embedding_service.cache) == 2
+        await embedding_service.embed_entity({"name": "B"}, 1)
+        assert mock_chroma_repo.add_documents.call_count == 4
+
+    @pytest.mark.asyncio
+    async def test_concurrent_single_embeds_share_one_request(self, embedding_service, mock_embeddings):
+        """开启微批处理时，并发的单条实体、关系、文本块向量化合并为一次请求"""
+        mock_embeddings.embed_documents = Mock(side_effect=lambda texts: [[float(len(t))] for t in texts])
+        embedding_service.query_batcher = EmbeddingBatcher(mock_embeddings, batch_wait_timeout=0.2)
+
+        entity, relationship, chunk = await asyncio.gather(
+            embedding_service.embed_entity({"name": "Entity1"}, 1),
+            embedding_service.embed_relationship({"source": "A", "target": "B", "relation_type": "KNOWS"}, 1),
+            embedding_service.embed_text_chunk("chunk text", 1)
+        )
+
+        mock_embeddings.embed_documents.assert_called_once()
+        assert chunk["vector"] == [float(len("chunk text"))]
+        assert entity["vector"] == [float(len(entity["text"]))]
+
+    @pytest.mark.asyncio
+    async def test_large_batches_are_split_into_ordered_chunks(self, embedding_service, mock_embeddings):
+        """超过两个子批的文本拆分为 128 条一批并发请求，结果按输入顺序拼接"""
+        mock_embeddings.embed_documents = Mock(side_effect=lambda texts: [[float(t)] for t in texts])
+        texts = [str(i) for i in range(300)]
+
+        vectors = await embedding_service._aembed_documents(texts)
+
+        assert vectors == [[float(i)] for i in range(300)]
+        assert sorted(len(call.args[0]) for call in mock_embeddings.embed_documents.call_args_list) == [44, 128, 128]
+
+    @pytest.mark.asyncio
+    async def test_duplicate_texts_in_batch_are_embedded_once(self, embedding_service, mock_chroma_repo, mock_embeddings):
+        """同一批次中文本相同的实体只请求一次向量，仍各自写入一条记录"""
+        mock_embeddings.embed_documents = Mock(side_effect=lambda texts: [[float(i)] for i in range(len(texts))])
+        entities = [{"name": "Same"}, {"name": "Other"}, {"name": "Same"}]
+
+        results = await embedding_service.batch_embed_entities(entities, 1)
+
+        mock_embeddings.embed_documents.assert_called_once()
+        assert len(mock_embeddings.embed_documents.call_args.args[0]) == 2
+        assert [r["vector"] for r in results] == [[0.0], [1.0], [0.0]]
+        assert len(mock_chroma_repo.add_documents.call_args.kwargs["ids"]) == 3
+
     @pytest.mark.asyncio
     async def test_embed_text_chunk_with_metadata(self, embedding_service, mock_chroma_repo):
         """测试文本块向量化（带元数据）"""
@@ -187,4 +272,66 @@ class TestEmbeddingService:
         # 使用正确的文本格式（与 _build_entity_text 方法一致）
         entity_text = "Entity: Shared Entity | Type: Type | Description: Desc"
         assert embedding_service.cache.get(embedding_service._get_cache_key(f"1:{entity_text}")) is not None
-        assert embedding_service.cache.get(embedding_service._get_cache_key(f"2:{entity_text}")) is not None
\ No newline at end of file
+        assert embedding_service.cache.get(embedding_service._get_cache_key(f"2:{entity_text}")) is not None
+
+    @pytest.mark.asyncio
+    async def test_query_embedding_cache_skips_repeated_requests(self, embedding_service, mock_embeddings):
+        """相同查询文本只请求一次向量，批量生成时只为未命中的文本发起请求"""
+        mock_embeddings.embed_documents = Mock(side_effect=lambda texts: [[float(len(t)), 0.0, 0.0] for t in texts])
+
+        assert embedding_service.generate_query_embedding("hello") == [0.1, 0.2, 0.3]
+        assert await embedding_service.agenerate_query_embedding("hello") == pytest.approx([0.1, 0.2, 0.3])
+        mock_embeddings.embed_query.assert_called_once_with("hello")
+
+        vectors = embedding_service.generate_embeddings(["hello", "abc"])
+        assert vectors[0] == pytest.approx([0.1, 0.2, 0.3])
+        assert vectors[1] == [3.0, 0.0, 0.0]
+        mock_embeddings.embed_documents.assert_called_once_with(["abc"])
+
+    def test_generate_embeddings_np_returns_float32_matrix(self, embedding_service, mock_embeddings):
+        """批量向量以连续 float32 矩阵返回，generate_embeddings 保持列表形式"""
+        mock_embeddings.embed_documents = Mock(side_effect=lambda texts: [[float(len(t)), 1.0] for t in texts])
+
+        matrix = embedding_service.generate_embeddings_np(["a", "bb"])
+
+        assert matrix.dtype == np.float32
+        assert matrix.shape == (2, 2)
+        assert matrix.flags["C_CONTIGUOUS"]
+        assert embedding_service.generate_embeddings(["bb", "a"]) == [[2.0, 1.0], [1.0, 1.0]]
+        mock_embeddings.embed_documents.assert_called_once()
+
+    def test_generate_embeddings_int8_round_trips(self, embedding_service, mock_embeddings):
+        """int8 量化后按行缩放系数还原，误差不超过半个量化步长"""
+        vectors = [[0.5, -0.25, 0.125], [0.0, 0.0, 0.0]]
+        mock_embeddings.embed_documents = Mock(return_value=vectors)
+
+        quantized, scale = embedding_service.generate_embeddings_int8(["a", "b"])
+
+        assert quantized.dtype == np.int8
+        assert scale.dtype == np.float32
+        assert quantized[0].tolist() == [127, -64, 32]
+        restored = dequantize_embeddings(quantized, scale)
+        assert np.abs(restored - np.asarray(vectors, dtype=np.float32)).max() <= scale.max() / 2 + 1e-7
+
+    def test_services_share_one_embeddings_client(self, mock_chroma_repo, mock_embeddings):
+        """服务按请求创建时复用同一个 OpenAI Embeddings 客户端及其连接池"""
+        _get_openai_embeddings.cache_clear()
+        with patch('app.services.embedding_service.ChromaRepository', return_value=mock_chroma_repo), \
+                patch('app.services.embedding_service.OpenAIEmbeddings', return_value=mock_embeddings) as embeddings_cls:
+            first, second = EmbeddingService(), EmbeddingService()
+        _get_openai_embeddings.cache_clear()
+
+        assert first.embeddings is second.embeddings
+        embeddings_cls.assert_called_once()
+
+    def test_eager_key_validation_runs_once_per_process(self, mock_chroma_repo, mock_embeddings):
+        """开启预校验时，同一密钥只在首次创建服务时校验"""
+        with patch('app.services.embedding_service.ChromaRepository', return_value=mock_chroma_repo), \
+                patch('app.services.embedding_service.OpenAIEmbeddings', return_value=mock_embeddings), \
+                patch.object(EmbeddingService, '_validated_keys', set()), \
+                patch.object(EmbeddingService, '_validate_openai_api_key') as validate, \
+                patch('app.services.embedding_service.settings.EMBEDDING_EAGER_VALIDATE', True):
+            EmbeddingService()
+            EmbeddingService()
+
+        validate.assert_called_once()
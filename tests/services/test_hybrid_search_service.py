@@ -10,6 +10,7 @@ class TestHybridSearchService:
     def mock_embedding_service(self):
         """Mock EmbeddingService"""
         mock = Mock()
+        mock.agenerate_query_embedding = AsyncMock(return_value=[0.1, 0.2])
         mock.semantic_search = AsyncMock(return_value=[
             {
                 "document": "test doc",
@@ -67,6 +68,11 @@ class TestHybridSearchService:
         for call in calls:
             assert call.kwargs["digital_human_id"] == 123
 
+        # 查询向量只计算一次，两次语义搜索共用
+        mock_embedding_service.agenerate_query_embedding.assert_awaited_once_with("test query")
+        embeddings = [call.kwargs["query_embedding"] for call in calls]
+        assert embeddings[0] is embeddings[1]
+
     @pytest.mark.asyncio
     async def test_search_graph_mode(self, hybrid_search_service):
         """测试纯图搜索模式"""
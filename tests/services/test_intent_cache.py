@@ -0,0 +1,55 @@
+import pytest
+from app.services.intent_cache import IntentCache
+
+
+class TestIntentCache:
+    """IntentCache 单元测试"""
+
+    @pytest.fixture
+    def cache(self):
+        return IntentCache(threshold=0.95, ttl=60, max_entries=2)
+
+    def test_hit_on_similar_embedding(self, cache):
+        cache.insert(1, [1.0, 0.0, 0.0], {"intent": "greeting", "stage": "initial"})
+
+        assert cache.lookup(1, [0.99, 0.05, 0.0]) == {"intent": "greeting", "stage": "initial"}
+
+    def test_miss_below_threshold(self, cache):
+        cache.insert(1, [1.0, 0.0, 0.0], {"intent": "greeting", "stage": "initial"})
+
+        assert cache.lookup(1, [0.5, 0.5, 0.0]) is None
+
+    def test_isolated_per_digital_human(self, cache):
+        cache.insert(1, [1.0, 0.0, 0.0], {"intent": "greeting", "stage": "initial"})
+
+        assert cache.lookup(2, [1.0, 0.0, 0.0]) is None
+
+    def test_expired_entries_are_dropped(self):
+        cache = IntentCache(ttl=0)
+        cache.insert(1, [1.0, 0.0], {"intent": "greeting", "stage": "initial"})
+
+        assert cache.lookup(1, [1.0, 0.0]) is None
+
+    def test_evicts_oldest_beyond_max_entries(self, cache):
+        cache.insert(1, [1.0, 0.0, 0.0], {"intent": "greeting", "stage": "initial"})
+        cache.insert(1, [0.0, 1.0, 0.0], {"intent": "question_asking", "stage": "exploring"})
+        cache.insert(1, [0.0, 0.0, 1.0], {"intent": "other", "stage": "exploring"})
+
+        assert cache.lookup(1, [1.0, 0.0, 0.0]) is None
+        assert cache.lookup(1, [0.0, 0.0, 1.0])["intent"] == "other"
+
+    def test_exact_prompt_hit_and_lru_eviction(self):
+        cache = IntentCache(ttl=60, max_prompts=2)
+        cache.insert_prompt("a", {"intent": "greeting", "stage": "initial"})
+        cache.insert_prompt("b", {"intent": "other", "stage": "exploring"})
+        cache.lookup_prompt("a")
+        cache.insert_prompt("c", {"intent": "other", "stage": "exploring"})
+
+        assert cache.lookup_prompt("a") == {"intent": "greeting", "stage": "initial"}
+        assert cache.lookup_prompt("b") is None
+
+    def test_expired_prompt_is_dropped(self):
+        cache = IntentCache(ttl=0)
+        cache.insert_prompt("a", {"intent": "greeting", "stage": "initial"})
+
+        assert cache.lookup_prompt("a") is None
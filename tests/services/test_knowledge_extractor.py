@@ -687,16 +687,16 @@ class TestKnowledgeExtractorWithEmbeddings:
 
         # Mock EmbeddingService
         mock_embedding_service = Mock()
-        mock_embedding_service.embed_entity = AsyncMock(return_value={
-            "embedding_id": "test-entity-embed-id",
-            "vector": [0.1, 0.2, 0.3],
-            "text": "test entity text"
-        })
-        mock_embedding_service.embed_relationship = AsyncMock(return_value={
-            "embedding_id": "test-rel-embed-id",
-            "vector": [0.4, 0.5, 0.6],
-            "text": "test relationship text"
-        })
+
+        async def mock_embed_knowledge(entities, relationships, dh_id):
+            return (
+                [{"embedding_id": "test-entity-embed-id", "vector": [0.1, 0.2, 0.3], "text": "test entity text"}
+                 for _ in entities],
+                [{"embedding_id": "test-rel-embed-id", "vector": [0.4, 0.5, 0.6], "text": "test relationship text"}
+                 for _ in relationships]
+            )
+
+        mock_embedding_service.embed_knowledge = AsyncMock(side_effect=mock_embed_knowledge)
         mock_embedding_service.embed_text_chunk = AsyncMock(return_value={
             "embedding_id": "test-chunk-embed-id",
             "vector": [0.7, 0.8, 0.9],
@@ -727,14 +727,10 @@ class TestKnowledgeExtractorWithEmbeddings:
             assert "embedding_id" in rel
             logger.info(f"关系 {rel.get('source')} -> {rel.get('target')} - Embedding ID: {rel.get('embedding_id')}")
 
-        # 验证 EmbeddingService 被正确调用
-        assert mock_embedding_service.embed_entity.call_count == len(result["entities"])
-        assert mock_embedding_service.embed_relationship.call_count == len(result["relationships"])
-
-        # 验证 digital_human_id 被传递
-        if mock_embedding_service.embed_entity.call_count > 0:
-            call_args = mock_embedding_service.embed_entity.call_args_list[0]
-            assert call_args[0][1] == digital_human_id  # 第二个参数是 digital_human_id
+        # 验证全部实体和关系合并为一次 EmbeddingService 调用，并传递 digital_human_id
+        mock_embedding_service.embed_knowledge.assert_awaited_once()
+        call_args = mock_embedding_service.embed_knowledge.call_args
+        assert call_args[0][2] == digital_human_id  # 第三个参数是 digital_human_id
 
         logger.info("✅ extract_with_embeddings 基础功能测试完成")
 
@@ -749,24 +745,21 @@ class TestKnowledgeExtractorWithEmbeddings:
         mock_embedding_service = Mock()
         embed_counter = {"count": 0}
 
-        async def mock_embed_entity(entity, dh_id):
+        def mock_embed(prefix, item, dh_id, text):
             embed_counter["count"] += 1
             return {
-                "embedding_id": f"entity-{dh_id}-{embed_counter['count']}",
+                "embedding_id": f"{prefix}-{dh_id}-{embed_counter['count']}",
                 "vector": [0.1 * dh_id],
-                "text": entity.get("name", "")
+                "text": text
             }
 
-        async def mock_embed_relationship(rel, dh_id):
-            embed_counter["count"] += 1
-            return {
-                "embedding_id": f"rel-{dh_id}-{embed_counter['count']}",
-                "vector": [0.2 * dh_id],
-                "text": f"{rel.get('source')} -> {rel.get('target')}"
-            }
+        async def mock_embed_knowledge(entities, relationships, dh_id):
+            return (
+                [mock_embed("entity", entity, dh_id, entity.get("name", "")) for entity in entities],
+                [mock_embed("rel", rel, dh_id, f"{rel.get('source')} -> {rel.get('target')}") for rel in relationships]
+            )
 
-        mock_embedding_service.embed_entity = AsyncMock(side_effect=mock_embed_entity)
-        mock_embedding_service.embed_relationship = AsyncMock(side_effect=mock_embed_relationship)
+        mock_embedding_service.embed_knowledge = AsyncMock(side_effect=mock_embed_knowledge)
         mock_embedding_service.embed_text_chunk = AsyncMock(return_value={
             "embedding_id": "text-embed",
             "vector": [0.5],
@@ -804,8 +797,7 @@ class TestKnowledgeExtractorWithEmbeddings:
 
         # Mock 会抛出异常的 EmbeddingService
         mock_embedding_service = Mock()
-        mock_embedding_service.embed_entity = AsyncMock(side_effect=Exception("Embedding service error"))
-        mock_embedding_service.embed_relationship = AsyncMock(side_effect=Exception("Embedding service error"))
+        mock_embedding_service.embed_knowledge = AsyncMock(side_effect=Exception("Embedding service error"))
         mock_embedding_service.embed_text_chunk = AsyncMock(side_effect=Exception("Embedding service error"))
 
         self.extractor.embedding_service = mock_embedding_service
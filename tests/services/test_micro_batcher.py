@@ -0,0 +1,111 @@
+import asyncio
+import threading
+from unittest.mock import Mock
+
+import pytest
+from app.services.micro_batcher import MicroBatcher
+from app.services.intent_batcher import IntentBatcher
+from app.services.embedding_batcher import EmbeddingBatcher
+
+
+class TestMicroBatcher:
+    """MicroBatcher 及其意图识别、查询向量两个实例的单元测试"""
+
+    @pytest.fixture
+    def batch_fn(self):
+        return Mock(side_effect=lambda items: [item.upper() for item in items])
+
+    def test_concurrent_requests_share_one_deduplicated_batch(self, batch_fn):
+        batcher = MicroBatcher(batch_fn, max_batch_size=8, batch_wait_timeout=0.2)
+
+        futures = [batcher.submit(item) for item in ("a", "b", "a")]
+
+        assert [f.result(timeout=2) for f in futures] == ["A", "B", "A"]
+        batch_fn.assert_called_once_with(["a", "b"])
+
+    def test_splits_at_max_batch_size(self, batch_fn):
+        batcher = MicroBatcher(batch_fn, max_batch_size=2, batch_wait_timeout=0.2)
+
+        futures = [batcher.submit(item) for item in ("a", "b", "c")]
+
+        assert [f.result(timeout=2) for f in futures] == ["A", "B", "C"]
+        assert batch_fn.call_count == 2
+
+    def test_slow_request_does_not_block_later_batches(self):
+        release = threading.Event()
+
+        def batch_fn(items):
+            if "slow" in items:
+                release.wait(timeout=5)
+            return [item.upper() for item in items]
+
+        batcher = MicroBatcher(batch_fn, max_batch_size=1, batch_wait_timeout=0.01)
+
+        slow = batcher.submit("slow")
+        fast = batcher.submit("fast")
+
+        # 第一批仍在途时，第二批已经发出并返回
+        assert fast.result(timeout=2) == "FAST"
+        assert not slow.done()
+        release.set()
+        assert slow.result(timeout=2) == "SLOW"
+
+    def test_item_errors_are_delivered_per_request(self):
+        batcher = MicroBatcher(Mock(return_value=["ok", ValueError("boom")]), max_batch_size=8, batch_wait_timeout=0.2)
+
+        ok, failed = batcher.submit("a"), batcher.submit("b")
+
+        assert ok.result(timeout=2) == "ok"
+        with pytest.raises(ValueError, match="boom"):
+            failed.result(timeout=2)
+
+    def test_batch_error_is_delivered_to_every_waiter(self):
+        batcher = MicroBatcher(
+            Mock(side_effect=ValueError("rate limited")), max_batch_size=8, batch_wait_timeout=0.2
+        )
+
+        futures = [batcher.submit("a"), batcher.submit("b")]
+
+        for future in futures:
+            with pytest.raises(ValueError, match="rate limited"):
+                future.result(timeout=2)
+
+    def test_call_blocks_until_result(self, batch_fn):
+        batcher = MicroBatcher(batch_fn, max_batch_size=8, batch_wait_timeout=0.01)
+        results = []
+
+        threads = [threading.Thread(target=lambda i=i: results.append(batcher.call(i, timeout=2)))
+                   for i in ("x", "y")]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert sorted(results) == ["X", "Y"]
+
+    @pytest.mark.asyncio
+    async def test_async_callers_await_submitted_future(self, batch_fn):
+        batcher = MicroBatcher(batch_fn, max_batch_size=8, batch_wait_timeout=0.05)
+
+        results = await asyncio.gather(*(asyncio.wrap_future(batcher.submit(i)) for i in ("x", "y")))
+
+        assert results == ["X", "Y"]
+        batch_fn.assert_called_once()
+
+    def test_intent_batcher_sends_prompts_through_llm_batch(self):
+        llm = Mock()
+        llm.batch = Mock(side_effect=lambda inputs, return_exceptions: [
+            Mock(content=messages[0].content.upper()) for messages in inputs
+        ])
+        batcher = IntentBatcher(llm, batch_wait_timeout=0.01)
+
+        assert batcher.classify("a", timeout=2).content == "A"
+        assert llm.batch.call_args.kwargs == {"return_exceptions": True}
+
+    def test_embedding_batcher_sends_texts_through_embed_documents(self):
+        embeddings = Mock()
+        embeddings.embed_documents = Mock(side_effect=lambda texts: [[float(len(text))] for text in texts])
+        batcher = EmbeddingBatcher(embeddings, batch_wait_timeout=0.01)
+
+        assert batcher.embed("abc", timeout=2) == [3.0]
+        embeddings.embed_documents.assert_called_once_with(["abc"])